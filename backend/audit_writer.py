@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Async Audit Writer
+
+Append-only audit trail writer running off the request path.
+
+Features:
+- Bounded in-memory queue (requests block only when the writer falls behind)
+- Single background thread owns the hash chain, so ordering is strict
+- Group commit: queued entries are hashed and inserted in one transaction
+- Chain resumes from the last stored hash after a restart
+- commit_with() seals entries into a caller's open transaction, so business
+  rows and their audit rows land in one commit
+- flush() for read-your-writes, close() drains the queue on shutdown
+- Metrics for queue depth and commit latency
+"""
+
+import json
+import time
+import uuid
+import queue
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AuditWriter:
+    """Background writer for audit_logs rows"""
+
+    def __init__(self, get_pool, on_written=None, max_queue=10000, batch_size=200,
+                 flush_interval=0.05, max_retries=3):
+        self.get_pool = get_pool
+        self.on_written = on_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.previous_hash = None       # chain head, guarded by _chain_lock
+        self._chain_loaded = False
+        self._chain_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'written': 0,
+            'batches': 0,
+            'failed': 0,
+            'last_batch_size': 0,
+            'last_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'total_commit_ms': 0.0
+        }
+
+    # -------------------------------------------------
+    # Producer side (request threads)
+    # -------------------------------------------------
+
+    def submit(self, entry):
+        """Queue an audit entry, blocking only if the queue is full"""
+        if self._stopping:
+            raise RuntimeError('Audit writer is shut down')
+        self.start()
+        self.queue.put(entry)
+
+    def commit_with(self, conn, entries):
+        """
+        Insert entries on the caller's connection and commit its open transaction
+        Blocks queued batches only for the duration of that commit
+        """
+        started = time.perf_counter()
+        # Lock order is always database write lock, then _chain_lock
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        with self._chain_lock:
+            self._ensure_chain_head(conn)
+            rows, previous_hash = self._seal_rows(entries, self.previous_hash)
+            self._insert(conn, rows)
+            conn.commit()
+            self.previous_hash = previous_hash
+        self._record(len(rows), (time.perf_counter() - started) * 1000)
+        self._notify(entries)
+
+    def start(self):
+        """Start the writer thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout=5.0):
+        """Wait until every queued entry has been committed"""
+        if self._thread is None:
+            return True
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        """Drain the queue and stop the writer thread"""
+        if self._thread is None or self._stopping:
+            return
+        self._stopping = True
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f'Audit writer did not drain within {timeout}s '
+                         f'({self.queue.qsize()} entries pending)')
+        else:
+            logger.info('Audit writer flushed and stopped')
+
+    def metrics(self):
+        """Queue depth and commit latency"""
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        batches = m.pop('batches')
+        total_ms = m.pop('total_commit_ms')
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'batches': batches,
+            'avg_commit_ms': round(total_ms / batches, 3) if batches else 0.0,
+            **m
+        }
+
+    # -------------------------------------------------
+    # Writer thread
+    # -------------------------------------------------
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            # Collect whatever arrives within the flush window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self.queue.get(timeout=max(remaining, 0)) if remaining > 0
+                                 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if any(entry is _STOP for entry in batch):
+                stop = True
+                batch = [entry for entry in batch if entry is not _STOP]
+                # Drain everything submitted before close()
+                while True:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+            if batch:
+                self._write_batch(batch)
+
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+
+    def _ensure_chain_head(self, conn):
+        """Continue the hash chain from the last stored entry (once, under _chain_lock)"""
+        if self._chain_loaded:
+            return
+        try:
+            row = conn.execute(
+                'SELECT hash FROM audit_logs WHERE hash IS NOT NULL ORDER BY id DESC LIMIT 1'
+            ).fetchone()
+            self.previous_hash = row[0] if row else None
+            self._chain_loaded = True
+        except Exception as e:
+            logger.warning(f'Could not load audit chain head: {e}')
+
+    def _seal(self, entry, previous_hash):
+        """Compute hash and signature for one entry"""
+        hash_string = json.dumps({
+            'shop_id': entry['shop_id'],
+            'user_id': entry['user_id'],
+            'action': entry['action'],
+            'entity_type': entry['entity_type'],
+            'entity_id': entry['entity_id'],
+            'timestamp': entry['timestamp'],
+            'previous_hash': previous_hash
+        }, sort_keys=True)
+        current_hash = hashlib.sha256(hash_string.encode()).hexdigest()
+
+        signature = 'SIG-' + hashlib.md5(
+            f"{entry['session_id']}{entry['action']}{entry['timestamp']}".encode()
+        ).hexdigest()[:16].upper()
+
+        return current_hash, signature
+
+    def _seal_rows(self, entries, previous_hash):
+        """Insert rows for entries chained after previous_hash, returns (rows, new head)"""
+        rows = []
+        for entry in entries:
+            current_hash, signature = self._seal(entry, previous_hash)
+            rows.append((
+                entry['shop_id'], entry['user_id'], entry['session_id'], entry['machine_id'],
+                entry['action'], entry['entity_type'], entry['entity_id'],
+                json.dumps(entry['old_data']) if entry['old_data'] else None,
+                json.dumps(entry['new_data']) if entry['new_data'] else None,
+                entry['notes'], current_hash, previous_hash, signature,
+                entry['ip_address'], entry['user_agent']
+            ))
+            previous_hash = current_hash
+        return rows, previous_hash
+
+    @staticmethod
+    def _insert(conn, rows):
+        conn.executemany('''
+            INSERT INTO audit_logs
+            (shop_id, user_id, session_id, machine_id, action, entity_type, entity_id,
+             old_data, new_data, notes, hash, previous_hash, signature,
+             ip_address, user_agent)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+    def _write_batch(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                with self.get_pool().connection() as conn:
+                    # Take the write lock before _chain_lock, as commit_with() callers hold it
+                    conn.execute('BEGIN IMMEDIATE')
+                    # Chain state only advances after a successful commit
+                    with self._chain_lock:
+                        self._ensure_chain_head(conn)
+                        rows, previous_hash = self._seal_rows(batch, self.previous_hash)
+                        self._insert(conn, rows)
+                        conn.commit()
+                        self.previous_hash = previous_hash
+                break
+            except Exception as e:
+                logger.error(f'Audit batch of {len(batch)} failed (attempt {attempt}): {e}')
+                if attempt == self.max_retries:
+                    with self._metrics_lock:
+                        self._metrics['failed'] += len(batch)
+                    return
+                time.sleep(0.1 * 2 ** attempt)
+
+        self._record(len(rows), (time.perf_counter() - started) * 1000)
+        self._notify(batch)
+
+    def _record(self, count, elapsed_ms):
+        with self._metrics_lock:
+            m = self._metrics
+            m['written'] += count
+            m['batches'] += 1
+            m['last_batch_size'] = count
+            m['last_commit_ms'] = round(elapsed_ms, 3)
+            m['max_commit_ms'] = round(max(m['max_commit_ms'], elapsed_ms), 3)
+            m['total_commit_ms'] += elapsed_ms
+
+    def _notify(self, entries):
+        if self.on_written:
+            for entry in entries:
+                try:
+                    self.on_written(entry)
+                except Exception as e:
+                    logger.error(f'Audit callback error: {e}')
+
+
+def new_entry(shop_id, user_id, action, entity_type=None, entity_id=None, old_data=None,
+              new_data=None, notes='', session_id=None, machine_id=None,
+              ip_address=None, user_agent=''):
+    """Build a queue entry, capturing the event time on the caller's thread"""
+    return {
+        'shop_id': shop_id,
+        'user_id': user_id,
+        'action': action,
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'old_data': old_data,
+        'new_data': new_data,
+        'notes': notes,
+        'session_id': session_id or str(uuid.uuid4()),
+        'machine_id': machine_id,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'timestamp': datetime.now().isoformat()
+    }
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Invoice Throughput Benchmark
+
+Posts invoices to /api/invoices from 1, 8 and 32 concurrent clients against a
+throwaway database and reports invoices per second and latency percentiles,
+for 5-line and 50-line baskets. Then replays every invoice once (a counter
+retrying) and checks that no invoice, item or audit row was added twice.
+
+Usage:
+    python backend/benchmarks/bench_invoice_throughput.py [--invoices 400] [--clients 1,8,32] [--lines 5,50]
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+AUTH = {'Authorization': 'Bearer bench'}
+
+
+def make_invoice(lines):
+    """Build a realistic counter basket"""
+    items = [{
+        'product_id': None,
+        'product_name': f'Item {i}',
+        'quantity': 1.0,
+        'unit_price': 64.0,
+        'total': 64.0
+    } for i in range(lines)]
+    total = 64.0 * lines
+    return {
+        'shop_id': 1,
+        'user_id': 1,
+        'invoice_number': f'BENCH-{uuid.uuid4().hex}',
+        'items': items,
+        'total': total,
+        'payment_mode': 'CASH',
+        'amount_paid': total
+    }
+
+
+def run(clients, invoices, lines, sent):
+    """Run one concurrency level, returns (invoices/sec, latencies, errors)"""
+    per_client = max(1, invoices // clients)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def worker():
+        client = server.app.test_client()
+        local = []
+        invoices = [make_invoice(lines) for _ in range(per_client)]
+        barrier.wait()
+        for invoice in invoices:
+            started = time.perf_counter()
+            response = client.post('/api/invoices', json=invoice, headers=AUTH)
+            local.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                with lock:
+                    errors.append(response.status_code)
+        with lock:
+            latencies.extend(local)
+            sent.extend(invoices)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return (per_client * clients) / elapsed, sorted(latencies), errors
+
+
+def count_rows():
+    with server.get_pool().connection() as conn:
+        return tuple(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                     for table in ('invoices', 'invoice_items', 'audit_logs'))
+
+
+def replay(sent):
+    """Post every invoice again, returns (duplicates acknowledged, rows added)"""
+    before = count_rows()
+    client = server.app.test_client()
+    acknowledged = sum(1 for invoice in sent
+                       if client.post('/api/invoices', json=invoice, headers=AUTH).json.get('duplicate'))
+    after = count_rows()
+    return acknowledged, [b - a for a, b in zip(before, after)]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Invoice throughput benchmark')
+    parser.add_argument('--invoices', type=int, default=400, help='invoices per concurrency level')
+    parser.add_argument('--clients', default='1,8,32', help='comma separated client counts')
+    parser.add_argument('--lines', default='5,50', help='comma separated line items per invoice')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server.app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        server.init_db()
+
+        sent = []
+        print(f"{'lines':>6} {'clients':>8} {'inv/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for lines in [int(n) for n in args.lines.split(',')]:
+            for clients in [int(c) for c in args.clients.split(',')]:
+                rate, latencies, errors = run(clients, args.invoices, lines, sent)
+                print(f"{lines:>6} {clients:>8} {rate:>10.1f} "
+                      f"{percentile(latencies, 0.50) * 1000:>9.2f} "
+                      f"{percentile(latencies, 0.95) * 1000:>9.2f} "
+                      f"{percentile(latencies, 0.99) * 1000:>9.2f} "
+                      f"{len(errors):>7}")
+
+        acknowledged, added = replay(sent)
+        print(f"\nreplayed {len(sent)} invoices: {acknowledged} reported as duplicates, "
+              f"rows added (invoices, items, audit): {added}")
+
+        server.audit.writer.close()
+        server.get_pool().close_all()
+
+
+if __name__ == '__main__':
+    main()
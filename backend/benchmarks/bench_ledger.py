@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Customer Ledger Benchmark
+
+Builds a throwaway shop with a year of udhar history (debits and payments
+spread over every customer) through ledger.record(), closes each month with a
+checkpoint, then times:
+
+  statements:  month-end statements for every customer, one call
+               (ledger.statements) vs one full-history query per customer
+  as-of:       balance on a random date for random customers
+  verify:      recompute every running balance, customer balance and checkpoint
+
+Usage:
+    python backend/benchmarks/bench_ledger.py [--customers 5000] [--months 12] [--entries 6]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+import ledger  # noqa: E402
+
+SHOP_ID = 1
+YEAR = 2025
+
+
+def month_end(month):
+    return f'{YEAR + month // 12}-{month % 12 + 1:02d}-28'
+
+
+def seed(conn, customers, months, per_month, rng):
+    """Customers plus `per_month` entries each per month, written month by month"""
+    conn.executemany('INSERT INTO customers (shop_id, name, phone) VALUES (?, ?, ?)',
+                     [(SHOP_ID, f'Customer {i}', f'98{i:08d}') for i in range(customers)])
+    ids = [row[0] for row in conn.execute('SELECT id FROM customers WHERE shop_id = ?', (SHOP_ID,))]
+    conn.commit()
+
+    started = time.perf_counter()
+    total = 0
+    for month in range(months):
+        year, number = YEAR + month // 12, month % 12 + 1
+        entries = sorted(({
+            'customer_id': customer_id,
+            'shop_id': SHOP_ID,
+            'transaction_type': 'debit' if rng.random() < 0.6 else 'credit',
+            'amount': round(rng.uniform(20, 600), 2),
+            'notes': 'bench',
+            'created_at': f'{year}-{number:02d}-{rng.randint(1, 28):02d} {rng.randint(6, 21):02d}:'
+                          f'{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}'
+        } for customer_id in ids for _ in range(per_month)), key=lambda entry: entry['created_at'])
+        for i in range(0, len(entries), 1000):
+            ledger.record(conn, entries[i:i + 1000])
+        conn.commit()
+        total += len(entries)
+        ledger.checkpoint(conn, SHOP_ID, month_end(month))
+        conn.commit()
+    return ids, total, time.perf_counter() - started
+
+
+def naive_statements(conn, ids, start, end):
+    """What the old ledger API allows: each customer's full history, summed in Python"""
+    result = []
+    for customer_id in ids:
+        rows = conn.execute('''
+            SELECT transaction_type, amount, created_at FROM customer_ledger
+            WHERE customer_id = ? AND created_at <= ? ORDER BY created_at, id
+        ''', (customer_id, end)).fetchall()
+        balance = sum(ledger.delta(t, a) for t, a, created_at in rows if created_at < start)
+        closing = balance + sum(ledger.delta(t, a) for t, a, created_at in rows if created_at >= start)
+        result.append((customer_id, round(closing, 2)))
+    return result
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Customer ledger benchmark')
+    parser.add_argument('--customers', type=int, default=5000)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--entries', type=int, default=6, help='entries per customer per month')
+    parser.add_argument('--lookups', type=int, default=2000, help='balance-as-of queries')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server.app.config['DATABASE'] = os.path.join(tmp, 'bench.db')
+        server.init_db()
+
+        with server.get_pool().connection() as conn:
+            ids, total, elapsed = seed(conn, args.customers, args.months, args.entries, rng)
+            print(f"seeded {total:,} entries for {len(ids):,} customers over {args.months} months "
+                  f"in {elapsed:.1f}s ({total / elapsed:,.0f} entries/s via ledger.record)")
+
+            last = args.months - 1
+            start = f'{YEAR + last // 12}-{last % 12 + 1:02d}-01'
+            end = month_end(last)
+
+            statements, fast = timed(ledger.statements, conn, SHOP_ID, start, end)
+            naive, slow = timed(naive_statements, conn, ids, ledger.timestamp(start),
+                                ledger.timestamp(end, end_of_day=True))
+            closing = {s['customer_id']: s['closing_balance'] for s in statements}
+            mismatches = sum(1 for customer_id, balance in naive if abs(closing.get(customer_id, 0.0) - balance) >= 0.005)
+            print(f"\nmonth-end statements ({start} .. {end}):")
+            print(f"  ledger.statements      {fast:8.2f}s  {len(statements):,} statements")
+            print(f"  full history per cust  {slow:8.2f}s  ({mismatches} closing balances differ)")
+
+            latencies = []
+            for _ in range(args.lookups):
+                month = rng.randrange(args.months)
+                day = f'{YEAR + month // 12}-{month % 12 + 1:02d}-{rng.randint(1, 28):02d}'
+                started = time.perf_counter()
+                ledger.balance_as_of(conn, rng.choice(ids), day)
+                latencies.append((time.perf_counter() - started) * 1000)
+            latencies.sort()
+            print(f"\nbalance as of a date: p50 {latencies[len(latencies) // 2]:.3f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)]:.3f} ms")
+
+            report, elapsed = timed(ledger.verify, conn, SHOP_ID)
+            print(f"\nverify: {report['entries_checked']:,} entries, {report['customers']:,} customers in "
+                  f"{elapsed:.2f}s, ok={report['ok']}")
+
+        server.audit.writer.close()
+        server.get_pool().close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Reading Broadcast
+
+Same coalescing fan-out as the desktop app (flask_app/hardware/broadcast.py):
+- Each subscriber owns a mailbox holding only the newest value per topic
+- Publishing overwrites the slot and never blocks, so a slow tablet skips
+  intermediate weights instead of building a backlog
+- New subscribers are seeded with the current value of every topic
+
+Keep in step with flask_app/hardware/broadcast.py: change both copies together.
+"""
+
+import threading
+from typing import Dict, Optional
+
+
+class Subscription:
+    """One client's mailbox: newest payload per topic"""
+
+    __slots__ = ('pending', 'lock', 'event', 'closed', 'delivered', 'coalesced')
+
+    def __init__(self):
+        self.pending: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.closed = False
+        self.delivered = 0
+        self.coalesced = 0
+
+    def offer(self, topic: str, payload: dict):
+        """Replace the pending value for topic (never blocks the publisher)"""
+        with self.lock:
+            if topic in self.pending:
+                self.coalesced += 1
+            self.pending[topic] = payload
+        self.event.set()
+
+    def take(self, timeout: Optional[float] = None) -> Dict[str, dict]:
+        """Wait for pending values, returns {topic: payload} ({} on timeout/close)"""
+        if not self.event.wait(timeout) or self.closed:
+            return {}
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            self.event.clear()
+        self.delivered += len(batch)
+        return batch
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
+
+class TopicHub:
+    """Fan-out of one shop's device readings to all its subscribers"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._latest: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, topic: str, payload: dict) -> int:
+        """Deliver payload to every subscriber's mailbox, returns how many"""
+        with self._lock:
+            self._latest[topic] = payload
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(topic, payload)
+        return len(subscribers)
+
+    def subscribe(self, replay_latest: bool = True) -> Subscription:
+        """New mailbox, seeded with the current values so screens render immediately"""
+        subscription = Subscription()
+        with self._lock:
+            if replay_latest:
+                for topic, payload in self._latest.items():
+                    subscription.offer(topic, payload)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        subscription.close()
+
+    def status(self) -> dict:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'topics': sorted(self._latest),
+            'delivered': sum(s.delivered for s in subscribers),
+            'coalesced': sum(s.coalesced for s in subscribers)
+        }
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Product Catalog Cache
+
+Per-shop in-memory copy of the active products, so barcode scans and
+catalog lists at the counter do not touch SQLite.
+
+Features:
+- Loaded once per shop: dicts keyed by barcode and SKU, plus the list
+  presorted in keyset order (created_at DESC, id DESC) for paged reads
+- Product create/update/delete drop the shop's copy; the next read reloads
+- Sales patch stock_qty in place (no reload per sale)
+- Each change bumps the shop's version, used as the HTTP ETag
+- A load that races an invalidation is not kept, so a stale copy is never served
+
+The cache lives in the server process: run a single server process
+(the threading SocketIO server) per database.
+"""
+
+import bisect
+import uuid
+import threading
+
+
+class ShopCatalog:
+    """Immutable snapshot of one shop's active products (stock_qty excepted)"""
+
+    def __init__(self, products, version):
+        self.version = version
+        self.products = products
+        # Ascending (created_at, id) for bisect; products are newest first
+        self._keys = [(p['created_at'], p['id']) for p in reversed(products)]
+        self.by_id = {p['id']: p for p in products}
+        self.by_barcode = {}
+        self.by_sku = {}
+        for product in sorted(products, key=lambda p: p['id']):
+            if product.get('barcode'):
+                self.by_barcode.setdefault(product['barcode'], product)
+            if product.get('sku'):
+                self.by_sku.setdefault(product['sku'], product)
+
+    def lookup(self, code):
+        """Active product by barcode, else by SKU"""
+        return self.by_barcode.get(code) or self.by_sku.get(code)
+
+    def page(self, after, limit):
+        """Same rows as the keyset query for after=(created_at, id)"""
+        start = len(self.products) - bisect.bisect_left(self._keys, after) if after else 0
+        return self.products[start:start + limit]
+
+
+class CatalogCache:
+    """Catalog snapshots per shop, loaded on first use"""
+
+    def __init__(self, get_pool):
+        self.get_pool = get_pool
+        self._epoch = uuid.uuid4().hex[:8]      # ETags never repeat across restarts
+        self._shops = {}
+        self._generations = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.stats = {'hits': 0, 'loads': 0, 'invalidations': 0, 'stock_updates': 0}
+
+    def get(self, shop_id):
+        shop_id = int(shop_id)
+        catalog = self._shops.get(shop_id)
+        if catalog is not None:
+            self.stats['hits'] += 1
+            return catalog
+
+        with self._load_lock:
+            catalog = self._shops.get(shop_id)
+            if catalog is not None:
+                return catalog
+            generation = self._generations.get(shop_id, 0)
+            with self.get_pool().connection() as conn:
+                rows = conn.execute('''
+                    SELECT * FROM products WHERE shop_id = ? AND active = 1
+                    ORDER BY created_at DESC, id DESC
+                ''', (shop_id,)).fetchall()
+            with self._lock:
+                self._version += 1
+                catalog = ShopCatalog([dict(row) for row in rows], self._version)
+                if self._generations.get(shop_id, 0) == generation:
+                    self._shops[shop_id] = catalog
+                self.stats['loads'] += 1
+            return catalog
+
+    def etag(self, shop_id, catalog):
+        return f'{self._epoch}-{int(shop_id)}-{catalog.version}'
+
+    def invalidate(self, shop_id):
+        """Drop a shop's copy after its products changed"""
+        shop_id = int(shop_id)
+        with self._lock:
+            self._generations[shop_id] = self._generations.get(shop_id, 0) + 1
+            self._shops.pop(shop_id, None)
+            self.stats['invalidations'] += 1
+
+    def update_stock(self, shop_id, changes):
+        """Apply committed stock changes ({'id', 'stock_qty'}) to the cached products"""
+        shop_id = int(shop_id)
+        if not changes:
+            return
+        with self._lock:
+            catalog = self._shops.get(shop_id)
+            if catalog is None:
+                # A load in progress may have read the old stock: do not keep it
+                self._generations[shop_id] = self._generations.get(shop_id, 0) + 1
+                return
+            for change in changes:
+                product = catalog.by_id.get(change['id'])
+                if product is not None:
+                    product['stock_qty'] = change['stock_qty']
+            self._version += 1
+            catalog.version = self._version
+            self.stats['stock_updates'] += 1
+
+    def status(self):
+        return {'shops': len(self._shops), **self.stats}
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - SQLite Connection Pool
+
+Bounded pool of SQLite connections shared by the Flask/SocketIO worker threads.
+
+Features:
+- One connection per request (checked out on first use, returned on teardown)
+- Bounded size with blocking checkout and timeout
+- WAL journal mode + busy_timeout so readers never block the writer
+- Per-connection prepared statement cache (sqlite3 cached_statements)
+- Health check on checkout, broken connections are replaced transparently
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe bounded pool of SQLite connections"""
+
+    def __init__(self, database, max_size=16, timeout=10.0, busy_timeout_ms=5000,
+                 statement_cache_size=256, health_check_interval=30.0):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.statement_cache_size = statement_cache_size
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []          # [(connection, last_used)]
+        self._size = 0           # connections currently open (idle + checked out)
+        self._closed = False
+
+        self.stats = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'replaced': 0
+        }
+
+    def _connect(self):
+        """Open and configure a new connection"""
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        self.stats['created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        """Ping connections that have been idle longer than the check interval"""
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self, timeout=None):
+        """Check out a connection, blocking until one is free"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        with self._available:
+            while True:
+                if self._closed:
+                    raise PoolTimeout('Connection pool is closed')
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection available after {timeout:.1f}s '
+                        f'(pool size {self.max_size})'
+                    )
+                self.stats['waits'] += 1
+                self._available.wait(remaining)
+
+            self.stats['checkouts'] += 1
+
+        # Connect / ping outside the lock
+        try:
+            if conn is None:
+                return self._connect()
+
+            if not self._is_healthy(conn, last_used):
+                logger.warning('Replacing unhealthy database connection')
+                self.stats['replaced'] += 1
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                return self._connect()
+
+            return conn
+        except Exception:
+            self._discard()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if conn is None:
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            self._discard()
+            return
+
+        with self._available:
+            if self._closed:
+                conn.close()
+                self._size -= 1
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def _discard(self):
+        """Forget a connection slot that could not be used"""
+        with self._available:
+            self._size -= 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager for code running outside a Flask request"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._available:
+            self._closed = True
+            for conn, _ in self._idle:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                self._size -= 1
+            self._idle.clear()
+            self._available.notify_all()
+
+    def status(self):
+        """Pool status for health endpoints"""
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'open': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                **self.stats
+            }
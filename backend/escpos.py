@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - ESC/POS Receipt Rendering
+
+Turns invoice data into the byte stream a thermal receipt printer expects.
+
+Features:
+- 58 mm (32 columns) and 80 mm (48 columns) layouts
+- Cached templates: each shop's header and the fixed footer/cut are
+  encoded once; per receipt only the item and total lines are formatted
+- Plain ESC/POS commands (init, align, bold, double size, feed and cut),
+  no driver needed
+- Text the printer's code page cannot show is replaced, never fails a job
+"""
+
+# ESC/POS commands
+INIT = b'\x1b@'
+ALIGN_LEFT = b'\x1ba\x00'
+ALIGN_CENTER = b'\x1ba\x01'
+BOLD_ON = b'\x1bE\x01'
+BOLD_OFF = b'\x1bE\x00'
+DOUBLE_ON = b'\x1d!\x11'
+DOUBLE_OFF = b'\x1d!\x00'
+FEED_AND_CUT = b'\n\n\n\x1dVB\x00'
+
+LINE_WIDTHS = {58: 32, 80: 48}
+
+
+class ReceiptRenderer:
+    """Renders invoice dicts (the /api/invoices payload) to ESC/POS bytes"""
+
+    def __init__(self, columns=32, encoding='cp437', footer='Thank you! Visit again'):
+        self.columns = columns
+        self.encoding = encoding
+        self._headers = {}
+
+        # Fixed parts of every receipt
+        self.rule = b'-' * columns + b'\n'
+        self.trailer = b''.join([self.rule, ALIGN_CENTER, self.text(footer), b'\n', ALIGN_LEFT, FEED_AND_CUT])
+        name = columns - 21
+        self.item_format = f'{{:<{name}.{name}}}{{:>6}}{{:>7}}{{:>8}}\n'
+        self.item_heading = self.text(self.item_format.format('Item', 'Qty', 'Rate', 'Amt'))
+
+    def text(self, value):
+        # ₹ is not in printer code pages
+        return str(value).replace('₹', 'Rs ').encode(self.encoding, errors='replace')
+
+    def header(self, shop):
+        """Shop block, encoded once per shop (shop dict: id, name, address, phone, gst_number)"""
+        key = (shop.get('id'), shop.get('name'), shop.get('address'), shop.get('phone'), shop.get('gst_number'))
+        cached = self._headers.get(key)
+        if cached is None:
+            lines = [INIT, ALIGN_CENTER, BOLD_ON, DOUBLE_ON, self.text(shop.get('name') or 'MilkRecord'), b'\n',
+                     DOUBLE_OFF, BOLD_OFF]
+            if shop.get('address'):
+                lines += [self.text(shop['address'][:self.columns]), b'\n']
+            contact = '  '.join(part for part in (
+                f"Ph: {shop['phone']}" if shop.get('phone') else '',
+                f"GST: {shop['gst_number']}" if shop.get('gst_number') else '') if part)
+            if contact:
+                lines += [self.text(contact[:self.columns]), b'\n']
+            lines += [ALIGN_LEFT, self.rule]
+            cached = self._headers[key] = b''.join(lines)
+        return cached
+
+    def _row(self, left, right):
+        """Label on the left, value right-aligned (wraps if both do not fit)"""
+        gap = self.columns - len(left) - len(right)
+        return self.text(f'{left}{" " * gap}{right}\n' if gap > 0 else f'{left}\n{right:>{self.columns}}\n')
+
+    def _amount(self, label, value):
+        return self._row(label, f'{value:.2f}')
+
+    def render(self, invoice, shop=None):
+        """Full receipt for one invoice"""
+        created = str(invoice.get('created_at') or invoice.get('timestamp') or '')[:16].replace('T', ' ')
+        customer = f"Customer: {invoice.get('customer_name') or 'Walking Customer'}"
+
+        parts = [
+            self.header(shop or {}),
+            self._row(f"Invoice: {invoice['invoice_number']}", created),
+            self.text(customer[:self.columns] + '\n'),
+            self.rule,
+            self.item_heading
+        ]
+        for item in invoice.get('items') or []:
+            parts.append(self.text(self.item_format.format(
+                item.get('product_name') or item.get('name') or '',
+                f"{float(item.get('quantity') or 0):g}",
+                f"{float(item.get('unit_price') or 0):.2f}",
+                f"{float(item.get('total') or 0):.2f}")))
+        parts.append(self.rule)
+
+        total = float(invoice.get('total') or 0)
+        subtotal = float(invoice.get('subtotal', total) or 0)
+        discount = float(invoice.get('discount') or 0)
+        tax = float(invoice.get('tax') or 0)
+        if discount or tax or subtotal != total:
+            parts.append(self._amount('Subtotal', subtotal))
+            if discount:
+                parts.append(self._amount('Discount', -discount))
+            if tax:
+                parts.append(self._amount('Tax', tax))
+        parts += [BOLD_ON, self._amount('TOTAL', total), BOLD_OFF]
+
+        if invoice.get('amount_paid') is not None:
+            parts.append(self._amount(f"Paid ({invoice.get('payment_mode') or 'CASH'})", float(invoice['amount_paid'])))
+        if float(invoice.get('change') or 0):
+            parts.append(self._amount('Change', float(invoice['change'])))
+
+        parts.append(self.trailer)
+        return b''.join(parts)
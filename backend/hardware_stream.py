@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Hardware Reading Stream
+
+Socket.IO namespace (/hardware) pushing stable scale weights and analyzer
+FAT/SNF readings to every screen of a shop as they arrive.
+
+Features:
+- Readings come from a hardware bridge: 'publish' events on the namespace
+  or POST /api/hardware/readings; both need a bearer token (the socket
+  bridge connects with auth: {token} or an Authorization header)
+- Mailbox and fan-out are broadcast.py, one hub per shop
+- Per-client mailbox holding only the newest value per topic (coalescing)
+- One pump task per client with ack-based flow control: the next batch is
+  sent when the client acknowledges the previous one (or after ack_timeout),
+  so a slow tablet gets the newest value instead of a backlog
+- New clients receive the shop's current values on connect
+
+Client:
+    socket = io('/hardware', {query: {shop_id: 1}})
+    socket.on('readings', (batch, ack) => { render(batch.weight, batch.analyzer); ack() })
+
+Bridge:
+    bridge = io('/hardware', {auth: {token}, query: {shop_id: 1}})
+    bridge.emit('publish', {shop_id: 1, topic: 'weight', reading})
+"""
+
+import logging
+import threading
+
+from flask import request
+from flask_socketio import Namespace
+
+from broadcast import TopicHub
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ('weight', 'analyzer')
+NAMESPACE = '/hardware'
+
+
+class ShopReadingHubs:
+    """Per-shop fan-out of device readings: one broadcast.TopicHub per shop"""
+
+    def __init__(self):
+        self._shops = {}           # shop_id -> TopicHub
+        self._lock = threading.Lock()
+
+    def _hub(self, shop_id):
+        with self._lock:
+            hub = self._shops.get(shop_id)
+            if hub is None:
+                hub = self._shops[shop_id] = TopicHub()
+            return hub
+
+    def publish(self, shop_id, topic, payload):
+        """Deliver payload to every subscriber of the shop, returns how many"""
+        return self._hub(shop_id).publish(topic, payload)
+
+    def subscribe(self, shop_id):
+        """New mailbox seeded with the shop's current values"""
+        return self._hub(shop_id).subscribe()
+
+    def unsubscribe(self, shop_id, subscription):
+        self._hub(shop_id).unsubscribe(subscription)
+
+    def status(self):
+        with self._lock:
+            hubs = list(self._shops.values())
+        shops = [hub.status() for hub in hubs]
+        return {
+            'subscribers': sum(shop['subscribers'] for shop in shops),
+            'delivered': sum(shop['delivered'] for shop in shops),
+            'coalesced': sum(shop['coalesced'] for shop in shops)
+        }
+
+
+class HardwareNamespace(Namespace):
+    """Socket.IO namespace streaming readings to connected screens"""
+
+    def __init__(self, socketio, hub, namespace=NAMESPACE, ack_timeout=2.0, keepalive=15.0):
+        super().__init__(namespace)
+        self.socketio = socketio
+        self.hub = hub
+        self.ack_timeout = ack_timeout
+        self.keepalive = keepalive
+        self._clients = {}         # sid -> (shop_id, subscription)
+        self._publishers = set()   # sids that connected with a bearer token
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _token(auth):
+        """Bearer token from the handshake: auth {token} or an Authorization header"""
+        if isinstance(auth, dict) and auth.get('token'):
+            return auth['token']
+        header = request.headers.get('Authorization') or ''
+        return header[7:] if header.startswith('Bearer ') else None
+
+    def on_connect(self, auth=None):
+        shop_id = str(request.args.get('shop_id') or (auth if isinstance(auth, dict) else {}).get('shop_id') or 1)
+        subscription = self.hub.subscribe(shop_id)
+        with self._lock:
+            self._clients[request.sid] = (shop_id, subscription)
+            if self._token(auth):
+                self._publishers.add(request.sid)
+        self.socketio.start_background_task(self._pump, request.sid, subscription)
+        logger.info(f'📡 Hardware stream client connected (shop {shop_id})')
+
+    def on_disconnect(self, *args):
+        with self._lock:
+            client = self._clients.pop(request.sid, None)
+            self._publishers.discard(request.sid)
+        if client:
+            self.hub.unsubscribe(*client)
+
+    def on_publish(self, data):
+        """Reading from a hardware bridge: {shop_id, topic, reading} (bridge must connect with a token)"""
+        with self._lock:
+            authorized = request.sid in self._publishers
+        if not authorized:
+            return {'success': False, 'error': 'Authorization required'}
+        if not isinstance(data, dict):
+            return {'success': False, 'error': 'reading must be an object'}
+        topic = data.get('topic')
+        if topic not in TOPICS:
+            return {'success': False, 'error': f'topic must be one of {TOPICS}'}
+        delivered = self.hub.publish(str(data.get('shop_id', 1)), topic, data.get('reading') or {})
+        return {'success': True, 'subscribers': delivered}
+
+    def _pump(self, sid, subscription):
+        """Send coalesced batches to one client, one batch in flight at a time"""
+        acked = threading.Event()
+        while not subscription.closed:
+            batch = subscription.take(self.keepalive)
+            if not batch:
+                continue
+            acked.clear()
+            try:
+                self.socketio.emit('readings', batch, to=sid, namespace=self.namespace,
+                                  callback=lambda *args: acked.set())
+            except Exception as e:
+                logger.warning(f'Hardware stream emit failed for {sid}: {e}')
+                break
+            # Newer readings keep coalescing in the mailbox while we wait
+            acked.wait(self.ack_timeout)
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Customer Ledger (udhar)
+
+Running balance per customer, what it was on any date, statements and checks.
+
+Sign convention: balance is what the customer owes the shop.
+- debit:  credit sale / udhar given, balance goes up
+- credit: payment received, balance goes down
+
+Features:
+- Every ledger row stores the running balance after it, in (created_at, id)
+  order; customers.balance is the latest one
+- Entries backdated by offline sync re-run only that customer's later rows
+- Checkpoints: closing balance per customer at a date (month-end close);
+  "balance as of X" and statements start from the nearest checkpoint and
+  scan only the entries after it; an entry at or before a checkpoint drops it
+- Month-end statements for a whole shop in two queries
+- Verifier recomputes every running balance, customers.balance and every
+  checkpoint in one ordered pass, and can repair them
+- One-off migration of entries written under the earlier sign convention
+"""
+
+from datetime import date, datetime, timezone
+
+DEBIT = 'debit'
+CREDIT = 'credit'
+TRANSACTION_TYPES = (DEBIT, CREDIT)
+
+SIGNED_AMOUNT = "CASE transaction_type WHEN 'debit' THEN amount ELSE -amount END"
+
+# Balances are money: compare and store to the paisa
+TOLERANCE = 0.005
+
+
+def delta(transaction_type, amount):
+    """Change to the balance for one entry"""
+    return amount if transaction_type == DEBIT else -amount
+
+
+class TimestampError(ValueError):
+    """Date or time that is not ISO 8601 (maps to HTTP 400)"""
+
+
+def timestamp(value=None, end_of_day=False):
+    """
+    Ledger time as stored by SQLite CURRENT_TIMESTAMP ('YYYY-MM-DD HH:MM:SS', UTC)
+    Times with an offset are converted to UTC, times without one are taken as UTC.
+    A bare date means the start of that day, or its last second with end_of_day
+    """
+    if not value:
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    text = str(value).strip()
+    try:
+        try:
+            day = date.fromisoformat(text)
+            return f"{day.isoformat()} {'23:59:59' if end_of_day else '00:00:00'}"
+        except ValueError:
+            pass
+        moment = datetime.fromisoformat(text[:-1] + '+00:00' if text.endswith('Z') else text)
+    except ValueError:
+        raise TimestampError(f"Invalid date or time '{value}'")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# =====================================================
+# WRITES
+# =====================================================
+
+def record(conn, entries):
+    """
+    Append ledger entries inside the caller's transaction
+    entries: dicts with customer_id, shop_id, transaction_type, amount and optional
+    reference_type, reference_id, notes, created_at, client_id
+    Returns {customer_id: balance after the entries}
+    """
+    if not entries:
+        return {}
+
+    net = {}
+    for entry in entries:
+        entry['created_at'] = timestamp(entry.get('created_at'))
+        net[entry['customer_id']] = net.get(entry['customer_id'], 0.0) + delta(entry['transaction_type'], entry['amount'])
+    customer_ids = list(net)
+    placeholders = ','.join('?' * len(customer_ids))
+
+    # Write first, so the balances read below cannot change under us
+    conn.executemany('UPDATE customers SET balance = ROUND(balance + ?, 2) WHERE id = ?',
+                     [(amount, customer_id) for customer_id, amount in net.items()])
+    balances = {row[0]: row[1] or 0.0 for row in conn.execute(
+        f'SELECT id, balance FROM customers WHERE id IN ({placeholders})', customer_ids).fetchall()}
+    latest = dict(conn.execute(f'''
+        SELECT customer_id, MAX(created_at) FROM customer_ledger
+        WHERE customer_id IN ({placeholders}) GROUP BY customer_id
+    ''', customer_ids).fetchall())
+
+    running = {customer_id: balances.get(customer_id, 0.0) - amount for customer_id, amount in net.items()}
+    backdated = {}
+    earliest = {}
+    rows = []
+    for entry in entries:
+        customer_id = entry['customer_id']
+        running[customer_id] += delta(entry['transaction_type'], entry['amount'])
+        earliest[customer_id] = min(entry['created_at'], earliest.get(customer_id, entry['created_at']))
+        if latest.get(customer_id) and entry['created_at'] < latest[customer_id]:
+            backdated[customer_id] = min(entry['created_at'], backdated.get(customer_id, entry['created_at']))
+        latest[customer_id] = max(entry['created_at'], latest.get(customer_id) or '')
+        rows.append((
+            customer_id, entry['shop_id'], entry['transaction_type'], entry['amount'],
+            round(running[customer_id], 2), entry.get('reference_type'), entry.get('reference_id'),
+            entry.get('notes', ''), entry['created_at'], entry.get('client_id')
+        ))
+
+    conn.executemany('''
+        INSERT INTO customer_ledger
+        (customer_id, shop_id, transaction_type, amount, balance,
+         reference_type, reference_id, notes, created_at, client_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    # Checkpoints at or after a new entry (same-day close, offline entries on a closed day) are stale
+    conn.executemany('DELETE FROM ledger_checkpoints WHERE customer_id = ? AND as_of >= ?', earliest.items())
+    for customer_id, since in backdated.items():
+        rebalance(conn, customer_id, since)
+
+    return {customer_id: round(balances.get(customer_id, running[customer_id]), 2) for customer_id in customer_ids}
+
+
+def credit_sale(customer_id, shop_id, invoice_id, invoice_number, total, amount_paid, created_at=None):
+    """Entries for a credit sale: debit the unpaid amount (credit an overpayment)"""
+    due = round(total - (amount_paid or 0), 2)
+    if not due:
+        return []
+    return [{
+        'customer_id': customer_id,
+        'shop_id': shop_id,
+        'transaction_type': DEBIT if due > 0 else CREDIT,
+        'amount': abs(due),
+        'reference_type': 'invoice',
+        'reference_id': invoice_id,
+        'notes': f'Invoice {invoice_number}',
+        'created_at': created_at
+    }]
+
+
+def rebalance(conn, customer_id, since):
+    """Recompute running balances from `since` on and drop checkpoints it invalidates"""
+    row = conn.execute('''
+        SELECT balance FROM customer_ledger WHERE customer_id = ? AND created_at < ?
+        ORDER BY created_at DESC, id DESC LIMIT 1
+    ''', (customer_id, since)).fetchone()
+    conn.execute(f'''
+        UPDATE customer_ledger SET balance = tail.running
+        FROM (
+            SELECT id, ROUND(? + SUM({SIGNED_AMOUNT}) OVER (ORDER BY created_at, id), 2) AS running
+            FROM customer_ledger WHERE customer_id = ? AND created_at >= ?
+        ) AS tail
+        WHERE customer_ledger.id = tail.id
+    ''', (row[0] if row else 0.0, customer_id, since))
+    conn.execute('DELETE FROM ledger_checkpoints WHERE customer_id = ? AND as_of >= ?', (customer_id, since))
+
+
+def checkpoint(conn, shop_id, as_of):
+    """Store every customer's closing balance at as_of (month-end close), returns the count"""
+    as_of = timestamp(as_of, end_of_day=True)
+    balances = [(shop_id, customer_id, as_of, balance)
+                for customer_id, (balance, _) in _balances(conn, shop_id, as_of, inclusive=True).items()]
+    conn.executemany('''
+        INSERT INTO ledger_checkpoints (shop_id, customer_id, as_of, balance) VALUES (?, ?, ?, ?)
+        ON CONFLICT(customer_id, as_of) DO UPDATE SET balance = excluded.balance
+    ''', balances)
+    return len(balances)
+
+
+# =====================================================
+# READS
+# =====================================================
+
+def _nearest_checkpoint(conn, customer_id, bound, inclusive):
+    op = '<=' if inclusive else '<'
+    row = conn.execute(f'''
+        SELECT as_of, balance FROM ledger_checkpoints
+        WHERE customer_id = ? AND as_of {op} ? ORDER BY as_of DESC LIMIT 1
+    ''', (customer_id, bound)).fetchone()
+    return (row[0], row[1]) if row else ('', 0.0)
+
+
+def balance_as_of(conn, customer_id, as_of):
+    """Balance including every entry up to as_of"""
+    as_of = timestamp(as_of, end_of_day=True)
+    start, balance = _nearest_checkpoint(conn, customer_id, as_of, inclusive=True)
+    row = conn.execute(f'''
+        SELECT COALESCE(SUM({SIGNED_AMOUNT}), 0), COUNT(*) FROM customer_ledger
+        WHERE customer_id = ? AND created_at > ? AND created_at <= ?
+    ''', (customer_id, start, as_of)).fetchone()
+    return {
+        'customer_id': customer_id,
+        'as_of': as_of,
+        'balance': round(balance + row[0], 2),
+        'checkpoint': start or None,
+        'entries_scanned': row[1]
+    }
+
+
+def statement(conn, customer_id, start, end):
+    """Opening balance, entries with running balance, closing balance for [start, end]"""
+    start, end = timestamp(start), timestamp(end, end_of_day=True)
+    since, opening = _nearest_checkpoint(conn, customer_id, start, inclusive=False)
+    rows = conn.execute(f'''
+        SELECT id, transaction_type, amount, {SIGNED_AMOUNT} AS delta, reference_type, reference_id,
+               notes, created_at
+        FROM customer_ledger
+        WHERE customer_id = ? AND created_at > ? AND created_at <= ?
+        ORDER BY created_at, id
+    ''', (customer_id, since, end)).fetchall()
+
+    entries = []
+    for row in rows:
+        if row['created_at'] < start:
+            opening += row['delta']
+        else:
+            entries.append(dict(row))
+    return _statement(customer_id, start, end, opening, entries)
+
+
+def statements(conn, shop_id, start, end):
+    """Statements for every customer with a balance or activity in [start, end]"""
+    start, end = timestamp(start), timestamp(end, end_of_day=True)
+    openings = _balances(conn, shop_id, start, inclusive=False)
+
+    activity = {}
+    for row in conn.execute(f'''
+        SELECT id, customer_id, transaction_type, amount, {SIGNED_AMOUNT} AS delta,
+               reference_type, reference_id, notes, created_at
+        FROM customer_ledger
+        WHERE shop_id = ? AND created_at >= ? AND created_at <= ?
+        ORDER BY customer_id, created_at, id
+    ''', (shop_id, start, end)):
+        activity.setdefault(row['customer_id'], []).append(dict(row))
+
+    result = []
+    for customer_id, (opening, name) in openings.items():
+        entries = activity.get(customer_id, [])
+        if entries or abs(opening) >= TOLERANCE:
+            result.append(dict(_statement(customer_id, start, end, opening, entries), name=name))
+    return result
+
+
+def _statement(customer_id, start, end, opening, entries):
+    balance = opening
+    debits = credits = 0.0
+    for entry in entries:
+        balance += entry.pop('delta')
+        entry['balance'] = round(balance, 2)
+        if entry['transaction_type'] == DEBIT:
+            debits += entry['amount']
+        else:
+            credits += entry['amount']
+    return {
+        'customer_id': customer_id,
+        'from': start,
+        'to': end,
+        'opening_balance': round(opening, 2),
+        'debits': round(debits, 2),
+        'credits': round(credits, 2),
+        'closing_balance': round(balance, 2),
+        'entries': entries
+    }
+
+
+def _balances(conn, shop_id, bound, inclusive):
+    """{customer_id: (balance, name)} at bound for every customer of a shop"""
+    op = '<=' if inclusive else '<'
+    rows = conn.execute(f'''
+        WITH latest AS (
+            SELECT customer_id, MAX(as_of) AS as_of FROM ledger_checkpoints
+            WHERE shop_id = ? AND as_of {op} ? GROUP BY customer_id
+        )
+        SELECT c.id, c.name, COALESCE(k.balance, 0) + COALESCE((
+            SELECT SUM({SIGNED_AMOUNT}) FROM customer_ledger l
+            WHERE l.customer_id = c.id AND l.created_at > COALESCE(k.as_of, '') AND l.created_at {op} ?
+        ), 0)
+        FROM customers c
+        LEFT JOIN latest ON latest.customer_id = c.id
+        LEFT JOIN ledger_checkpoints k ON k.customer_id = c.id AND k.as_of = latest.as_of
+        WHERE c.shop_id = ?
+    ''', (shop_id, bound, bound, shop_id)).fetchall()
+    return {row[0]: (round(row[2], 2), row[1]) for row in rows}
+
+
+# =====================================================
+# VERIFY
+# =====================================================
+
+def verify(conn, shop_id=None, fix=False, sample=20):
+    """
+    Recompute every running balance in one ordered pass and compare with what is stored:
+    ledger rows, customers.balance and checkpoints. fix=True rewrites the wrong ones.
+    """
+    shop_filter = ' WHERE shop_id = ?' if shop_id is not None else ''
+    params = (shop_id,) if shop_id is not None else ()
+
+    checkpoints = {}
+    for row in conn.execute(f'SELECT id, customer_id, as_of, balance FROM ledger_checkpoints{shop_filter} '
+                            f'ORDER BY customer_id, as_of', params):
+        checkpoints.setdefault(row[1], []).append(row)
+    stored = dict(conn.execute(f'SELECT id, balance FROM customers{shop_filter}', params).fetchall())
+
+    bad_rows, bad_checkpoints, totals = [], [], {}
+    pending = []                      # checkpoints of the current customer not yet passed
+
+    def close_checkpoints(upto, balance):
+        while pending and (upto is None or pending[0][2] < upto):
+            cp = pending.pop(0)
+            if abs(cp[3] - balance) >= TOLERANCE:
+                bad_checkpoints.append((cp[0], cp[1], cp[2], cp[3], round(balance, 2)))
+
+    customer, running, checked = None, 0.0, 0
+    for entry_id, customer_id, created_at, balance, change in conn.execute(f'''
+        SELECT id, customer_id, created_at, balance, {SIGNED_AMOUNT}
+        FROM customer_ledger{shop_filter}
+        ORDER BY customer_id, created_at, id
+    ''', params):
+        if customer_id != customer:
+            if customer is not None:
+                close_checkpoints(None, running)
+                totals[customer] = running
+            customer, running = customer_id, 0.0
+            pending = list(checkpoints.pop(customer_id, []))
+        close_checkpoints(created_at, running)
+        running += change
+        checked += 1
+        if balance is None or abs(balance - running) >= TOLERANCE:
+            bad_rows.append((entry_id, customer_id, balance, round(running, 2)))
+    if customer is not None:
+        close_checkpoints(None, running)
+        totals[customer] = running
+
+    # Checkpoints of customers without entries must be zero
+    for rows in checkpoints.values():
+        pending = list(rows)
+        close_checkpoints(None, 0.0)
+
+    bad_customers = [(customer_id, balance, round(totals.get(customer_id, 0.0), 2))
+                     for customer_id, balance in stored.items()
+                     if abs((balance or 0.0) - totals.get(customer_id, 0.0)) >= TOLERANCE]
+
+    if fix:
+        conn.executemany('UPDATE customer_ledger SET balance = ? WHERE id = ?',
+                         [(expected, entry_id) for entry_id, _, _, expected in bad_rows])
+        conn.executemany('UPDATE customers SET balance = ? WHERE id = ?',
+                         [(expected, customer_id) for customer_id, _, expected in bad_customers])
+        conn.executemany('UPDATE ledger_checkpoints SET balance = ? WHERE id = ?',
+                         [(expected, cp_id) for cp_id, _, _, _, expected in bad_checkpoints])
+
+    return {
+        'ok': not (bad_rows or bad_customers or bad_checkpoints),
+        'customers': len(stored),
+        'entries_checked': checked,
+        'wrong_entry_balances': len(bad_rows),
+        'wrong_customer_balances': len(bad_customers),
+        'wrong_checkpoints': len(bad_checkpoints),
+        'fixed': fix,
+        'samples': {
+            'entries': [dict(zip(('id', 'customer_id', 'stored', 'expected'), row)) for row in bad_rows[:sample]],
+            'customers': [dict(zip(('customer_id', 'stored', 'expected'), row)) for row in bad_customers[:sample]],
+            'checkpoints': [dict(zip(('id', 'customer_id', 'as_of', 'stored', 'expected'), row))
+                            for row in bad_checkpoints[:sample]]
+        }
+    }
+
+
+# =====================================================
+# MIGRATION
+# =====================================================
+
+SIGN_MIGRATION = 'ledger_sign_convention'
+
+
+def migrate_sign_convention(conn):
+    """
+    One-off rewrite of the entries written before this sign convention (runs once per database)
+    - Manual entries (add_ledger_entry, synced ledger rows) used credit for udhar given:
+      debit and credit are swapped, so each still moves the balance the same way
+    - Credit sales were a debit of the invoice total while the balance moved by the
+      unpaid part: they now carry the unpaid part (a credit for an overpayment)
+    customers.balance is unchanged; running balances are recomputed from the entries.
+    Returns the number of entries rewritten
+    """
+    if not conn.execute('INSERT OR IGNORE INTO schema_migrations (name) VALUES (?)', (SIGN_MIGRATION,)).rowcount:
+        return 0
+
+    due = 'ROUND(i.total - COALESCE(i.amount_paid, 0), 2)'
+    invoices = conn.execute(f'''
+        UPDATE customer_ledger
+        SET transaction_type = CASE WHEN {due} < 0 THEN 'credit' ELSE 'debit' END, amount = ABS({due})
+        FROM invoices i
+        WHERE customer_ledger.reference_type = 'invoice' AND i.id = customer_ledger.reference_id
+    ''').rowcount
+    manual = conn.execute('''
+        UPDATE customer_ledger SET transaction_type = CASE transaction_type WHEN 'credit' THEN 'debit' ELSE 'credit' END
+        WHERE reference_type IS NOT 'invoice'
+    ''').rowcount
+
+    conn.execute(f'''
+        UPDATE customer_ledger SET balance = t.running
+        FROM (
+            SELECT id, ROUND(SUM({SIGNED_AMOUNT}) OVER (PARTITION BY customer_id ORDER BY created_at, id), 2) AS running
+            FROM customer_ledger
+        ) AS t
+        WHERE customer_ledger.id = t.id
+    ''')
+    return invoices + manual
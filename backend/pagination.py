@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Keyset Pagination
+
+Same list contract as the desktop/cloud apps (flask_app/core/pagination.py):
+- Lists are ordered newest first by (created_at, id)
+- ?after=<created_at>,<id>&limit=N returns the next page plus next_cursor
+- Exports stream every page as NDJSON, one pooled connection per page
+"""
+
+import json
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_PAGE_SIZE = 500
+
+
+class PageError(ValueError):
+    """Malformed after/limit parameters (maps to HTTP 400)"""
+
+
+def parse_cursor(after):
+    """Parse 'created_at,id' into (created_at, int id); created_at must be an ISO timestamp"""
+    if not after:
+        return None
+    created_at, sep, record_id = after.rpartition(',')
+    try:
+        if not sep or not created_at or ',' in created_at:
+            raise ValueError
+        datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        return created_at, int(record_id)
+    except ValueError:
+        raise PageError(f"Invalid cursor '{after}', expected <created_at>,<id>")
+
+
+def make_cursor(row):
+    """Cursor pointing after this row"""
+    if not row or row.get('created_at') is None:
+        return None
+    return f"{row['created_at']},{row['id']}"
+
+
+def page_args(args):
+    """Read after/limit from request args"""
+    after = parse_cursor(args.get('after'))
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise PageError(f"Invalid limit '{args.get('limit')}'")
+    if limit < 1:
+        raise PageError('limit must be positive')
+    return after, min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_clause(after, alias=''):
+    """SQL fragment + params continuing after the cursor"""
+    if not after:
+        return '', ()
+    prefix = f'{alias}.' if alias else ''
+    return (f' AND ({prefix}created_at < ? OR ({prefix}created_at = ? AND {prefix}id < ?))',
+            (after[0], after[0], after[1]))
+
+
+def page_body(key, rows, limit):
+    """JSON body with next_cursor"""
+    return {
+        'success': True,
+        key: rows,
+        'count': len(rows),
+        'next_cursor': make_cursor(rows[-1]) if len(rows) >= limit else None
+    }
+
+
+def ndjson_lines(fetch_page, page_size=EXPORT_PAGE_SIZE):
+    """Yield every row as an NDJSON line, one page in memory at a time"""
+    after = None
+    while True:
+        rows = fetch_page(after, page_size)
+        for row in rows:
+            yield json.dumps(row, default=str) + '\n'
+        cursor = make_cursor(rows[-1]) if rows else None
+        if len(rows) < page_size or cursor is None:
+            return
+        after = parse_cursor(cursor)
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Receipt Print Spooler
+
+Persistent print queue behind /api/hardware/print, so checkout never waits
+on the printer.
+
+Features:
+- Jobs live in the print_jobs table: they survive restarts and printer outages
+- One job per (shop_id, invoice_number); a repeated request returns the
+  existing job instead of printing twice (reprint=True queues it again)
+- Background worker claims due jobs, renders them (escpos.ReceiptRenderer)
+  and sends the batch to the printer in a single write
+- Failed sends are retried with exponential backoff, then marked failed
+- Claims are leases: a job left 'printing' by a crashed worker is picked
+  up again once its lease expires (at-least-once printing)
+- Printers: file/pty/USB line printer (file:///dev/usb/lp0), serial
+  (serial:///dev/ttyUSB0?baudrate=9600, needs pyserial) and network
+  raw port (tcp://192.168.1.50:9100)
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+JOB_COLUMNS = ('id, shop_id, invoice_number, status, attempts, last_error, '
+               'created_at, updated_at, printed_at')
+
+
+# =====================================================
+# PRINTERS
+# =====================================================
+
+class FilePrinter:
+    """Anything that can be opened for writing: USB line printer node, pty, plain file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def write(self, data):
+        if self._file is None:
+            self._file = open(self.path, 'ab', buffering=0)
+        self._file.write(data)
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            finally:
+                self._file = None
+
+
+class SerialPrinter:
+    """Receipt printer on a serial port"""
+
+    def __init__(self, port, baudrate=9600, timeout=5.0):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self._serial = None
+
+    def write(self, data):
+        if self._serial is None:
+            import serial   # optional dependency, only needed for serial printers
+            self._serial = serial.Serial(self.port, self.baudrate, write_timeout=self.timeout)
+        self._serial.write(data)
+        self._serial.flush()
+
+    def close(self):
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            finally:
+                self._serial = None
+
+
+class NetworkPrinter:
+    """Network printer on its raw port (JetDirect, usually 9100)"""
+
+    def __init__(self, host, port=9100, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._socket = None
+
+    def write(self, data):
+        if self._socket is None:
+            self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._socket.sendall(data)
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            finally:
+                self._socket = None
+
+
+class UnavailablePrinter:
+    """Stand-in for a PRINTER_URI that could not be opened: every send fails with the reason"""
+
+    def __init__(self, uri, error):
+        self.uri = uri
+        self.error = error
+
+    def write(self, data):
+        raise OSError(f'Printer {self.uri!r} unavailable: {self.error}')
+
+    def close(self):
+        pass
+
+
+def _is_file_path(uri):
+    """Absolute path, or a Windows drive path (C:\\... parses as scheme 'c')"""
+    scheme = urlsplit(uri).scheme
+    return os.path.isabs(uri) or (len(scheme) == 1 and scheme.isalpha())
+
+
+def open_printer(uri):
+    """
+    Printer for a PRINTER_URI (a bare path is treated as file://)
+    A URI that cannot be used gives a printer whose sends fail, so its jobs end up
+    failed instead of the server not starting
+    """
+    try:
+        if _is_file_path(uri):
+            return FilePrinter(uri)
+
+        parts = urlsplit(uri)
+        options = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        timeout = float(options.get('timeout', 5.0))
+
+        if parts.scheme in ('', 'file'):
+            return FilePrinter(parts.path or uri)
+        if parts.scheme == 'serial':
+            return SerialPrinter(parts.path, int(options.get('baudrate', 9600)), timeout)
+        if parts.scheme == 'tcp':
+            return NetworkPrinter(parts.hostname, parts.port or 9100, timeout)
+        raise ValueError(f'Unsupported printer URI: {uri}')
+    except Exception as e:
+        logger.error(f'🖨️  Cannot use printer {uri!r}: {e}')
+        return UnavailablePrinter(uri, e)
+
+
+# =====================================================
+# SPOOLER
+# =====================================================
+
+class PrintSpooler:
+    """Print job queue stored in SQLite, drained by one background thread"""
+
+    def __init__(self, get_pool, printer, renderer, on_done=None, batch_size=20,
+                 poll_interval=1.0, max_attempts=5, retry_delay=1.0, max_retry_delay=60.0,
+                 lease_seconds=60.0):
+        self.get_pool = get_pool
+        self.printer = printer
+        self.renderer = renderer
+        self.on_done = on_done
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lease_seconds = lease_seconds
+
+        self._shops = {}                # shop_id -> shops row, owned by the worker
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'printed': 0,
+            'failed': 0,
+            'retries': 0,
+            'duplicates': 0,
+            'batches': 0,
+            'bytes_sent': 0,
+            'last_batch_size': 0,
+            'last_send_ms': 0.0,
+            'max_send_ms': 0.0,
+            'printer_error': None
+        }
+
+    # -------------------------------------------------
+    # Request side
+    # -------------------------------------------------
+
+    def submit(self, conn, shop_id, invoice, reprint=False):
+        """
+        Queue a receipt on the caller's connection
+        invoice: the invoice payload, or just {'invoice_number': ...} to print the stored invoice
+        Returns (job, duplicate)
+        """
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO print_jobs
+            (shop_id, invoice_number, payload, status, attempts, next_attempt_at)
+            VALUES (?, ?, ?, 'queued', 0, 0)
+        ''', (shop_id, invoice['invoice_number'], json.dumps(invoice)))
+        duplicate = cursor.rowcount == 0
+
+        if duplicate and reprint:
+            conn.execute('''
+                UPDATE print_jobs
+                SET status = 'queued', attempts = 0, last_error = NULL, next_attempt_at = 0,
+                    payload = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE shop_id = ? AND invoice_number = ? AND status IN ('printed', 'failed')
+            ''', (json.dumps(invoice), shop_id, invoice['invoice_number']))
+        conn.commit()
+
+        if duplicate:
+            with self._metrics_lock:
+                self._metrics['duplicates'] += 1
+        self.start()
+        self._wake.set()
+        return self.find(conn, shop_id, invoice['invoice_number']), duplicate
+
+    def get_job(self, conn, job_id):
+        row = conn.execute(f'SELECT {JOB_COLUMNS} FROM print_jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, conn, shop_id, invoice_number):
+        row = conn.execute(f'SELECT {JOB_COLUMNS} FROM print_jobs WHERE shop_id = ? AND invoice_number = ?',
+                           (shop_id, invoice_number)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, conn, shop_id, status=None, limit=50):
+        query = f'SELECT {JOB_COLUMNS} FROM print_jobs WHERE shop_id = ?'
+        params = [shop_id]
+        if status:
+            query += ' AND status = ?'
+            params.append(status)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    def start(self):
+        """Start the worker thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._stopping:
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='print-spooler', daemon=True)
+                self._thread.start()
+
+    def close(self, timeout=10.0):
+        """Finish the batch in hand and stop; queued jobs stay in the table"""
+        if self._thread is None or self._stopping:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+        self.printer.close()
+        logger.info('Print spooler stopped')
+
+    def printer_status(self):
+        """'error' while the last send failed, else 'ready'"""
+        with self._metrics_lock:
+            return 'error' if self._metrics['printer_error'] else 'ready'
+
+    def metrics(self):
+        """Queue depth and printer throughput"""
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        try:
+            with self.get_pool().connection() as conn:
+                counts = dict(conn.execute(
+                    "SELECT status, COUNT(*) FROM print_jobs WHERE status IN ('queued', 'printing') GROUP BY status"
+                ).fetchall())
+        except Exception:
+            counts = {}
+        return {
+            'queued': counts.get('queued', 0),
+            'printing': counts.get('printing', 0),
+            'worker_running': self._thread is not None and self._thread.is_alive(),
+            **m
+        }
+
+    # -------------------------------------------------
+    # Worker thread
+    # -------------------------------------------------
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                jobs = self._claim()
+            except Exception as e:
+                logger.error(f'Print spooler claim failed: {e}')
+                jobs = []
+
+            if jobs:
+                self._print_batch(jobs)
+                continue
+
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim(self):
+        """Lease due jobs: queued ones and 'printing' ones whose worker died"""
+        now = time.time()
+        with self.get_pool().connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute('''
+                    SELECT id, shop_id, invoice_number, payload, attempts FROM print_jobs
+                    WHERE status IN ('queued', 'printing') AND next_attempt_at <= ?
+                    ORDER BY id LIMIT ?
+                ''', (now, self.batch_size)).fetchall()
+                conn.executemany('''
+                    UPDATE print_jobs SET status = 'printing', attempts = attempts + 1,
+                        next_attempt_at = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', [(now + self.lease_seconds, row['id']) for row in rows])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return [dict(row, attempts=row['attempts'] + 1) for row in rows]
+
+    def _render(self, conn, job):
+        invoice = json.loads(job['payload'])
+        if not invoice.get('items'):
+            invoice = self._load_invoice(conn, job['shop_id'], job['invoice_number'])
+        shop = self._shops.get(job['shop_id'])
+        if shop is None:
+            row = conn.execute('SELECT * FROM shops WHERE id = ?', (job['shop_id'],)).fetchone()
+            shop = self._shops[job['shop_id']] = dict(row) if row else {}
+        return self.renderer.render(invoice, shop)
+
+    @staticmethod
+    def _load_invoice(conn, shop_id, invoice_number):
+        row = conn.execute('SELECT * FROM invoices WHERE shop_id = ? AND invoice_number = ?',
+                           (shop_id, invoice_number)).fetchone()
+        if row is None:
+            raise LookupError(f'Invoice {invoice_number} not found')
+        invoice = dict(row)
+        invoice['items'] = [dict(item) for item in conn.execute(
+            'SELECT product_name, quantity, unit_price, total FROM invoice_items WHERE invoice_id = ? ORDER BY id',
+            (invoice['id'],)).fetchall()]
+        return invoice
+
+    def _print_batch(self, jobs):
+        rendered, failed = [], []
+        with self.get_pool().connection() as conn:
+            for job in jobs:
+                try:
+                    rendered.append((job, self._render(conn, job)))
+                except Exception as e:
+                    failed.append((job, f'render: {e}'))
+
+        if rendered:
+            data = b''.join(receipt for _, receipt in rendered)
+            started = time.perf_counter()
+            try:
+                self.printer.write(data)
+                error = None
+            except Exception as e:
+                self.printer.close()   # reconnect on the next attempt
+                error = str(e)
+                failed += [(job, error) for job, _ in rendered]
+                rendered = []
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            with self._metrics_lock:
+                m = self._metrics
+                m['printer_error'] = error
+                if error is None:
+                    m['batches'] += 1
+                    m['bytes_sent'] += len(data)
+                    m['last_batch_size'] = len(rendered)
+                    m['last_send_ms'] = round(elapsed_ms, 3)
+                    m['max_send_ms'] = round(max(m['max_send_ms'], elapsed_ms), 3)
+
+        self._finish(rendered, failed)
+
+    def _finish(self, printed, failed):
+        retries, done = [], []
+        for job, error in failed:
+            if job['attempts'] >= self.max_attempts:
+                retries.append(('failed', error, 0, job['id']))
+                done.append(dict(job, status='failed', last_error=error))
+            else:
+                delay = min(self.retry_delay * 2 ** (job['attempts'] - 1), self.max_retry_delay)
+                retries.append(('queued', error, time.time() + delay, job['id']))
+            logger.warning(f"🖨️  Receipt {job['invoice_number']} attempt {job['attempts']} failed: {error}")
+
+        with self.get_pool().connection() as conn:
+            conn.executemany('''
+                UPDATE print_jobs SET status = 'printed', last_error = NULL,
+                    updated_at = CURRENT_TIMESTAMP, printed_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(job['id'],) for job, _ in printed])
+            conn.executemany('''
+                UPDATE print_jobs SET status = ?, last_error = ?, next_attempt_at = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', retries)
+            conn.commit()
+
+        with self._metrics_lock:
+            self._metrics['printed'] += len(printed)
+            self._metrics['failed'] += sum(1 for row in retries if row[0] == 'failed')
+            self._metrics['retries'] += sum(1 for row in retries if row[0] == 'queued')
+
+        if self.on_done:
+            for job in [dict(job, status='printed', last_error=None) for job, _ in printed] + done:
+                try:
+                    self.on_done(job)
+                except Exception as e:
+                    logger.error(f'Print callback error: {e}')
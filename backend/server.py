@@ -13,22 +13,43 @@ Features:
 - Multi-shop support
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, g, has_request_context
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 import sqlite3
 import os
 import json
+import math
 from datetime import datetime, timedelta
 import hashlib
 import uuid
 import logging
+import threading
+import atexit
 from functools import wraps
 
+from db_pool import ConnectionPool, PoolTimeout
+from sync_ingest import BulkIngest, summarize, validate_invoice, validate_product
+from audit_writer import AuditWriter, new_entry as new_audit_entry
+from pagination import PageError, page_args, page_body, keyset_clause, ndjson_lines
+from hardware_stream import HardwareNamespace, ShopReadingHubs, TOPICS as HARDWARE_TOPICS
+from escpos import ReceiptRenderer, LINE_WIDTHS
+from print_spooler import PrintSpooler, open_printer
+from catalog_cache import CatalogCache
+import ledger
+import shift_totals
+from stock import decrement_stock
+
 # Initialize Flask app
 app = Flask(__name__, static_folder='apps', static_url_path='')
 app.config['SECRET_KEY'] = 'milkrecord-pos-secret-2026'
 app.config['DATABASE'] = os.path.join(os.path.dirname(__file__), 'data', 'milkrecord.db')
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 16))
+app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 10))
+app.config['DB_BUSY_TIMEOUT_MS'] = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+# Receipt printer: file:///dev/usb/lp0, serial:///dev/ttyUSB0?baudrate=9600 or tcp://host:9100
+app.config['PRINTER_URI'] = os.getenv('PRINTER_URI', os.path.join(os.path.dirname(__file__), 'data', 'receipts.bin'))
+app.config['PRINTER_PAPER_MM'] = int(os.getenv('PRINTER_PAPER_MM', 58))
 
 # Enable CORS for all routes
 CORS(app)
@@ -40,24 +61,76 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_pool_lock = threading.Lock()
+
 # =====================================================
 # DATABASE SETUP
 # =====================================================
 
+def get_pool():
+    """Get the shared connection pool (created on first use)"""
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                pool = app.extensions['db_pool'] = ConnectionPool(
+                    app.config['DATABASE'],
+                    max_size=app.config['DB_POOL_SIZE'],
+                    timeout=app.config['DB_POOL_TIMEOUT'],
+                    busy_timeout_ms=app.config['DB_BUSY_TIMEOUT_MS']
+                )
+    return pool
+
 def get_db():
-    """Get database connection"""
-    db = getattr(app, '_database', None)
-    if db is None:
-        db = app._database = sqlite3.connect(app.config['DATABASE'])
-        db.row_factory = sqlite3.Row
-    return db
+    """Get database connection for the current request"""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
 
 @app.teardown_appcontext
-def close_connection(exception):
-    """Close database connection"""
-    db = getattr(app, '_database', None)
+def release_connection(exception):
+    """Return the request's database connection to the pool"""
+    db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
+
+def ndjson_export(fetch_page, shop_id, name):
+    """
+    Stream a paged query as NDJSON
+    Each page checks out its own pooled connection, so a slow client never pins one
+    """
+    def fetch(after, limit):
+        with get_pool().connection() as conn:
+            return fetch_page(conn, shop_id, after, limit)
+    
+    return Response(ndjson_lines(fetch), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename={name}.ndjson'})
+
+class ParamError(ValueError):
+    """Malformed request parameter (maps to HTTP 400)"""
+
+def int_param(values, name, default=None):
+    """Integer from request args or a JSON body, default when missing (ParamError when malformed)"""
+    value = values.get(name)
+    if value is None:
+        return default
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError(value)
+        return int(value)
+    except (TypeError, ValueError):
+        raise ParamError(f"{name} must be an integer")
+
+def shop_arg():
+    """?shop_id= as an integer (default shop 1)"""
+    return int_param(request.args, 'shop_id', 1)
+
+def ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table if it is missing"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
 
 def init_db():
     """Initialize database with all tables"""
@@ -194,6 +267,7 @@ def init_db():
             quantity REAL NOT NULL,
             unit_price REAL NOT NULL,
             total REAL NOT NULL,
+            client_id TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (invoice_id) REFERENCES invoices(id),
             FOREIGN KEY (product_id) REFERENCES products(id)
@@ -212,12 +286,53 @@ def init_db():
             reference_type TEXT,
             reference_id INTEGER,
             notes TEXT,
+            client_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (customer_id) REFERENCES customers(id),
+            FOREIGN KEY (shop_id) REFERENCES shops(id)
+        )
+    ''')
+    
+    # Closing balance per customer at a date (ledger.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            customer_id INTEGER NOT NULL,
+            as_of TIMESTAMP NOT NULL,
+            balance REAL NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (customer_id) REFERENCES customers(id),
             FOREIGN KEY (shop_id) REFERENCES shops(id)
         )
     ''')
     
+    # One-off data migrations already applied
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Receipt print queue (print_spooler.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS print_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER NOT NULL,
+            invoice_number TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            printed_at TIMESTAMP,
+            FOREIGN KEY (shop_id) REFERENCES shops(id)
+        )
+    ''')
+    
     # Audit logs table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS audit_logs (
@@ -237,6 +352,7 @@ def init_db():
             signature TEXT,
             ip_address TEXT,
             user_agent TEXT,
+            client_id TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (shop_id) REFERENCES shops(id),
             FOREIGN KEY (user_id) REFERENCES users(id)
@@ -247,6 +363,7 @@ def init_db():
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS sync_queue (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shop_id INTEGER,
             table_name TEXT NOT NULL,
             record_id INTEGER,
             action TEXT NOT NULL,
@@ -273,6 +390,18 @@ def init_db():
         )
     ''')
     
+    # Columns added after the first release
+    ensure_column(cursor, 'invoice_items', 'client_id', 'TEXT')
+    ensure_column(cursor, 'customer_ledger', 'client_id', 'TEXT')
+    ensure_column(cursor, 'audit_logs', 'client_id', 'TEXT')
+    ensure_column(cursor, 'sync_queue', 'shop_id', 'INTEGER')
+    
+    # Shift running totals (maintained by every sale, see shift_totals.py)
+    for column in ('cash_total', 'upi_total', 'credit_total', 'other_total', 'sales_total', 'litres_sold'):
+        ensure_column(cursor, 'shifts', column, 'REAL DEFAULT 0.0')
+    for column in ('invoice_count', 'item_count'):
+        ensure_column(cursor, 'shifts', column, 'INTEGER DEFAULT 0')
+    
     # Create indexes
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_shop ON invoices(shop_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(created_at DESC)')
@@ -280,9 +409,34 @@ def init_db():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_barcode ON products(barcode)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_shop ON customers(shop_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_shifts_shop ON shifts(shop_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_shift ON invoices(shift_id, shop_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items(invoice_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_logs_shop ON audit_logs(shop_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_logs_date ON audit_logs(created_at DESC)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_queue_synced ON sync_queue(synced)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_print_jobs_due ON print_jobs(status, next_attempt_at)')
+    
+    # Ledger: running balance order per customer, statement range per shop
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_ledger_customer ON customer_ledger(customer_id, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_ledger_shop_date ON customer_ledger(shop_id, created_at)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_ledger_checkpoints_customer ON ledger_checkpoints(customer_id, as_of)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ledger_checkpoints_shop ON ledger_checkpoints(shop_id, as_of)')
+    
+    # One print job per invoice (repeated print requests are deduplicated)
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_print_jobs_invoice ON print_jobs(shop_id, invoice_number)')
+    
+    # Keyset pagination (created_at, id) within a shop
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_shop_keyset ON invoices(shop_id, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_shop_keyset ON products(shop_id, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_shop_keyset ON customers(shop_id, created_at, id)')
+    
+    # Client-side IDs used to dedupe offline sync pushes
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_invoice_items_client
+                      ON invoice_items(client_id) WHERE client_id IS NOT NULL''')
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_customer_ledger_client
+                      ON customer_ledger(client_id) WHERE client_id IS NOT NULL''')
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_audit_logs_client
+                      ON audit_logs(client_id) WHERE client_id IS NOT NULL''')
     
     # Insert default shop
     cursor.execute('''
@@ -298,6 +452,17 @@ def init_db():
         VALUES (1, 1, 'Admin User', 'admin@milkrecord.com', ?, 'admin', 'OP-001')
     ''', (password_hash,))
     
+    # Ledger rows written before debit meant "udhar given" (ledger.py)
+    migrated = ledger.migrate_sign_convention(conn)
+    if migrated:
+        logger.info(f"Ledger: {migrated} entries rewritten to the debit/credit sign convention")
+    
+    # Shifts open across the upgrade that added the running totals (shift_totals.py)
+    conn.row_factory = sqlite3.Row
+    backfilled = shift_totals.backfill(conn)
+    if backfilled:
+        logger.info(f"Shift totals: {backfilled} open shifts backfilled from their invoices")
+    
     conn.commit()
     conn.close()
     
@@ -308,65 +473,104 @@ def init_db():
 # =====================================================
 
 class AuditTrail:
-    """Audit trail logging system"""
+    """Audit trail logging system (writes are queued to AuditWriter)"""
     
     def __init__(self):
-        self.previous_hash = None
-    
-    def log(self, shop_id, user_id, action, entity_type=None, entity_id=None, 
-            old_data=None, new_data=None, notes='', session_id=None, machine_id=None):
-        """Log an audit entry"""
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Generate hash
-        entry_data = {
-            'shop_id': shop_id,
-            'user_id': user_id,
-            'action': action,
-            'entity_type': entity_type,
-            'entity_id': entity_id,
-            'timestamp': datetime.now().isoformat(),
-            'previous_hash': self.previous_hash
-        }
-        
-        hash_string = json.dumps(entry_data, sort_keys=True)
-        current_hash = hashlib.sha256(hash_string.encode()).hexdigest()
-        
-        # Generate signature
-        signature = 'SIG-' + hashlib.md5(
-            f"{session_id}{action}{datetime.now().isoformat()}".encode()
-        ).hexdigest()[:16].upper()
-        
-        # Insert audit log
-        cursor.execute('''
-            INSERT INTO audit_logs 
-            (shop_id, user_id, session_id, machine_id, action, entity_type, entity_id,
-             old_data, new_data, notes, hash, previous_hash, signature,
-             ip_address, user_agent)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            shop_id, user_id, session_id or str(uuid.uuid4()), machine_id,
-            action, entity_type, entity_id,
-            json.dumps(old_data) if old_data else None,
-            json.dumps(new_data) if new_data else None,
-            notes, current_hash, self.previous_hash, signature,
-            request.remote_addr, request.headers.get('User-Agent', '')
-        ))
+        self.writer = AuditWriter(get_pool, on_written=self._emit)
+    
+    def entry(self, shop_id, user_id, action, entity_type=None, entity_id=None, 
+              old_data=None, new_data=None, notes='', session_id=None, machine_id=None):
+        """Build an audit entry with the current request's client details"""
+        ip_address, user_agent = None, ''
+        if has_request_context():
+            ip_address = request.remote_addr
+            user_agent = request.headers.get('User-Agent', '')
         
-        self.previous_hash = current_hash
-        conn.commit()
-        
-        # Emit real-time update
+        return new_audit_entry(
+            shop_id, user_id, action, entity_type, entity_id,
+            old_data=old_data, new_data=new_data, notes=notes,
+            session_id=session_id, machine_id=machine_id,
+            ip_address=ip_address, user_agent=user_agent
+        )
+    
+    def log(self, *args, **kwargs):
+        """Queue an audit entry; hashing and insert happen on the writer thread"""
+        self.writer.submit(self.entry(*args, **kwargs))
+    
+    def commit(self, conn, *entries):
+        """Write entries into conn's open transaction and commit it with them"""
+        self.writer.commit_with(conn, entries)
+    
+    @staticmethod
+    def _emit(entry):
+        """Emit real-time update once the entry is committed"""
         socketio.emit('audit_log', {
-            'action': action,
-            'entity_type': entity_type,
-            'timestamp': datetime.now().isoformat()
+            'action': entry['action'],
+            'entity_type': entry['entity_type'],
+            'timestamp': entry['timestamp']
         })
-        
-        return current_hash
 
 audit = AuditTrail()
+atexit.register(audit.writer.close)
+
+# =====================================================
+# INVENTORY
+# =====================================================
+
+class LowStockWatch:
+    """Products at or below min_stock per shop, so each crossing alerts once"""
+    
+    def __init__(self):
+        self._low = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, conn, shop_id, changes):
+        """Record committed stock changes, returns the ones that just went low"""
+        alerts = []
+        with self._lock:
+            low = self._low.get(shop_id)
+            if low is None:
+                # First look at this shop: changed products are judged by their stock before the change
+                low = self._low[shop_id] = {row[0] for row in conn.execute(
+                    'SELECT id FROM products WHERE shop_id = ? AND stock_qty <= min_stock', (shop_id,)
+                ).fetchall()} - {change['id'] for change in changes}
+                low.update(change['id'] for change in changes if change['old_stock'] <= change['min_stock'])
+            
+            for change in changes:
+                if change['stock_qty'] <= change['min_stock']:
+                    if change['id'] not in low:
+                        low.add(change['id'])
+                        alerts.append(change)
+                else:
+                    low.discard(change['id'])
+        return alerts
+    
+    def notify(self, conn, shop_id, changes):
+        """Emit low_stock for products that crossed min_stock"""
+        for change in self.observe(conn, shop_id, changes):
+            logger.info(f"📉 Low stock: {change['name']} ({change['stock_qty']:g} left, min {change['min_stock']:g})")
+            socketio.emit('low_stock', {
+                'shop_id': shop_id,
+                'product_id': change['id'],
+                'name': change['name'],
+                'stock_qty': change['stock_qty'],
+                'min_stock': change['min_stock']
+            })
+
+stock_watch = LowStockWatch()
+
+# Active products per shop in memory (catalog_cache.py)
+catalog_cache = CatalogCache(get_pool)
+
+def conditional_json(tag, build):
+    """JSON response with an ETag; 304 without a body if the client has this version"""
+    if tag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(tag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 # =====================================================
 # DECORATORS
@@ -386,7 +590,7 @@ def require_auth(f):
         
         token = auth_header[7:]
         # Validate token (implement proper validation)
-        kwargs['auth_token'] = token
+        g.auth_token = token
         return f(*args, **kwargs)
     return decorated
 
@@ -419,7 +623,6 @@ def login():
     ''', (operator_id, password_hash))
     
     user = cursor.fetchone()
-    conn.close()
     
     if not user:
         # Log failed login
@@ -465,24 +668,32 @@ def logout():
 # API ROUTES - PRODUCTS
 # =====================================================
 
+def fetch_products_page(conn, shop_id, after, limit):
+    """Active products, newest first"""
+    clause, params = keyset_clause(after)
+    cursor = conn.execute(f'''
+        SELECT * FROM products 
+        WHERE shop_id = ? AND active = 1{clause}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    ''', (shop_id, *params, limit))
+    return [dict(row) for row in cursor.fetchall()]
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all products"""
-    shop_id = request.args.get('shop_id', 1)
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM products 
-        WHERE shop_id = ? AND active = 1
-        ORDER BY name
-    ''', (shop_id,))
-    
-    products = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    """Get products (keyset paged: ?after=<created_at>,<id>&limit=), served from the catalog cache"""
+    shop_id = shop_arg()
+    after, limit = page_args(request.args)
     
-    return jsonify({'success': True, 'products': products, 'count': len(products)})
+    catalog = catalog_cache.get(shop_id)
+    return conditional_json(catalog_cache.etag(shop_id, catalog),
+                            lambda: page_body('products', catalog.page(after, limit), limit))
+
+@app.route('/api/products/export', methods=['GET'])
+def export_products():
+    """Stream all active products as NDJSON"""
+    shop_id = shop_arg()
+    return ndjson_export(fetch_products_page, shop_id, 'products')
 
 @app.route('/api/products', methods=['POST'])
 @require_auth
@@ -501,17 +712,17 @@ def create_product():
     
     cursor.execute('''
         INSERT INTO products 
-        (shop_id, name, category, price, cost, unit, barcode, sku, stock_qty)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        (shop_id, name, category, price, cost, unit, barcode, sku, stock_qty, min_stock)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
         shop_id, data['name'], data.get('category', 'general'),
         data['price'], data.get('cost', 0), data.get('unit', 'unit'),
-        data.get('barcode'), data.get('sku'), data.get('stock_qty', 0)
+        data.get('barcode'), data.get('sku'), data.get('stock_qty', 0), data.get('min_stock', 0)
     ))
     
     product_id = cursor.lastrowid
     conn.commit()
-    conn.close()
+    catalog_cache.invalidate(shop_id)
     
     # Audit log
     audit.log(shop_id, user_id, 'PRODUCT_CREATE', 'product', product_id,
@@ -526,7 +737,11 @@ def create_product():
 @require_auth
 def update_product(product_id):
     """Update product"""
-    data = request.json
+    # Numbers converted before the write: stock alerts below compare them
+    data, error = validate_product(request.json)
+    if error:
+        return jsonify({'error': error}), 400
+    
     shop_id = data.get('shop_id', 1)
     user_id = data.get('user_id')
     
@@ -541,7 +756,7 @@ def update_product(product_id):
     cursor.execute('''
         UPDATE products 
         SET name = ?, price = ?, category = ?, unit = ?, 
-            barcode = ?, stock_qty = ?, updated_at = CURRENT_TIMESTAMP
+            barcode = ?, stock_qty = ?, min_stock = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ? AND shop_id = ?
     ''', (
         data.get('name', old_product.get('name')),
@@ -550,17 +765,32 @@ def update_product(product_id):
         data.get('unit', old_product.get('unit')),
         data.get('barcode', old_product.get('barcode')),
         data.get('stock_qty', old_product.get('stock_qty')),
+        data.get('min_stock', old_product.get('min_stock')),
         product_id, shop_id
     ))
     
+    updated = cursor.rowcount
     conn.commit()
-    conn.close()
+    catalog_cache.invalidate(shop_id)
+    
+    # Restocking clears the low-stock state, lowering stock or raising min_stock can set it
+    if updated:
+        stock_watch.notify(conn, shop_id, [{
+            'id': product_id,
+            'name': data.get('name', old_product['name']),
+            'old_stock': old_product['stock_qty'],
+            'stock_qty': data.get('stock_qty', old_product['stock_qty']),
+            'min_stock': data.get('min_stock', old_product['min_stock'])
+        }])
     
     # Audit log
     audit.log(shop_id, user_id, 'PRODUCT_UPDATE', 'product', product_id,
               old_data=old_product, new_data=data,
               notes=f'Updated product: {product_id}')
     
+    # Emit real-time update
+    socketio.emit('product_updated', {'id': product_id, 'shop_id': shop_id})
+    
     return jsonify({'success': True})
 
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
@@ -578,31 +808,27 @@ def delete_product(product_id):
     ''', (product_id, shop_id))
     
     conn.commit()
-    conn.close()
+    catalog_cache.invalidate(shop_id)
     
     audit.log(shop_id, user_id, 'PRODUCT_DELETE', 'product', product_id,
               notes=f'Deleted product: {product_id}')
     
+    # Emit real-time update
+    socketio.emit('product_deleted', {'id': product_id, 'shop_id': shop_id})
+    
     return jsonify({'success': True})
 
 @app.route('/api/products/barcode/<barcode>', methods=['GET'])
 def get_product_by_barcode(barcode):
-    """Get product by barcode"""
-    shop_id = request.args.get('shop_id', 1)
+    """Get product by barcode (or SKU) from the catalog cache"""
+    shop_id = shop_arg()
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM products 
-        WHERE barcode = ? AND shop_id = ? AND active = 1
-    ''', (barcode, shop_id))
-    
-    product = cursor.fetchone()
-    conn.close()
+    catalog = catalog_cache.get(shop_id)
+    product = catalog.lookup(barcode)
     
     if product:
-        return jsonify({'success': True, 'product': dict(product)})
+        return conditional_json(catalog_cache.etag(shop_id, catalog),
+                                lambda: {'success': True, 'product': product})
     else:
         return jsonify({'error': 'Product not found'}), 404
 
@@ -613,25 +839,36 @@ def get_product_by_barcode(barcode):
 @app.route('/api/invoices', methods=['POST'])
 @require_auth
 def create_invoice():
-    """Create new invoice (sale)"""
+    """
+    Create new invoice (sale)
+    Invoice, items, stock decrement, ledger entry, shift totals and audit row are committed together;
+    a retry with an invoice_number that already exists returns the stored invoice unchanged
+    """
     data = request.json
-    shop_id = data.get('shop_id', 1)
-    user_id = data.get('user_id')
-    shift_id = data.get('shift_id')
     
     required = ['invoice_number', 'items', 'total', 'payment_mode', 'amount_paid']
     if not all(k in data for k in required):
         return jsonify({'error': 'Missing required fields'}), 400
     
+    # Numbers and line items converted before anything is written
+    data, error = validate_invoice(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    shop_id = data.get('shop_id') or 1
+    user_id = data.get('user_id')
+    shift_id = data.get('shift_id')
+    
     conn = get_db()
     cursor = conn.cursor()
     
-    # Insert invoice
+    # Insert invoice (no-op if this invoice_number was already recorded)
     cursor.execute('''
         INSERT INTO invoices 
         (shop_id, shift_id, invoice_number, customer_id, customer_name,
          subtotal, discount, tax, total, payment_mode, amount_paid, change)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(invoice_number) DO NOTHING
     ''', (
         shop_id, shift_id, data['invoice_number'],
         data.get('customer_id'), data.get('customer_name', 'Walking Customer'),
@@ -640,43 +877,44 @@ def create_invoice():
         data['amount_paid'], data.get('change', 0)
     ))
     
+    if cursor.rowcount == 0:
+        conn.rollback()
+        existing = conn.execute('SELECT id, shop_id FROM invoices WHERE invoice_number = ?',
+                                (data['invoice_number'],)).fetchone()
+        if existing['shop_id'] != int(shop_id):
+            return jsonify({'error': 'Invoice number already used'}), 409
+        return jsonify({'success': True, 'invoice_id': existing['id'], 'duplicate': True})
+    
     invoice_id = cursor.lastrowid
     
     # Insert invoice items
-    for item in data.get('items', []):
-        cursor.execute('''
-            INSERT INTO invoice_items 
-            (invoice_id, product_id, product_name, quantity, unit_price, total)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            invoice_id, item.get('product_id'), item['product_name'],
-            item['quantity'], item['unit_price'], item['total']
-        ))
-    
-    # Update customer balance if credit
+    cursor.executemany('''
+        INSERT INTO invoice_items 
+        (invoice_id, product_id, product_name, quantity, unit_price, total)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(
+        invoice_id, item.get('product_id'), item['product_name'],
+        item['quantity'], item['unit_price'], item['total']
+    ) for item in data.get('items', [])])
+    
+    # Unpaid part of a credit sale goes on the customer's udhar
     if data.get('payment_mode') == 'CREDIT' and data.get('customer_id'):
-        balance = data.get('amount_paid', 0) - data['total']
-        cursor.execute('''
-            UPDATE customers SET balance = balance + ? WHERE id = ?
-        ''', (-balance, data['customer_id']))
-        
-        # Add to customer ledger
-        cursor.execute('''
-            INSERT INTO customer_ledger 
-            (customer_id, shop_id, transaction_type, amount, balance,
-             reference_type, reference_id, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['customer_id'], shop_id, 'debit', data['total'],
-            balance, 'invoice', invoice_id, f'Invoice {data["invoice_number"]}'
-        ))
+        ledger.record(conn, ledger.credit_sale(data['customer_id'], shop_id, invoice_id, data['invoice_number'],
+                                               data['total'], data.get('amount_paid', 0)))
     
-    conn.commit()
-    conn.close()
+    # Sold quantities come off stock in the same transaction
+    stock_changes = decrement_stock(conn, shop_id, data.get('items', []))
     
-    # Audit log
-    audit.log(shop_id, user_id, 'SALE_CREATE', 'invoice', invoice_id,
-              new_data=data, notes=f'Sale of ₹{data["total"]:.2f}')
+    # Shift running totals
+    if shift_id:
+        shift_totals.add_invoices(conn, [invoice_id])
+    
+    # Audit row goes into the same commit
+    audit.commit(conn, audit.entry(shop_id, user_id, 'SALE_CREATE', 'invoice', invoice_id,
+                                   new_data=data, notes=f'Sale of ₹{data["total"]:.2f}'))
+    
+    catalog_cache.update_stock(shop_id, stock_changes)
+    stock_watch.notify(conn, shop_id, stock_changes)
     
     # Emit real-time update
     socketio.emit('sale_created', {
@@ -687,33 +925,49 @@ def create_invoice():
     
     return jsonify({'success': True, 'invoice_id': invoice_id})
 
-@app.route('/api/invoices', methods=['GET'])
-def get_invoices():
-    """Get invoices"""
-    shop_id = request.args.get('shop_id', 1)
-    limit = request.args.get('limit', 50)
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+def fetch_invoices_page(conn, shop_id, after, limit):
+    """Invoices with customer name, newest first"""
+    clause, params = keyset_clause(after, alias='i')
+    cursor = conn.execute(f'''
         SELECT i.*, c.name as customer_name 
         FROM invoices i
         LEFT JOIN customers c ON i.customer_id = c.id
-        WHERE i.shop_id = ?
-        ORDER BY i.created_at DESC
+        WHERE i.shop_id = ?{clause}
+        ORDER BY i.created_at DESC, i.id DESC
         LIMIT ?
-    ''', (shop_id, limit))
+    ''', (shop_id, *params, limit))
+    return [dict(row) for row in cursor.fetchall()]
+
+@app.route('/api/invoices', methods=['GET'])
+def get_invoices():
+    """Get invoices, newest first (keyset paged: ?after=<created_at>,<id>&limit=)"""
+    shop_id = shop_arg()
+    after, limit = page_args(request.args)
     
-    invoices = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    invoices = fetch_invoices_page(get_db(), shop_id, after, limit)
     
-    return jsonify({'success': True, 'invoices': invoices, 'count': len(invoices)})
+    return jsonify(page_body('invoices', invoices, limit))
+
+@app.route('/api/invoices/export', methods=['GET'])
+def export_invoices():
+    """Stream all invoices as NDJSON"""
+    shop_id = shop_arg()
+    return ndjson_export(fetch_invoices_page, shop_id, 'invoices')
 
 # =====================================================
 # API ROUTES - SHIFTS
 # =====================================================
 
+def cash_amount(value):
+    """Cash amount from a request body as a float, None if it is not a finite number"""
+    if isinstance(value, bool):
+        return None
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    return amount if math.isfinite(amount) else None
+
 @app.route('/api/shifts', methods=['POST'])
 @require_auth
 def create_shift():
@@ -726,6 +980,11 @@ def create_shift():
     if not all(k in data for k in required):
         return jsonify({'error': 'Missing required fields'}), 400
     
+    # Expected cash at close is opening_cash plus cash taken: it must be a number
+    opening_cash = cash_amount(data['opening_cash'])
+    if opening_cash is None:
+        return jsonify({'error': 'Invalid fields: opening_cash'}), 400
+    
     conn = get_db()
     cursor = conn.cursor()
     
@@ -733,11 +992,10 @@ def create_shift():
         INSERT INTO shifts 
         (shop_id, user_id, shift_id, shift_type, opening_cash, start_time, status)
         VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, 'open')
-    ''', (shop_id, user_id, data['shift_id'], data['shift_type'], data['opening_cash']))
+    ''', (shop_id, user_id, data['shift_id'], data['shift_type'], opening_cash))
     
     shift_id = cursor.lastrowid
     conn.commit()
-    conn.close()
     
     audit.log(shop_id, user_id, 'SHIFT_START', 'shift', shift_id,
               new_data=data, notes=f'Shift started: {data["shift_id"]}')
@@ -747,46 +1005,44 @@ def create_shift():
 @app.route('/api/shifts/<int:shift_id>/end', methods=['POST'])
 @require_auth
 def end_shift(shift_id):
-    """End shift"""
+    """End shift: expected cash is the opening float plus cash taken (credit sales count only what was paid)"""
     data = request.json
     shop_id = data.get('shop_id', 1)
     user_id = data.get('user_id')
+    closing_cash = cash_amount(data.get('closing_cash', 0))
+    if closing_cash is None:
+        return jsonify({'error': 'Invalid fields: closing_cash'}), 400
     
     conn = get_db()
-    cursor = conn.cursor()
-    
-    # Calculate expected cash from sales
-    cursor.execute('''
-        SELECT COALESCE(SUM(total), 0) as total_sales
-        FROM invoices 
-        WHERE shift_id = ? AND payment_mode IN ('CASH', 'CREDIT')
-    ''', (shift_id,))
     
-    result = cursor.fetchone()
-    expected_cash = result['total_sales'] if result else 0
-    
-    closing_cash = data.get('closing_cash', 0)
-    variance = closing_cash - expected_cash
-    
-    cursor.execute('''
+    # Counters are kept by every sale: close reads them, no scan over the shift's invoices
+    shift = conn.execute('''
         UPDATE shifts 
-        SET closing_cash = ?, expected_cash = ?, variance = ?,
+        SET closing_cash = ?, expected_cash = COALESCE(opening_cash, 0) + cash_total,
+            variance = ? - (COALESCE(opening_cash, 0) + cash_total),
             end_time = CURRENT_TIMESTAMP, status = 'closed'
         WHERE id = ? AND shop_id = ?
-    ''', (closing_cash, expected_cash, variance, shift_id, shop_id))
+        RETURNING *
+    ''', (closing_cash, closing_cash, shift_id, shop_id)).fetchone()
+    
+    if shift is None:
+        conn.rollback()
+        return jsonify({'error': 'Shift not found'}), 404
     
     conn.commit()
-    conn.close()
+    shift = dict(shift)
+    variance = shift['variance']
     
     audit.log(shop_id, user_id, 'SHIFT_END', 'shift', shift_id,
-              new_data={'closing_cash': closing_cash, 'variance': variance},
+              new_data={'closing_cash': closing_cash, 'expected_cash': shift['expected_cash'], 'variance': variance},
               notes=f'Shift ended with variance: ₹{variance:.2f}')
     
-    return jsonify({'success': True, 'variance': variance})
+    return jsonify({'success': True, 'variance': variance, 'expected_cash': shift['expected_cash'],
+                    'totals': {name: shift[name] for name in shift_totals.COUNTERS}})
 
 @app.route('/api/shifts/current', methods=['GET'])
 def get_current_shift():
-    """Get current open shift"""
+    """Get current open shift with its running totals"""
     shop_id = request.args.get('shop_id', 1)
     user_id = request.args.get('user_id')
     
@@ -803,35 +1059,65 @@ def get_current_shift():
     ''', (shop_id, user_id))
     
     shift = cursor.fetchone()
-    conn.close()
     
     if shift:
-        return jsonify({'success': True, 'shift': dict(shift)})
+        # Live expected cash from the running totals
+        shift = dict(shift)
+        shift['expected_cash'] = (shift['opening_cash'] or 0) + shift['cash_total']
+        return jsonify({'success': True, 'shift': shift})
     else:
         return jsonify({'success': True, 'shift': None})
 
+@app.route('/api/shifts/reconcile', methods=['POST'])
+@require_auth
+def reconcile_shifts():
+    """Recompute shift totals from invoices; fix: true rewrites the ones that are wrong"""
+    data = request.json or {}
+    shop_id = int_param(data, 'shop_id')
+    shift_id = int_param(data, 'shift_id')
+    fix = bool(data.get('fix'))
+    
+    conn = get_db()
+    report = shift_totals.reconcile(conn, shop_id, shift_id, fix=fix)
+    if fix:
+        conn.commit()
+        if not report['ok']:
+            audit.log(shop_id or 1, data.get('user_id'), 'SHIFT_TOTALS_REPAIR', 'shift', shift_id,
+                      new_data={'wrong_shifts': report['wrong_shifts']},
+                      notes='Shift totals recomputed')
+    
+    return jsonify({'success': True, **report})
+
 # =====================================================
 # API ROUTES - CUSTOMERS
 # =====================================================
 
+def fetch_customers_page(conn, shop_id, after, limit):
+    """Active customers, newest first"""
+    clause, params = keyset_clause(after)
+    cursor = conn.execute(f'''
+        SELECT * FROM customers 
+        WHERE shop_id = ? AND active = 1{clause}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    ''', (shop_id, *params, limit))
+    return [dict(row) for row in cursor.fetchall()]
+
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
-    """Get customers"""
-    shop_id = request.args.get('shop_id', 1)
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM customers 
-        WHERE shop_id = ? AND active = 1
-        ORDER BY name
-    ''', (shop_id,))
+    """Get customers (keyset paged: ?after=<created_at>,<id>&limit=)"""
+    shop_id = shop_arg()
+    after, limit = page_args(request.args)
     
-    customers = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    customers = fetch_customers_page(get_db(), shop_id, after, limit)
     
-    return jsonify({'success': True, 'customers': customers, 'count': len(customers)})
+    return jsonify(page_body('customers', customers, limit))
+
+@app.route('/api/customers/export', methods=['GET'])
+def export_customers():
+    """Stream all active customers as NDJSON"""
+    shop_id = shop_arg()
+    return ndjson_export(fetch_customers_page, shop_id, 'customers')
 
 @app.route('/api/customers', methods=['POST'])
 @require_auth
@@ -851,7 +1137,6 @@ def create_customer():
     
     customer_id = cursor.lastrowid
     conn.commit()
-    conn.close()
     
     audit.log(shop_id, user_id, 'CUSTOMER_CREATE', 'customer', customer_id,
               new_data=data, notes=f'Created customer: {data["name"]}')
@@ -867,7 +1152,7 @@ def get_customer_ledger(customer_id):
     cursor.execute('''
         SELECT * FROM customer_ledger 
         WHERE customer_id = ?
-        ORDER BY created_at DESC
+        ORDER BY created_at DESC, id DESC
         LIMIT 100
     ''', (customer_id,))
     
@@ -877,7 +1162,6 @@ def get_customer_ledger(customer_id):
     cursor.execute('SELECT balance FROM customers WHERE id = ?', (customer_id,))
     customer = cursor.fetchone()
     
-    conn.close()
     
     return jsonify({
         'success': True,
@@ -897,39 +1181,93 @@ def add_ledger_entry():
     if not all(k in data for k in required):
         return jsonify({'error': 'Missing required fields'}), 400
     
+    if data['transaction_type'] not in ledger.TRANSACTION_TYPES:
+        return jsonify({'error': 'transaction_type must be debit (udhar given) or credit (payment received)'}), 400
+    
     conn = get_db()
-    cursor = conn.cursor()
     
-    # Update customer balance
-    if data['transaction_type'] == 'credit':
-        cursor.execute('''
-            UPDATE customers SET balance = balance + ? WHERE id = ?
-        ''', (data['amount'], data['customer_id']))
-    else:  # debit
-        cursor.execute('''
-            UPDATE customers SET balance = balance - ? WHERE id = ?
-        ''', (data['amount'], data['customer_id']))
-    
-    # Get new balance
-    cursor.execute('SELECT balance FROM customers WHERE id = ?', (data['customer_id'],))
-    new_balance = cursor.fetchone()['balance']
-    
-    # Add ledger entry
-    cursor.execute('''
-        INSERT INTO customer_ledger 
-        (customer_id, shop_id, transaction_type, amount, balance, notes)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (data['customer_id'], shop_id, data['transaction_type'], 
-          data['amount'], new_balance, data.get('notes', '')))
+    # Balance is what the customer owes: debit adds, credit (payment) subtracts
+    balances = ledger.record(conn, [{
+        'customer_id': data['customer_id'],
+        'shop_id': shop_id,
+        'transaction_type': data['transaction_type'],
+        'amount': data['amount'],
+        'reference_type': data.get('reference_type'),
+        'reference_id': data.get('reference_id'),
+        'notes': data.get('notes', '')
+    }])
+    new_balance = balances[data['customer_id']]
     
     conn.commit()
-    conn.close()
     
     audit.log(shop_id, user_id, 'LEDGER_ENTRY', 'customer_ledger', None,
               new_data=data, notes=f'Ledger {data["transaction_type"]}: ₹{data["amount"]:.2f}')
     
     return jsonify({'success': True, 'balance': new_balance})
 
+@app.route('/api/customers/<int:customer_id>/balance', methods=['GET'])
+def get_customer_balance(customer_id):
+    """Balance as of a date or time (?as_of=YYYY-MM-DD[ HH:MM:SS]), default now"""
+    return jsonify({'success': True, **ledger.balance_as_of(get_db(), customer_id, request.args.get('as_of'))})
+
+@app.route('/api/customers/<int:customer_id>/statement', methods=['GET'])
+def get_customer_statement(customer_id):
+    """Statement for ?from=&to= (dates or timestamps): opening, entries, closing"""
+    if not request.args.get('from') or not request.args.get('to'):
+        return jsonify({'error': 'from and to are required'}), 400
+    
+    return jsonify({'success': True, 'statement': ledger.statement(
+        get_db(), customer_id, request.args['from'], request.args['to'])})
+
+@app.route('/api/ledger/statements', methods=['GET'])
+def get_ledger_statements():
+    """Statements for every customer of a shop with dues or activity in ?from=&to="""
+    shop_id = shop_arg()
+    if not request.args.get('from') or not request.args.get('to'):
+        return jsonify({'error': 'from and to are required'}), 400
+    
+    statements = ledger.statements(get_db(), shop_id, request.args['from'], request.args['to'])
+    
+    return jsonify({'success': True, 'statements': statements, 'count': len(statements)})
+
+@app.route('/api/ledger/checkpoints', methods=['POST'])
+@require_auth
+def create_ledger_checkpoint():
+    """Record every customer's closing balance at as_of (run at month-end)"""
+    data = request.json or {}
+    shop_id = int_param(data, 'shop_id', 1)
+    if not data.get('as_of'):
+        return jsonify({'error': 'as_of is required'}), 400
+    
+    conn = get_db()
+    count = ledger.checkpoint(conn, shop_id, data['as_of'])
+    conn.commit()
+    
+    audit.log(shop_id, data.get('user_id'), 'LEDGER_CHECKPOINT', 'customer_ledger', None,
+              new_data={'as_of': data['as_of'], 'customers': count}, notes=f'Ledger closed at {data["as_of"]}')
+    
+    return jsonify({'success': True, 'as_of': ledger.timestamp(data['as_of'], end_of_day=True), 'customers': count})
+
+@app.route('/api/ledger/verify', methods=['POST'])
+@require_auth
+def verify_ledger():
+    """Recompute all balances; fix: true rewrites the ones that are wrong"""
+    data = request.json or {}
+    shop_id = int_param(data, 'shop_id')
+    fix = bool(data.get('fix'))
+    
+    conn = get_db()
+    report = ledger.verify(conn, shop_id, fix=fix)
+    if fix:
+        conn.commit()
+        if not report['ok']:
+            audit.log(shop_id or 1, data.get('user_id'), 'LEDGER_REPAIR', 'customer_ledger', None,
+                      new_data={key: report[key] for key in ('wrong_entry_balances', 'wrong_customer_balances',
+                                                             'wrong_checkpoints')},
+                      notes='Ledger balances recomputed')
+    
+    return jsonify({'success': True, **report})
+
 # =====================================================
 # API ROUTES - AUDIT
 # =====================================================
@@ -943,34 +1281,22 @@ def sync_audit_logs():
     if not logs:
         return jsonify({'success': True, 'synced': 0})
     
-    conn = get_db()
-    cursor = conn.cursor()
+    if not isinstance(logs, list):
+        return jsonify({'error': 'logs must be a list'}), 400
+    try:
+        ingest = BulkIngest(get_db(), data.get('shop_id', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid shop_id'}), 400
     
-    synced = 0
-    for log in logs:
-        try:
-            cursor.execute('''
-                INSERT INTO audit_logs 
-                (shop_id, user_id, session_id, machine_id, action, entity_type,
-                 entity_id, old_data, new_data, notes, hash, previous_hash,
-                 signature, ip_address, user_agent, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                log.get('shop_id', 1), log.get('user_id'), log.get('sessionId'),
-                log.get('machineId'), log.get('action'), log.get('entityType'),
-                log.get('entityId'), json.dumps(log.get('oldData')),
-                json.dumps(log.get('newData')), log.get('notes'), log.get('hash'),
-                log.get('previousHash'), log.get('signature'),
-                log.get('ipAddress'), log.get('userAgent'), log.get('timestamp')
-            ))
-            synced += 1
-        except Exception as e:
-            logger.error(f'Error syncing audit log: {e}')
-    
-    conn.commit()
-    conn.close()
+    results = ingest.apply([{'table': 'audit_logs', 'action': 'INSERT', 'data': log} for log in logs])
+    summary = summarize(results)
     
-    return jsonify({'success': True, 'synced': synced})
+    return jsonify({
+        'success': True,
+        'synced': summary['inserted'],
+        'duplicates': summary['duplicate'],
+        'errors': summary['error']
+    })
 
 @app.route('/api/audit-logs', methods=['GET'])
 @require_auth
@@ -980,6 +1306,9 @@ def get_audit_logs():
     limit = request.args.get('limit', 100)
     action = request.args.get('action')
     
+    # Include entries still queued in the audit writer
+    audit.writer.flush(timeout=2.0)
+    
     conn = get_db()
     cursor = conn.cursor()
     
@@ -995,7 +1324,6 @@ def get_audit_logs():
     
     cursor.execute(query, params)
     logs = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     
     return jsonify({'success': True, 'logs': logs, 'count': len(logs)})
 
@@ -1004,24 +1332,52 @@ def get_audit_logs():
 # =====================================================
 
 @app.route('/api/sync/push', methods=['POST'])
+@require_auth
 def sync_push():
-    """Push offline data to server"""
+    """
+    Push offline data to server
+    
+    Body: {shop_id, user_id, records: [{table, action, data}]}
+    Tables: invoices (with nested items), invoice_items, customer_ledger, audit_logs
+    """
     data = request.json
     shop_id = data.get('shop_id', 1)
+    user_id = data.get('user_id')
+    records = data.get('records', [])
     
-    synced = 0
-    for record in data.get('records', []):
-        # Process based on table type
-        table = record.get('table')
-        action = record.get('action')
-        record_data = record.get('data')
-        
-        if table == 'invoices' and action == 'INSERT':
-            # Create invoice
-            # (Similar to create_invoice but for offline sync)
-            synced += 1
+    if not records:
+        return jsonify({'success': True, 'synced': 0, 'results': []})
+    
+    if not isinstance(records, list):
+        return jsonify({'error': 'records must be a list'}), 400
+    
+    conn = get_db()
+    try:
+        ingest = BulkIngest(conn, shop_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid shop_id'}), 400
+    
+    results = ingest.apply(records)
+    summary = summarize(results)
+    
+    # Offline sales took stock off like online ones: same cache update and alerts
+    for stock_shop_id, stock_changes in ingest.stock_changes.items():
+        catalog_cache.update_stock(stock_shop_id, stock_changes)
+        stock_watch.notify(conn, stock_shop_id, stock_changes)
     
-    return jsonify({'success': True, 'synced': synced})
+    audit.log(shop_id, user_id, 'SYNC_PUSH', 'sync', None,
+              new_data=summary, notes=f'Offline sync: {summary["inserted"]} of {len(records)} records applied')
+    
+    if summary['inserted']:
+        socketio.emit('sync_completed', {'shop_id': shop_id, **summary})
+    
+    return jsonify({
+        'success': summary['error'] == 0,
+        'synced': summary['inserted'],
+        'duplicates': summary['duplicate'],
+        'errors': summary['error'],
+        'results': results
+    })
 
 @app.route('/api/sync/status', methods=['GET'])
 def sync_status():
@@ -1039,7 +1395,6 @@ def sync_status():
     result = cursor.fetchone()
     pending = result['pending'] if result else 0
     
-    conn.close()
     
     return jsonify({
         'success': True,
@@ -1062,6 +1417,10 @@ def handle_disconnect():
     """Client disconnected"""
     logger.info('❌ Client disconnected')
 
+# Live scale/analyzer readings (namespace /hardware, see hardware_stream.py)
+hardware_hub = ShopReadingHubs()
+socketio.on_namespace(HardwareNamespace(socketio, hardware_hub))
+
 @socketio.on('sale_completed')
 def handle_sale(data):
     """Handle sale completion event"""
@@ -1091,20 +1450,87 @@ def serve_static(path):
 # HARDWARE INTEGRATION
 # =====================================================
 
+def emit_print_job(job):
+    """Tell the till when its receipt has printed (or given up)"""
+    socketio.emit('print_job', {
+        'job_id': job['id'],
+        'invoice_number': job['invoice_number'],
+        'status': job['status'],
+        'error': job.get('last_error')
+    })
+
+spooler = PrintSpooler(
+    get_pool,
+    open_printer(app.config['PRINTER_URI']),
+    ReceiptRenderer(columns=LINE_WIDTHS.get(app.config['PRINTER_PAPER_MM'], 32)),
+    on_done=emit_print_job
+)
+atexit.register(spooler.close)
+
 @app.route('/api/hardware/print', methods=['POST'])
 def print_receipt():
-    """Print receipt (placeholder for hardware integration)"""
-    data = request.json
+    """
+    Queue a receipt and return at once; the spooler prints in the background
+    Body: the invoice (invoice_number, items, totals, ...) or just invoice_number
+    to print the stored invoice; reprint: true prints an already printed one again
+    """
+    data = request.json or {}
+    if not data.get('invoice_number'):
+        return jsonify({'error': 'invoice_number is required'}), 400
+    
+    shop_id = int_param(data, 'shop_id', 1)
+    invoice = {key: value for key, value in data.items() if key not in ('shop_id', 'reprint')}
+    job, duplicate = spooler.submit(get_db(), shop_id, invoice, reprint=bool(data.get('reprint')))
     
-    # In production, integrate with actual printer
-    # For now, just log the print request
-    logger.info(f'🖨️  Print request: Invoice {data.get("invoice_number")}')
+    logger.info(f'🖨️  Print request: Invoice {job["invoice_number"]} (job {job["id"]}, {job["status"]})')
     
     return jsonify({
         'success': True,
-        'message': 'Print job queued',
-        'printer_status': 'ready'
-    })
+        'message': 'Print job already exists' if duplicate else 'Print job queued',
+        'job_id': job['id'],
+        'status': job['status'],
+        'duplicate': duplicate,
+        'printer_status': spooler.printer_status()
+    }), 200 if duplicate else 202
+
+@app.route('/api/hardware/print/<int:job_id>', methods=['GET'])
+def get_print_job(job_id):
+    """Status of one print job"""
+    job = spooler.get_job(get_db(), job_id)
+    if job is None:
+        return jsonify({'error': 'Print job not found'}), 404
+    
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/hardware/print', methods=['GET'])
+def get_print_jobs():
+    """Print jobs for a shop (filter by invoice_number or status)"""
+    shop_id = shop_arg()
+    invoice_number = request.args.get('invoice_number')
+    
+    if invoice_number:
+        job = spooler.find(get_db(), shop_id, invoice_number)
+        jobs = [job] if job else []
+    else:
+        jobs = spooler.list_jobs(get_db(), shop_id, request.args.get('status'),
+                                 min(max(int_param(request.args, 'limit', 50), 1), 500))
+    
+    return jsonify({'success': True, 'jobs': jobs, 'count': len(jobs)})
+
+@app.route('/api/hardware/readings', methods=['POST'])
+@require_auth
+def publish_reading():
+    """Publish a reading from a hardware bridge to /hardware stream clients"""
+    data = request.json or {}
+    topic = data.get('topic')
+    
+    if topic not in HARDWARE_TOPICS:
+        return jsonify({'error': f'topic must be one of {", ".join(HARDWARE_TOPICS)}'}), 400
+    
+    shop_id = str(data.get('shop_id', 1))
+    delivered = hardware_hub.publish(shop_id, topic, data.get('reading') or {})
+    
+    return jsonify({'success': True, 'subscribers': delivered})
 
 @app.route('/api/hardware/devices', methods=['GET'])
 def get_devices():
@@ -1116,7 +1542,6 @@ def get_devices():
     
     cursor.execute('SELECT * FROM hardware_devices WHERE shop_id = ?', (shop_id,))
     devices = [dict(row) for row in cursor.fetchall()]
-    conn.close()
     
     return jsonify({
         'success': True,
@@ -1135,6 +1560,11 @@ def health_check():
         'status': 'ok',
         'timestamp': datetime.now().isoformat(),
         'database': 'connected',
+        'db_pool': get_pool().status(),
+        'audit_writer': audit.writer.metrics(),
+        'hardware_stream': hardware_hub.status(),
+        'print_spooler': spooler.metrics(),
+        'catalog_cache': catalog_cache.status(),
         'version': '2.0.0'
     })
 
@@ -1150,6 +1580,23 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+@app.errorhandler(PageError)
+def bad_page(error):
+    return jsonify({'error': str(error)}), 400
+
+@app.errorhandler(ParamError)
+def bad_param(error):
+    return jsonify({'error': str(error)}), 400
+
+@app.errorhandler(ledger.TimestampError)
+def bad_timestamp(error):
+    return jsonify({'error': str(error)}), 400
+
+@app.errorhandler(PoolTimeout)
+def database_busy(error):
+    logger.warning(f'Database pool exhausted: {error}')
+    return jsonify({'error': 'Database busy, please retry'}), 503
+
 # =====================================================
 # MAIN
 # =====================================================
@@ -1158,6 +1605,9 @@ if __name__ == '__main__':
     # Initialize database
     init_db()
     
+    # Print receipts left queued by the last run
+    spooler.start()
+    
     logger.info("=" * 60)
     logger.info("🚀 MilkRecord POS Server Starting...")
     logger.info("=" * 60)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Shift Totals
+
+Running counters on each shift row, so closing a shift and the live
+"current shift" view read one row instead of summing its invoices.
+
+Money by payment mode:
+- cash:   CASH sales, plus what was paid at the counter on a CREDIT sale
+- upi:    UPI sales
+- credit: unpaid part of CREDIT sales (goes on the customer's udhar)
+- other:  any other mode (card, ...)
+
+Features:
+- Counters move in the same transaction as the invoice (or sync batch)
+  that changes them: one UPDATE ... FROM per call
+- Counted only for invoices whose shift belongs to the same shop
+- Litres sold from line items whose product unit is litres or ml
+- Reconciliation recomputes every counter from the invoices and can repair them
+- Shifts left open across the upgrade that added the counters are backfilled once
+
+Litres use the product's current unit: changing a product's unit later shows
+up as a litres mismatch in reconcile() until it is fixed.
+"""
+
+COUNTERS = ('cash_total', 'upi_total', 'credit_total', 'other_total', 'sales_total',
+            'invoice_count', 'item_count', 'litres_sold')
+
+# Money and litres: compare to two decimals
+TOLERANCE = 0.005
+
+IN_CHUNK = 500      # stay well below SQLITE_MAX_VARIABLE_NUMBER
+
+# schema_migrations row of the one-off counter backfill
+BACKFILL_MIGRATION = 'shift_totals_backfill'
+
+# Paid at the counter on a CREDIT sale (never more than the bill)
+_CREDIT_PAID = 'MIN(MAX(COALESCE(i.amount_paid, 0), 0), i.total)'
+
+# Counter values of one invoice `i`
+_INVOICE_VALUES = {
+    'cash_total': f"CASE UPPER(i.payment_mode) WHEN 'CASH' THEN i.total WHEN 'CREDIT' THEN {_CREDIT_PAID} ELSE 0 END",
+    'upi_total': "CASE UPPER(i.payment_mode) WHEN 'UPI' THEN i.total ELSE 0 END",
+    'credit_total': f"CASE UPPER(i.payment_mode) WHEN 'CREDIT' THEN i.total - {_CREDIT_PAID} ELSE 0 END",
+    'other_total': "CASE WHEN UPPER(i.payment_mode) IN ('CASH', 'UPI', 'CREDIT') THEN 0 ELSE i.total END",
+    'sales_total': 'i.total',
+    'invoice_count': '1'
+}
+
+# Litres in one unit of a product `p`
+LITRES_PER_UNIT = '''CASE LOWER(TRIM(p.unit))
+    WHEN 'l' THEN 1 WHEN 'ltr' THEN 1 WHEN 'litre' THEN 1 WHEN 'liter' THEN 1
+    WHEN 'litres' THEN 1 WHEN 'liters' THEN 1 WHEN 'ml' THEN 0.001 ELSE 0 END'''
+
+# Counter values of one line item `ii`
+_ITEM_VALUES = {
+    'item_count': '1',
+    'litres_sold': f'COALESCE(ii.quantity * {LITRES_PER_UNIT}, 0)'
+}
+
+_INVOICE_SUMS = ', '.join(f'SUM({expr}) AS {name}' for name, expr in _INVOICE_VALUES.items())
+_ITEM_SUMS = ', '.join(f'SUM({expr}) AS {name}' for name, expr in _ITEM_VALUES.items())
+
+_SHIFT_INVOICES = 'FROM invoices i JOIN shifts s ON s.id = i.shift_id AND s.shop_id = i.shop_id'
+_SHIFT_ITEMS = '''FROM invoice_items ii
+    JOIN invoices i ON i.id = ii.invoice_id
+    JOIN shifts s ON s.id = i.shift_id AND s.shop_id = i.shop_id
+    LEFT JOIN products p ON p.id = ii.product_id'''
+
+
+def _chunks(values, size=IN_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _add(conn, counters, totals_sql, ids):
+    """Add per-shift sums (one row per shift_id) to the stored counters"""
+    assignments = ', '.join(f'{name} = shifts.{name} + t.{name}' for name in counters)
+    for chunk in _chunks(ids):
+        conn.execute(f'''
+            UPDATE shifts SET {assignments}
+            FROM ({totals_sql.format(placeholders=', '.join('?' * len(chunk)))}) AS t
+            WHERE shifts.id = t.shift_id
+        ''', chunk)
+
+
+# =====================================================
+# INCREMENTAL UPDATES (inside the caller's transaction)
+# =====================================================
+
+def add_invoices(conn, invoice_ids):
+    """Count new invoices, with the line items they already have, in their shifts"""
+    if not invoice_ids:
+        return
+    _add(conn, _INVOICE_VALUES, f'''
+        SELECT i.shift_id, {_INVOICE_SUMS} {_SHIFT_INVOICES}
+        WHERE i.id IN ({{placeholders}}) GROUP BY i.shift_id
+    ''', invoice_ids)
+    _add(conn, _ITEM_VALUES, f'''
+        SELECT i.shift_id, {_ITEM_SUMS} {_SHIFT_ITEMS}
+        WHERE ii.invoice_id IN ({{placeholders}}) GROUP BY i.shift_id
+    ''', invoice_ids)
+
+
+def add_items(conn, item_ids):
+    """Count line items added to invoices that are already counted"""
+    if not item_ids:
+        return
+    _add(conn, _ITEM_VALUES, f'''
+        SELECT i.shift_id, {_ITEM_SUMS} {_SHIFT_ITEMS}
+        WHERE ii.id IN ({{placeholders}}) GROUP BY i.shift_id
+    ''', item_ids)
+
+
+# =====================================================
+# RECONCILE
+# =====================================================
+
+def recompute(conn, shop_id=None, shift_id=None, status=None):
+    """Counters of every matching shift summed from its invoices: {shift id: {counter: value}}"""
+    where, params = [], []
+    if status is not None:
+        where.append('s.status = ?')
+        params.append(status)
+    if shop_id is not None:
+        where.append('s.shop_id = ?')
+        params.append(shop_id)
+    if shift_id is not None:
+        where.append('s.id = ?')
+        params.append(shift_id)
+    clause = f" WHERE {' AND '.join(where)}" if where else ''
+
+    totals = {row[0]: dict.fromkeys(COUNTERS, 0) for row in
+              conn.execute(f'SELECT s.id FROM shifts s{clause}', params)}
+    for sql in (f'SELECT i.shift_id, {_INVOICE_SUMS} {_SHIFT_INVOICES}{clause} GROUP BY i.shift_id',
+                f'SELECT i.shift_id, {_ITEM_SUMS} {_SHIFT_ITEMS}{clause} GROUP BY i.shift_id'):
+        for row in conn.execute(sql, params):
+            totals[row[0]].update((key, row[key] or 0) for key in row.keys()[1:])
+    return totals
+
+
+def reconcile(conn, shop_id=None, shift_id=None, fix=False, sample=20, status=None):
+    """
+    Compare the stored counters with a full recompute from invoices and line items.
+    fix=True rewrites the shifts that are off (and expected_cash/variance of closed ones).
+    """
+    expected = recompute(conn, shop_id, shift_id, status)
+    wrong = []
+    for ids in _chunks(expected):
+        for row in conn.execute(f'''
+            SELECT id, {', '.join(COUNTERS)} FROM shifts WHERE id IN ({', '.join('?' * len(ids))})
+        ''', ids):
+            diff = {name: {'stored': row[name], 'expected': round(expected[row['id']][name], 2)}
+                    for name in COUNTERS
+                    if abs((row[name] or 0) - expected[row['id']][name]) >= TOLERANCE}
+            if diff:
+                wrong.append((row['id'], diff))
+
+    if fix:
+        conn.executemany(f'''
+            UPDATE shifts SET {', '.join(f'{name} = ?' for name in COUNTERS)} WHERE id = ?
+        ''', [(*(expected[sid][name] for name in COUNTERS), sid) for sid, _ in wrong])
+        conn.executemany('''
+            UPDATE shifts SET expected_cash = COALESCE(opening_cash, 0) + cash_total,
+                variance = closing_cash - (COALESCE(opening_cash, 0) + cash_total)
+            WHERE id = ? AND status = 'closed'
+        ''', [(sid,) for sid, _ in wrong])
+
+    return {
+        'ok': not wrong,
+        'shifts': len(expected),
+        'wrong_shifts': len(wrong),
+        'fixed': fix,
+        'samples': [{'shift_id': sid, 'counters': diff} for sid, diff in wrong[:sample]]
+    }
+
+
+
+def backfill(conn):
+    """
+    One-off fill of the counters of shifts still open when they were added (runs once per database)
+    Closed shifts keep the expected cash and variance they were closed with.
+    Returns the number of shifts rewritten
+    """
+    if not conn.execute('INSERT OR IGNORE INTO schema_migrations (name) VALUES (?)', (BACKFILL_MIGRATION,)).rowcount:
+        return 0
+    return reconcile(conn, fix=True, status='open')['wrong_shifts']
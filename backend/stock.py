@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Stock
+
+Sold quantities come off products.stock_qty inside the sale's transaction,
+for online sales and offline sync alike.
+
+Features:
+- One UPDATE ... FROM per call, however many lines and products
+- Quantities of the same product on several lines are summed first
+- Returns stock before and after, for low-stock alerts and the catalog cache
+"""
+
+
+def decrement_stock(conn, shop_id, items):
+    """
+    Take sold quantities off stock in one UPDATE ... FROM inside the caller's transaction
+    Returns the changed products with stock before and after the sale
+    """
+    sold = {}
+    for item in items:
+        if item.get('product_id'):
+            sold[int(item['product_id'])] = sold.get(int(item['product_id']), 0) + float(item['quantity'])
+    if not sold:
+        return []
+
+    rows = conn.execute(f'''
+        WITH sold(product_id, quantity) AS (VALUES {', '.join(['(?, ?)'] * len(sold))})
+        UPDATE products
+        SET stock_qty = stock_qty - sold.quantity, updated_at = CURRENT_TIMESTAMP
+        FROM sold
+        WHERE products.id = sold.product_id AND products.shop_id = ?
+        RETURNING products.id, products.name, products.stock_qty, products.min_stock
+    ''', [value for pair in sold.items() for value in pair] + [shop_id]).fetchall()
+
+    return [{'id': row['id'], 'name': row['name'], 'old_stock': row['stock_qty'] + sold[row['id']],
+             'stock_qty': row['stock_qty'], 'min_stock': row['min_stock']} for row in rows]
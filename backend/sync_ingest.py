@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord POS - Bulk Offline Sync Ingest
+
+Applies a backlog of offline records pushed by a counter in one pass.
+
+Features:
+- Records applied in batches, one transaction per batch
+- executemany for every table instead of per-row execute
+- Dedupe by client-side IDs (invoice_number for invoices, client_id otherwise)
+- Same side effects as the online endpoints (credit balances, ledger rows, shift totals,
+  stock decrement)
+- Fields are type-checked per record: a malformed record is reported as an
+  error on its own instead of failing the push
+- Per-record results so the client knows exactly what to drop from its queue
+"""
+
+import json
+import math
+import uuid
+import sqlite3
+import logging
+
+import ledger
+import shift_totals
+from stock import decrement_stock
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+IN_CHUNK = 500      # stay well below SQLITE_MAX_VARIABLE_NUMBER
+
+TABLE_ALIASES = {
+    'invoices': 'invoices',
+    'invoice_items': 'invoice_items',
+    'customer_ledger': 'customer_ledger',
+    'ledger': 'customer_ledger',
+    'audit_logs': 'audit_logs'
+}
+
+ITEM_FIELDS = ('product_name', 'quantity', 'unit_price', 'total')
+PRODUCT_NUMBERS = ('price', 'stock_qty', 'min_stock')
+
+# Apply order inside a batch: parents before children
+APPLY_ORDER = ('invoices', 'invoice_items', 'customer_ledger', 'audit_logs')
+
+
+def _chunks(values, size=IN_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _number(value):
+    if isinstance(value, bool):
+        raise TypeError(value)
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(value)
+    return number
+
+
+def _integer(value):
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    return int(value)
+
+
+def _text(value):
+    if not isinstance(value, (str, int, float)):
+        raise TypeError(value)
+    return str(value)
+
+
+def _timestamp(value):
+    return ledger.timestamp(_text(value))
+
+
+def _validate(data, required=(), numbers=(), integers=(), texts=(), timestamps=()):
+    """
+    Copy of a pushed record with its fields converted to the column types
+    Returns (record, error); error names the missing or malformed fields
+    """
+    if not isinstance(data, dict):
+        return data, 'Record data must be an object'
+    missing = [k for k in required if data.get(k) is None]
+    if missing:
+        return data, f"Missing fields: {', '.join(missing)}"
+
+    data = dict(data)
+    bad = []
+    for fields, convert in ((numbers, _number), (integers, _integer), (texts, _text), (timestamps, _timestamp)):
+        for key in fields:
+            if data.get(key) is not None:
+                try:
+                    data[key] = convert(data[key])
+                except (TypeError, ValueError, OverflowError):
+                    bad.append(key)
+    if bad:
+        return data, f"Invalid fields: {', '.join(bad)}"
+    return data, None
+
+
+def validate_invoice(data):
+    """Invoice with its nested line items validated (also used by POST /api/invoices)"""
+    data, error = _validate(
+        data, required=('invoice_number', 'total', 'payment_mode', 'amount_paid'),
+        numbers=('total', 'amount_paid', 'subtotal', 'discount', 'tax', 'change'),
+        integers=('shop_id', 'shift_id', 'customer_id'),
+        texts=('invoice_number', 'payment_mode', 'customer_name'),
+        timestamps=('created_at',))
+    if error:
+        return data, error
+
+    items = data.get('items')
+    if items is None:
+        items = []
+    if not isinstance(items, list):
+        return data, 'Invalid fields: items'
+    data['items'], errors = [], []
+    for i, item in enumerate(items):
+        item, error = _validate(item, required=ITEM_FIELDS, numbers=('quantity', 'unit_price', 'total'),
+                                integers=('product_id',), texts=('product_name',))
+        if error:
+            errors.append(f'{i}: {error}')
+        data['items'].append(item)
+    if errors:
+        return data, f"Invalid line items: {'; '.join(errors)}"
+    return data, None
+
+
+def validate_product(data):
+    """Product update body (PUT /api/products/<id>): numbers sent must be numbers, not null"""
+    data, error = _validate(data, numbers=PRODUCT_NUMBERS,
+                            texts=('name', 'category', 'unit', 'barcode'))
+    if error:
+        return data, error
+    nulls = [k for k in PRODUCT_NUMBERS if k in data and data[k] is None]
+    if nulls:
+        return data, f"Invalid fields: {', '.join(nulls)}"
+    return data, None
+
+
+def _existing(cursor, table, column, keys, value='id'):
+    """Map key -> id (or another column) for keys already present in table"""
+    found = {}
+    for chunk in _chunks(set(keys)):
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(
+            f'SELECT {column}, {value} FROM {table} WHERE {column} IN ({placeholders})',
+            chunk
+        )
+        found.update({row[0]: row[1] for row in cursor.fetchall()})
+    return found
+
+
+def _audit_client_id(log):
+    return log.get('client_id') or log.get('id') or log.get('audit_id') or log.get('hash')
+
+
+# Audit entry fields stored as plain columns (oldData/newData are stored as JSON)
+AUDIT_TEXT_FIELDS = ('client_id', 'id', 'audit_id', 'hash', 'action', 'notes', 'signature',
+                     'sessionId', 'session_id', 'machineId', 'machine_id', 'device_id',
+                     'entityType', 'entity_type', 'entityId', 'entity_id', 'previousHash', 'previous_hash',
+                     'ipAddress', 'ip_address', 'userAgent', 'user_agent', 'timestamp', 'created_at')
+
+
+def _audit_row(log, shop_id):
+    """Map a client-side audit entry (camelCase or snake_case) to an audit_logs row"""
+    def pick(*keys):
+        for key in keys:
+            if log.get(key) is not None:
+                return log.get(key)
+        return None
+
+    old_data = pick('oldData', 'old_data')
+    new_data = pick('newData', 'new_data')
+    return (
+        log.get('shop_id') or shop_id, log.get('user_id'),
+        pick('sessionId', 'session_id') or str(uuid.uuid4()),
+        pick('machineId', 'machine_id', 'device_id'), log.get('action'),
+        pick('entityType', 'entity_type'), pick('entityId', 'entity_id'),
+        json.dumps(old_data) if old_data is not None else None,
+        json.dumps(new_data) if new_data is not None else None,
+        log.get('notes'), log.get('hash'), pick('previousHash', 'previous_hash'),
+        log.get('signature'), pick('ipAddress', 'ip_address'),
+        pick('userAgent', 'user_agent'), pick('timestamp', 'created_at'),
+        _audit_client_id(log)
+    )
+
+
+AUDIT_INSERT = '''
+    INSERT INTO audit_logs
+    (shop_id, user_id, session_id, machine_id, action, entity_type,
+     entity_id, old_data, new_data, notes, hash, previous_hash,
+     signature, ip_address, user_agent, created_at, client_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)
+'''
+
+
+class BulkIngest:
+    """
+    Applies pushed offline records against one connection
+
+    Usage:
+        ingest = BulkIngest(conn, shop_id)
+        results = ingest.apply(records)
+        ingest.stock_changes    # {shop_id: committed stock changes}, as decrement_stock returns them
+    """
+
+    def __init__(self, conn, shop_id=1, batch_size=BATCH_SIZE):
+        """shop_id must be an integer (ValueError otherwise)"""
+        self.conn = conn
+        self.shop_id = _integer(shop_id)
+        self.batch_size = batch_size
+        self.stock_changes = {}
+        self._sold = {}
+
+    def apply(self, records):
+        """Apply records in batches, returns per-record results in input order"""
+        results = [None] * len(records)
+
+        for start in range(0, len(records), self.batch_size):
+            batch = list(enumerate(records[start:start + self.batch_size], start))
+            self._apply_batch(batch, results)
+
+        return results
+
+    def _apply_batch(self, batch, results):
+        grouped = {table: [] for table in APPLY_ORDER}
+
+        for index, record in batch:
+            if not isinstance(record, dict):
+                results[index] = {'table': None, 'client_id': None, 'status': 'error',
+                                  'error': 'Record must be an object'}
+                continue
+            table = TABLE_ALIASES.get(record.get('table'))
+            action = str(record.get('action') or 'INSERT').upper()
+            data = record.get('data') or {}
+
+            if not isinstance(data, dict):
+                results[index] = self._result(record, 'error', 'Record data must be an object')
+            elif table is None:
+                results[index] = self._result(record, 'error', f"Unsupported table: {record.get('table')}")
+            elif action != 'INSERT':
+                results[index] = self._result(record, 'error', f'Unsupported action: {action}')
+            else:
+                grouped[table].append((index, data))
+
+        cursor = self.conn.cursor()
+        self._sold = {}
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            self._apply_invoices(cursor, grouped['invoices'], results)
+            self._apply_invoice_items(cursor, grouped['invoice_items'], results)
+            self._apply_ledger(cursor, grouped['customer_ledger'], results)
+            self._apply_audit_logs(cursor, grouped['audit_logs'], results)
+            # Sold lines of the whole batch come off stock, one UPDATE per shop
+            changes = {shop_id: decrement_stock(self.conn, shop_id, items)
+                       for shop_id, items in self._sold.items()}
+            self.conn.commit()
+            for shop_id, shop_changes in changes.items():
+                self.stock_changes.setdefault(shop_id, []).extend(shop_changes)
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            # Anything the per-record checks let through fails the batch, never the push
+            self.conn.rollback()
+            logger.error(f'Sync batch rolled back: {e}')
+            for index, record in batch:
+                results[index] = self._result(record, 'error', f'Batch failed: {e}')
+
+    def _shop(self, data):
+        """Shop a record belongs to (the push's shop unless the record names one)"""
+        return data.get('shop_id') or self.shop_id
+
+    @staticmethod
+    def _result(record, status, error):
+        data = record.get('data')
+        data = data if isinstance(data, dict) else {}
+        return {
+            'table': record.get('table'),
+            'client_id': data.get('client_id') or data.get('invoice_number'),
+            'status': status,
+            'error': error
+        }
+
+    # -------------------------------------------------
+    # Invoices (+ nested items, credit ledger rows)
+    # -------------------------------------------------
+
+    def _apply_invoices(self, cursor, rows, results):
+        valid = []
+        seen = set()
+
+        for index, data in rows:
+            data, error = validate_invoice(data)
+            if error:
+                results[index] = {'table': 'invoices', 'client_id': data.get('invoice_number'),
+                                  'status': 'error', 'error': error}
+            elif data['invoice_number'] in seen:
+                results[index] = {'table': 'invoices', 'client_id': data['invoice_number'],
+                                  'status': 'duplicate'}
+            else:
+                seen.add(data['invoice_number'])
+                valid.append((index, data))
+
+        if not valid:
+            return
+
+        existing = _existing(cursor, 'invoices', 'invoice_number', seen)
+        owners = _existing(cursor, 'invoices', 'invoice_number', existing, value='shop_id')
+        new = [(index, data) for index, data in valid if data['invoice_number'] not in existing]
+
+        cursor.executemany('''
+            INSERT INTO invoices
+            (shop_id, shift_id, invoice_number, customer_id, customer_name,
+             subtotal, discount, tax, total, payment_mode, amount_paid, change,
+             created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', [(
+            self._shop(data), data.get('shift_id'), data['invoice_number'],
+            data.get('customer_id'), data.get('customer_name', 'Walking Customer'),
+            data.get('subtotal', data['total']), data.get('discount', 0),
+            data.get('tax', 0), data['total'], data['payment_mode'],
+            data['amount_paid'], data.get('change', 0), data.get('created_at')
+        ) for _, data in new])
+
+        inserted = _existing(cursor, 'invoices', 'invoice_number',
+                             [data['invoice_number'] for _, data in new])
+
+        for index, data in valid:
+            number = data['invoice_number']
+            if number in existing and owners[number] != self._shop(data):
+                # Another shop's invoice: not stored, and its id is not ours to report
+                results[index] = {'table': 'invoices', 'client_id': number,
+                                  'status': 'error', 'error': 'Invoice number already used'}
+            elif number in existing:
+                results[index] = {'table': 'invoices', 'client_id': number,
+                                  'status': 'duplicate', 'id': existing[number]}
+            else:
+                results[index] = {'table': 'invoices', 'client_id': number,
+                                  'status': 'inserted', 'id': inserted[number]}
+
+        # Nested line items
+        cursor.executemany('''
+            INSERT INTO invoice_items
+            (invoice_id, product_id, product_name, quantity, unit_price, total)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(
+            inserted[data['invoice_number']], item.get('product_id'), item['product_name'],
+            item['quantity'], item['unit_price'], item['total']
+        ) for _, data in new for item in data.get('items', [])])
+
+        shift_totals.add_invoices(cursor.connection, [inserted[data['invoice_number']] for _, data in new])
+
+        for _, data in new:
+            self._sold.setdefault(self._shop(data), []).extend(data.get('items', []))
+
+        # Credit sales move the customer balance, same as create_invoice
+        ledger.record(cursor.connection, [
+            entry
+            for _, data in new
+            if data['payment_mode'] == 'CREDIT' and data.get('customer_id')
+            for entry in ledger.credit_sale(
+                data['customer_id'], self._shop(data), inserted[data['invoice_number']],
+                data['invoice_number'], data['total'], data['amount_paid'], data.get('created_at'))
+        ])
+
+    def _apply_invoice_items(self, cursor, rows, results):
+        valid = []
+        seen = set()
+
+        for index, data in rows:
+            data, error = _validate(data, required=('client_id', 'invoice_number', *ITEM_FIELDS),
+                                    numbers=('quantity', 'unit_price', 'total'), integers=('product_id',),
+                                    texts=('client_id', 'invoice_number', 'product_name'))
+            if error:
+                results[index] = {'table': 'invoice_items', 'client_id': data.get('client_id'),
+                                  'status': 'error', 'error': error}
+            elif data['client_id'] in seen:
+                results[index] = {'table': 'invoice_items', 'client_id': data['client_id'],
+                                  'status': 'duplicate'}
+            else:
+                seen.add(data['client_id'])
+                valid.append((index, data))
+
+        if not valid:
+            return
+
+        existing = _existing(cursor, 'invoice_items', 'client_id', seen)
+        invoices = _existing(cursor, 'invoices', 'invoice_number',
+                             [data['invoice_number'] for _, data in valid])
+
+        new = []
+        for index, data in valid:
+            client_id = data['client_id']
+            if client_id in existing:
+                results[index] = {'table': 'invoice_items', 'client_id': client_id,
+                                  'status': 'duplicate', 'id': existing[client_id]}
+            elif data['invoice_number'] not in invoices:
+                results[index] = {'table': 'invoice_items', 'client_id': client_id,
+                                  'status': 'error', 'error': f"Unknown invoice {data['invoice_number']}"}
+            else:
+                new.append((index, data))
+
+        cursor.executemany('''
+            INSERT INTO invoice_items
+            (invoice_id, product_id, product_name, quantity, unit_price, total, client_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            invoices[data['invoice_number']], data.get('product_id'), data['product_name'],
+            data['quantity'], data['unit_price'], data['total'], data['client_id']
+        ) for _, data in new])
+
+        inserted = _existing(cursor, 'invoice_items', 'client_id', [data['client_id'] for _, data in new])
+        shift_totals.add_items(cursor.connection, list(inserted.values()))
+
+        # Stock comes off in the shop of the invoice the line belongs to
+        shops = {}
+        for chunk in _chunks({invoices[data['invoice_number']] for _, data in new}):
+            cursor.execute(f"SELECT id, shop_id FROM invoices WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            shops.update({row[0]: row[1] for row in cursor.fetchall()})
+        for _, data in new:
+            self._sold.setdefault(shops[invoices[data['invoice_number']]], []).append(data)
+        for index, data in new:
+            results[index] = {'table': 'invoice_items', 'client_id': data['client_id'],
+                              'status': 'inserted', 'id': inserted[data['client_id']]}
+
+    # -------------------------------------------------
+    # Customer ledger
+    # -------------------------------------------------
+
+    def _apply_ledger(self, cursor, rows, results):
+        valid = []
+        seen = set()
+
+        for index, data in rows:
+            data, error = _validate(data, required=('client_id', 'customer_id', 'transaction_type', 'amount'),
+                                    numbers=('amount',), integers=('customer_id', 'shop_id', 'reference_id'),
+                                    texts=('client_id', 'transaction_type', 'reference_type', 'notes'),
+                                    timestamps=('created_at',))
+            if error:
+                results[index] = {'table': 'customer_ledger', 'client_id': data.get('client_id'),
+                                  'status': 'error', 'error': error}
+            elif data['transaction_type'] not in ('credit', 'debit'):
+                results[index] = {'table': 'customer_ledger', 'client_id': data['client_id'],
+                                  'status': 'error', 'error': f"Invalid transaction_type: {data['transaction_type']}"}
+            elif data['client_id'] in seen:
+                results[index] = {'table': 'customer_ledger', 'client_id': data['client_id'],
+                                  'status': 'duplicate'}
+            else:
+                seen.add(data['client_id'])
+                valid.append((index, data))
+
+        if not valid:
+            return
+
+        existing = _existing(cursor, 'customer_ledger', 'client_id', seen)
+        new = []
+        for index, data in valid:
+            if data['client_id'] in existing:
+                results[index] = {'table': 'customer_ledger', 'client_id': data['client_id'],
+                                  'status': 'duplicate', 'id': existing[data['client_id']]}
+            else:
+                new.append((index, data))
+
+        # Same sign convention as add_ledger_entry (ledger.py)
+        ledger.record(cursor.connection, [{
+            'customer_id': data['customer_id'],
+            'shop_id': self._shop(data),
+            'transaction_type': data['transaction_type'],
+            'amount': data['amount'],
+            'reference_type': data.get('reference_type'),
+            'reference_id': data.get('reference_id'),
+            'notes': data.get('notes', ''),
+            'created_at': data.get('created_at'),
+            'client_id': data['client_id']
+        } for _, data in new])
+
+        inserted = _existing(cursor, 'customer_ledger', 'client_id', [data['client_id'] for _, data in new])
+        for index, data in new:
+            results[index] = {'table': 'customer_ledger', 'client_id': data['client_id'],
+                              'status': 'inserted', 'id': inserted[data['client_id']]}
+
+    # -------------------------------------------------
+    # Audit logs
+    # -------------------------------------------------
+
+    def _apply_audit_logs(self, cursor, rows, results):
+        valid = []
+        seen = set()
+
+        for index, log in rows:
+            log, error = _validate(log, required=('action',), integers=('shop_id', 'user_id'),
+                                   texts=AUDIT_TEXT_FIELDS)
+            client_id = _audit_client_id(log)
+            if error:
+                results[index] = {'table': 'audit_logs', 'client_id': client_id,
+                                  'status': 'error', 'error': error}
+            elif client_id is not None and client_id in seen:
+                results[index] = {'table': 'audit_logs', 'client_id': client_id,
+                                  'status': 'duplicate'}
+            else:
+                if client_id is not None:
+                    seen.add(client_id)
+                valid.append((index, log))
+
+        if not valid:
+            return
+
+        existing = _existing(cursor, 'audit_logs', 'client_id', seen)
+        new = [(index, log) for index, log in valid if _audit_client_id(log) not in existing]
+
+        cursor.executemany(AUDIT_INSERT, [_audit_row(log, self.shop_id) for _, log in new])
+
+        for index, log in valid:
+            client_id = _audit_client_id(log)
+            if client_id in existing:
+                results[index] = {'table': 'audit_logs', 'client_id': client_id,
+                                  'status': 'duplicate', 'id': existing[client_id]}
+            else:
+                results[index] = {'table': 'audit_logs', 'client_id': client_id, 'status': 'inserted'}
+
+
+def summarize(results):
+    """Count results by status"""
+    summary = {'inserted': 0, 'duplicate': 0, 'error': 0}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Backend modules import each other by name (python backend/server.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,93 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+import ledger
+
+SHOP_ID = 1
+
+# Tables ledger.py works on, as init_db creates them
+SCHEMA = '''
+    CREATE TABLE customers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        shop_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        balance REAL DEFAULT 0.0
+    );
+    CREATE TABLE customer_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        balance REAL NOT NULL,
+        reference_type TEXT,
+        reference_id INTEGER,
+        notes TEXT,
+        client_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE ledger_checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        shop_id INTEGER NOT NULL,
+        customer_id INTEGER NOT NULL,
+        as_of TIMESTAMP NOT NULL,
+        balance REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE UNIQUE INDEX idx_ledger_checkpoints_customer ON ledger_checkpoints(customer_id, as_of);
+'''
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT INTO customers (shop_id, name) VALUES (?, 'Ramesh')", (SHOP_ID,))
+    yield conn
+    conn.close()
+
+
+def debit(conn, amount, created_at=None):
+    ledger.record(conn, [{'customer_id': 1, 'shop_id': SHOP_ID, 'transaction_type': ledger.DEBIT,
+                          'amount': amount, 'created_at': created_at}])
+    conn.commit()
+
+
+def test_same_day_checkpoint_then_new_entry(conn):
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    debit(conn, 100)
+    ledger.checkpoint(conn, SHOP_ID, today)
+    debit(conn, 50)
+
+    assert ledger.balance_as_of(conn, 1, today)['balance'] == 150
+    assert ledger.verify(conn, SHOP_ID)['ok']
+
+
+def test_entry_on_a_closed_day_drops_the_checkpoint(conn):
+    debit(conn, 100, '2026-01-10 10:00:00')
+    ledger.checkpoint(conn, SHOP_ID, '2026-01-31')
+    # Offline entry after the customer's latest one, but before the close
+    debit(conn, 40, '2026-01-20 09:00:00')
+
+    assert ledger.balance_as_of(conn, 1, '2026-01-31')['balance'] == 140
+    assert ledger.verify(conn, SHOP_ID)['ok']
+
+
+def test_checkpoint_before_an_entry_is_kept(conn):
+    debit(conn, 100, '2026-01-10 10:00:00')
+    ledger.checkpoint(conn, SHOP_ID, '2026-01-31')
+    debit(conn, 50, '2026-02-02 10:00:00')
+
+    result = ledger.balance_as_of(conn, 1, '2026-02-28')
+    assert result['balance'] == 150
+    assert result['checkpoint'] == '2026-01-31 23:59:59'
+
+
+def test_timestamp_converts_offsets_to_utc():
+    assert ledger.timestamp('2026-01-07T10:00:00+05:30') == '2026-01-07 04:30:00'
+    assert ledger.timestamp('2026-01-07', end_of_day=True) == '2026-01-07 23:59:59'
+    with pytest.raises(ledger.TimestampError):
+        ledger.timestamp('yesterday')
@@ -0,0 +1,20 @@
+import pytest
+
+from pagination import PageError, make_cursor, parse_cursor
+
+
+def test_cursor_round_trip():
+    row = {'created_at': '2026-01-07 10:00:00', 'id': 42}
+    assert parse_cursor(make_cursor(row)) == ('2026-01-07 10:00:00', 42)
+
+
+@pytest.mark.parametrize('after', [
+    'garbage,1',
+    '2026-01-07 10:00:00,abc',
+    '2026-01-07 10:00:00,5,1',
+    ',1',
+    '2026-01-07 10:00:00'
+])
+def test_malformed_cursor_is_rejected(after):
+    with pytest.raises(PageError):
+        parse_cursor(after)
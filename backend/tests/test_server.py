@@ -0,0 +1,89 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_socketio')
+pytest.importorskip('flask_cors')
+
+import server  # noqa: E402
+
+AUTH = {'Authorization': 'Bearer test'}
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    server.app.config['DATABASE'] = str(tmp_path_factory.mktemp('db') / 'milkrecord.db')
+    server.app.extensions.pop('db_pool', None)
+    server.init_db()
+    yield server.app.test_client()
+    server.get_pool().close_all()
+    server.app.extensions.pop('db_pool', None)
+
+
+# Ledger
+
+def test_ledger_statements_rejects_bad_shop_id(client):
+    response = client.get('/api/ledger/statements?shop_id=abc&from=2026-01-01&to=2026-01-31')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'shop_id must be an integer'
+
+
+def test_ledger_checkpoint_rejects_bad_shop_id(client):
+    response = client.post('/api/ledger/checkpoints', json={'shop_id': 'abc', 'as_of': '2026-01-31'},
+                           headers=AUTH)
+    assert response.status_code == 400
+
+
+def test_ledger_verify_rejects_bad_shop_id(client):
+    response = client.post('/api/ledger/verify', json={'shop_id': 'abc'}, headers=AUTH)
+    assert response.status_code == 400
+
+
+def test_ledger_verify_without_shop_checks_every_shop(client):
+    response = client.post('/api/ledger/verify', json={}, headers=AUTH)
+    assert response.status_code == 200
+    assert response.get_json()['ok']
+
+
+# Print spooler
+
+def test_print_rejects_bad_shop_id(client):
+    response = client.post('/api/hardware/print', json={'shop_id': 'abc', 'invoice_number': 'INV-1'},
+                           headers=AUTH)
+    assert response.status_code == 400
+
+
+def test_print_jobs_rejects_bad_shop_id_and_limit(client):
+    assert client.get('/api/hardware/print?shop_id=abc').status_code == 400
+    assert client.get('/api/hardware/print?limit=abc').status_code == 400
+
+
+def test_print_jobs_negative_limit_returns_one_job(client):
+    for number in ('INV-LIMIT-1', 'INV-LIMIT-2'):
+        client.post('/api/hardware/print', json={'invoice_number': number}, headers=AUTH)
+    response = client.get('/api/hardware/print?limit=-1')
+    assert response.status_code == 200
+    assert response.get_json()['count'] == 1
+
+
+# Shifts
+
+def test_reconcile_shifts_rejects_bad_ids(client):
+    for body in ({'shop_id': 'abc'}, {'shift_id': 'abc'}):
+        response = client.post('/api/shifts/reconcile', json=body, headers=AUTH)
+        assert response.status_code == 400
+
+
+def test_create_shift_rejects_non_numeric_opening_cash(client):
+    response = client.post('/api/shifts', json={'shift_id': 'S-1', 'shift_type': 'morning', 'opening_cash': None},
+                           headers=AUTH)
+    assert response.status_code == 400
+
+
+# Lists and exports
+
+def test_products_export_rejects_bad_shop_id(client):
+    assert client.get('/api/products/export?shop_id=abc').status_code == 400
+
+
+def test_invoices_reject_forged_cursor(client):
+    assert client.get('/api/invoices?after=garbage,1').status_code == 400
@@ -0,0 +1,252 @@
+-- ============================================
+-- MilkRecord POS - Daily Summary Rollup
+-- One precomputed row per shop per date for GET /api/analytics/daily-summary
+-- Maintained incrementally by triggers, rebuilt in bulk by rebuild_daily_summary()
+-- ============================================
+
+-- ============================================
+-- 1. ROLLUP TABLE
+-- ============================================
+CREATE TABLE IF NOT EXISTS daily_summary (
+    shop_id UUID REFERENCES shops(id) ON DELETE CASCADE,
+    shop_key UUID GENERATED ALWAYS AS (COALESCE(shop_id, '00000000-0000-0000-0000-000000000000'::UUID)) STORED,
+    summary_date DATE NOT NULL,
+
+    -- From closed shifts
+    milk_collected DECIMAL(12,2) DEFAULT 0,
+    milk_cost DECIMAL(12,2) DEFAULT 0,         -- sum of milk_collections.amount for the shift
+    shifts_closed INTEGER DEFAULT 0,
+
+    -- From conversion batches
+    milk_converted DECIMAL(12,2) DEFAULT 0,
+    products_produced DECIMAL(12,2) DEFAULT 0,
+    batches INTEGER DEFAULT 0,
+
+    -- From sales
+    revenue DECIMAL(12,2) DEFAULT 0,
+    sales_count INTEGER DEFAULT 0,
+
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+
+    PRIMARY KEY (shop_key, summary_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_summary_date ON daily_summary(summary_date);
+
+-- ============================================
+-- 2. INCREMENTAL UPDATES
+-- ============================================
+-- Atomic add-to-row, creates the row on first use
+CREATE OR REPLACE FUNCTION daily_summary_add(
+    p_shop_id UUID,
+    p_date DATE,
+    p_milk_collected NUMERIC DEFAULT 0,
+    p_milk_cost NUMERIC DEFAULT 0,
+    p_shifts_closed INTEGER DEFAULT 0,
+    p_milk_converted NUMERIC DEFAULT 0,
+    p_products_produced NUMERIC DEFAULT 0,
+    p_batches INTEGER DEFAULT 0,
+    p_revenue NUMERIC DEFAULT 0,
+    p_sales_count INTEGER DEFAULT 0
+)
+RETURNS VOID AS $$
+BEGIN
+    IF p_date IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO daily_summary (shop_id, summary_date, milk_collected, milk_cost, shifts_closed,
+                               milk_converted, products_produced, batches, revenue, sales_count)
+    VALUES (p_shop_id, p_date, p_milk_collected, p_milk_cost, p_shifts_closed,
+            p_milk_converted, p_products_produced, p_batches, p_revenue, p_sales_count)
+    ON CONFLICT (shop_key, summary_date) DO UPDATE SET
+        milk_collected = daily_summary.milk_collected + EXCLUDED.milk_collected,
+        milk_cost = daily_summary.milk_cost + EXCLUDED.milk_cost,
+        shifts_closed = daily_summary.shifts_closed + EXCLUDED.shifts_closed,
+        milk_converted = daily_summary.milk_converted + EXCLUDED.milk_converted,
+        products_produced = daily_summary.products_produced + EXCLUDED.products_produced,
+        batches = daily_summary.batches + EXCLUDED.batches,
+        revenue = daily_summary.revenue + EXCLUDED.revenue,
+        sales_count = daily_summary.sales_count + EXCLUDED.sales_count,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Milk purchase cost of one shift (replaces the hard-coded 64/litre estimate)
+CREATE OR REPLACE FUNCTION shift_milk_cost(p_shop_id UUID, p_date DATE, p_shift_name TEXT)
+RETURNS NUMERIC AS $$
+    SELECT COALESCE(sum(amount), 0)
+    FROM milk_collections
+    WHERE shop_id IS NOT DISTINCT FROM p_shop_id
+      AND collection_date = p_date
+      AND lower(shift) = lower(p_shift_name);
+$$ LANGUAGE sql STABLE;
+
+-- Shift close (open -> closed / reconciled), counted exactly once
+CREATE OR REPLACE FUNCTION daily_summary_on_shift_close()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF OLD.status = 'open' AND NEW.status IN ('closed', 'reconciled') THEN
+        PERFORM daily_summary_add(
+            NEW.shop_id, NEW.shift_date,
+            p_milk_collected => COALESCE(NEW.total_milk_collected, 0),
+            p_milk_cost => shift_milk_cost(NEW.shop_id, NEW.shift_date, NEW.shift_name),
+            p_shifts_closed => 1
+        );
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_daily_summary_shift_close ON shifts;
+CREATE TRIGGER trg_daily_summary_shift_close AFTER UPDATE OF status ON shifts
+    FOR EACH ROW EXECUTE FUNCTION daily_summary_on_shift_close();
+
+-- Conversion batches: insert adds, delete subtracts, update does both
+CREATE OR REPLACE FUNCTION daily_summary_on_conversion_batch()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM daily_summary_add(
+            OLD.shop_id, OLD.created_at::DATE,
+            p_milk_converted => -COALESCE(OLD.milk_quantity_total, 0),
+            p_products_produced => -COALESCE(OLD.product_quantity, 0),
+            p_batches => -1
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM daily_summary_add(
+            NEW.shop_id, NEW.created_at::DATE,
+            p_milk_converted => COALESCE(NEW.milk_quantity_total, 0),
+            p_products_produced => COALESCE(NEW.product_quantity, 0),
+            p_batches => 1
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_daily_summary_conversion_batch ON conversion_batches;
+CREATE TRIGGER trg_daily_summary_conversion_batch AFTER INSERT OR UPDATE OR DELETE ON conversion_batches
+    FOR EACH ROW EXECUTE FUNCTION daily_summary_on_conversion_batch();
+
+-- Sales: every write path (web, desktop sync upserts) goes through here
+CREATE OR REPLACE FUNCTION daily_summary_on_sale()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM daily_summary_add(
+            OLD.shop_id, OLD.sale_date::DATE,
+            p_revenue => -COALESCE(OLD.total_amount, 0),
+            p_sales_count => -1
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM daily_summary_add(
+            NEW.shop_id, NEW.sale_date::DATE,
+            p_revenue => COALESCE(NEW.total_amount, 0),
+            p_sales_count => 1
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_daily_summary_sale ON sales;
+CREATE TRIGGER trg_daily_summary_sale AFTER INSERT OR DELETE OR UPDATE OF shop_id, sale_date, total_amount ON sales
+    FOR EACH ROW EXECUTE FUNCTION daily_summary_on_sale();
+
+-- ============================================
+-- 3. BACKFILL
+-- ============================================
+-- Rebuild rollups for a date range (and optionally one shop) in bulk.
+-- Takes a lock that makes concurrent trigger updates wait until the rebuild commits.
+CREATE OR REPLACE FUNCTION rebuild_daily_summary(
+    p_from DATE,
+    p_to DATE,
+    p_shop_id UUID DEFAULT NULL
+)
+RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    LOCK TABLE daily_summary IN SHARE ROW EXCLUSIVE MODE;
+
+    DELETE FROM daily_summary
+    WHERE summary_date BETWEEN p_from AND p_to
+      AND (p_shop_id IS NULL OR shop_id = p_shop_id);
+
+    INSERT INTO daily_summary (shop_id, summary_date, milk_collected, milk_cost, shifts_closed,
+                               milk_converted, products_produced, batches, revenue, sales_count)
+    SELECT shop_id, summary_date,
+           sum(milk_collected), sum(milk_cost), sum(shifts_closed),
+           sum(milk_converted), sum(products_produced), sum(batches),
+           sum(revenue), sum(sales_count)
+    FROM (
+        SELECT s.shop_id, s.shift_date AS summary_date,
+               COALESCE(s.total_milk_collected, 0) AS milk_collected,
+               shift_milk_cost(s.shop_id, s.shift_date, s.shift_name) AS milk_cost,
+               1 AS shifts_closed,
+               0 AS milk_converted, 0 AS products_produced, 0 AS batches,
+               0 AS revenue, 0 AS sales_count
+        FROM shifts s
+        WHERE s.status IN ('closed', 'reconciled')
+          AND s.shift_date BETWEEN p_from AND p_to
+          AND (p_shop_id IS NULL OR s.shop_id = p_shop_id)
+
+        UNION ALL
+
+        SELECT b.shop_id, b.created_at::DATE,
+               0, 0, 0,
+               COALESCE(b.milk_quantity_total, 0), COALESCE(b.product_quantity, 0), 1,
+               0, 0
+        FROM conversion_batches b
+        WHERE b.created_at >= p_from AND b.created_at < p_to + 1
+          AND (p_shop_id IS NULL OR b.shop_id = p_shop_id)
+
+        UNION ALL
+
+        SELECT sa.shop_id, sa.sale_date::DATE,
+               0, 0, 0,
+               0, 0, 0,
+               COALESCE(sa.total_amount, 0), 1
+        FROM sales sa
+        WHERE sa.sale_date >= p_from AND sa.sale_date < p_to + 1
+          AND (p_shop_id IS NULL OR sa.shop_id = p_shop_id)
+    ) contributions
+    GROUP BY shop_id, summary_date;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- RLS
+-- ============================================
+
+ALTER TABLE daily_summary ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Enable all access for daily_summary" ON daily_summary;
+CREATE POLICY "Enable all access for daily_summary" ON daily_summary FOR ALL USING (true) WITH CHECK (true);
+
+-- ============================================
+-- INITIAL BACKFILL
+-- ============================================
+
+SELECT rebuild_daily_summary(
+    LEAST(
+        (SELECT min(shift_date) FROM shifts),
+        (SELECT min(created_at)::DATE FROM conversion_batches),
+        (SELECT min(sale_date)::DATE FROM sales),
+        CURRENT_DATE
+    ),
+    CURRENT_DATE
+) AS rows_rebuilt;
+
+-- ============================================
+-- VERIFICATION
+-- ============================================
+
+SELECT
+    '✅ Daily Summary Rollup Deployed' as status,
+    (SELECT count(*) FROM daily_summary) as rollup_rows;
@@ -0,0 +1,176 @@
+-- ============================================
+-- MilkRecord POS - Farmer Rankings Aggregation
+-- Quality rankings computed in Postgres, only top-N rows leave the database
+-- Used by GET /api/analytics/farmer-rankings (api_reconciliation.py)
+-- ============================================
+
+-- ============================================
+-- 1. INDEX FOR WINDOWED SCANS
+-- ============================================
+-- Covers the raw-row part of the ranking (edge months, current month)
+CREATE INDEX IF NOT EXISTS idx_collections_shop_date_quality
+    ON milk_collections(shop_id, collection_date)
+    INCLUDE (farmer_id, farmer_name, quantity, fat, snf);
+
+-- ============================================
+-- 2. MONTHLY ROLLUP (MATERIALIZED VIEW)
+-- ============================================
+-- One row per shop / farmer / month, complete months only.
+-- Years of twice-daily entries collapse to ~12 rows per farmer per year.
+DROP MATERIALIZED VIEW IF EXISTS farmer_quality_monthly;
+
+CREATE MATERIALIZED VIEW farmer_quality_monthly AS
+SELECT
+    shop_id,
+    farmer_id,
+    date_trunc('month', collection_date)::DATE AS month,
+    max(farmer_name) AS farmer_name,
+    sum(COALESCE(quantity, 0)) AS total_quantity,
+    sum(COALESCE(fat, 0)) AS total_fat,
+    sum(COALESCE(snf, 0)) AS total_snf,
+    count(*) AS entries
+FROM milk_collections
+WHERE collection_date < date_trunc('month', CURRENT_DATE)
+GROUP BY shop_id, farmer_id, date_trunc('month', collection_date);
+
+-- Unique index is required for REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX idx_farmer_quality_monthly_key
+    ON farmer_quality_monthly(shop_id, farmer_id, month);
+CREATE INDEX idx_farmer_quality_monthly_shop_month
+    ON farmer_quality_monthly(shop_id, month);
+
+-- Months covered by the rollup (everything before covered_until)
+CREATE TABLE IF NOT EXISTS analytics_refresh_state (
+    view_name TEXT PRIMARY KEY,
+    covered_until DATE,
+    refreshed_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+INSERT INTO analytics_refresh_state (view_name, covered_until, refreshed_at)
+VALUES ('farmer_quality_monthly', date_trunc('month', CURRENT_DATE)::DATE, NOW())
+ON CONFLICT (view_name) DO UPDATE SET
+    covered_until = EXCLUDED.covered_until,
+    refreshed_at = EXCLUDED.refreshed_at;
+
+-- ============================================
+-- 3. REFRESH STRATEGY
+-- ============================================
+-- Nightly concurrent refresh (readers are never blocked). Nightly rather than
+-- monthly because offline devices sync late, back-dated collections land in
+-- already-rolled-up months. Until the next refresh those rows are missing
+-- from complete months only; the current month is always read live.
+CREATE OR REPLACE FUNCTION refresh_farmer_quality_monthly()
+RETURNS VOID AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY farmer_quality_monthly;
+
+    INSERT INTO analytics_refresh_state (view_name, covered_until, refreshed_at)
+    VALUES ('farmer_quality_monthly', date_trunc('month', CURRENT_DATE)::DATE, NOW())
+    ON CONFLICT (view_name) DO UPDATE SET
+        covered_until = EXCLUDED.covered_until,
+        refreshed_at = EXCLUDED.refreshed_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Schedule with pg_cron when available, otherwise call
+-- POST /api/analytics/farmer-rankings/refresh from an external scheduler
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('refresh-farmer-quality', '15 2 * * *',
+                              'SELECT refresh_farmer_quality_monthly()');
+    END IF;
+END;
+$$;
+
+-- ============================================
+-- 4. RANKING RPC
+-- ============================================
+-- Window [p_from, p_to] (inclusive, NULL = open ended).
+-- Complete months inside the window come from the rollup, the partial months
+-- at either edge and anything after covered_until come from raw rows.
+-- Averages match the previous Python implementation (missing FAT/SNF count as 0).
+-- Quality score: FAT 60%, SNF 40%.
+CREATE OR REPLACE FUNCTION get_farmer_rankings(
+    p_shop_id UUID DEFAULT NULL,
+    p_from DATE DEFAULT NULL,
+    p_to DATE DEFAULT NULL,
+    p_limit INTEGER DEFAULT 50
+)
+RETURNS TABLE (
+    farmer_id UUID,
+    farmer_name TEXT,
+    avg_fat NUMERIC,
+    avg_snf NUMERIC,
+    quality_score NUMERIC,
+    total_milk NUMERIC,
+    entries BIGINT
+) AS $$
+    WITH bounds AS (
+        SELECT
+            COALESCE(p_from, DATE '0001-01-01') AS d_from,
+            COALESCE(p_to, DATE '9999-12-31') AS d_to,
+            COALESCE(
+                (SELECT covered_until FROM analytics_refresh_state
+                 WHERE view_name = 'farmer_quality_monthly'),
+                DATE '0001-01-01'
+            ) AS covered_until
+    ),
+    months AS (
+        -- [m_start, m_end): complete months served by the rollup
+        SELECT
+            d_from, d_to,
+            CASE WHEN d_from = date_trunc('month', d_from)::DATE THEN d_from
+                 ELSE (date_trunc('month', d_from) + INTERVAL '1 month')::DATE END AS m_start,
+            LEAST(date_trunc('month', d_to + 1)::DATE, covered_until) AS m_end
+        FROM bounds
+    ),
+    parts AS (
+        SELECT m.farmer_id, m.farmer_name, m.total_quantity, m.total_fat, m.total_snf, m.entries
+        FROM farmer_quality_monthly m, months w
+        WHERE (p_shop_id IS NULL OR m.shop_id = p_shop_id)
+          AND m.month >= w.m_start AND m.month < w.m_end
+
+        UNION ALL
+
+        SELECT c.farmer_id, max(c.farmer_name),
+               sum(COALESCE(c.quantity, 0)), sum(COALESCE(c.fat, 0)),
+               sum(COALESCE(c.snf, 0)), count(*)
+        FROM milk_collections c, months w
+        WHERE (p_shop_id IS NULL OR c.shop_id = p_shop_id)
+          AND c.collection_date BETWEEN w.d_from AND w.d_to
+          AND (w.m_start >= w.m_end OR c.collection_date < w.m_start OR c.collection_date >= w.m_end)
+        GROUP BY c.farmer_id
+    ),
+    totals AS (
+        SELECT farmer_id,
+               max(farmer_name) AS farmer_name,
+               sum(total_quantity) AS total_quantity,
+               sum(total_fat) / sum(entries) AS avg_fat,
+               sum(total_snf) / sum(entries) AS avg_snf,
+               sum(entries)::BIGINT AS entries
+        FROM parts
+        GROUP BY farmer_id
+        HAVING sum(entries) > 0
+    )
+    SELECT
+        farmer_id,
+        COALESCE(farmer_name, '') AS farmer_name,
+        round(avg_fat, 2) AS avg_fat,
+        round(avg_snf, 2) AS avg_snf,
+        round(LEAST(100, avg_fat / 6.0 * 60) + LEAST(100, avg_snf / 9.0 * 40), 2) AS quality_score,
+        round(total_quantity, 2) AS total_milk,
+        entries
+    FROM totals
+    ORDER BY quality_score DESC, farmer_id
+    LIMIT GREATEST(COALESCE(p_limit, 50), 0);
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- VERIFICATION
+-- ============================================
+
+SELECT
+    '✅ Farmer Rankings Aggregation Deployed' as status,
+    (SELECT count(*) FROM farmer_quality_monthly) as rollup_rows,
+    (SELECT covered_until FROM analytics_refresh_state WHERE view_name = 'farmer_quality_monthly') as covered_until;
@@ -18,6 +18,10 @@ except ImportError:
     print("Warning: psycopg2 not installed. Cloud database disabled.")
 
 
+# Tables served through keyset pagination
+PAGED_TABLES = ('farmers', 'customers', 'sales')
+
+
 def get_connection():
     """Get PostgreSQL connection"""
     if not HAS_PSYCOPG2:
@@ -93,9 +97,15 @@ def init_db():
                 paid_amount REAL,
                 payment_mode TEXT,
                 sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (customer_id) REFERENCES customers(id)
             )
         ''')
+        c.execute('ALTER TABLE sales ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+        
+        # Keyset pagination indexes
+        for table in PAGED_TABLES:
+            c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_keyset ON {table}(created_at DESC, id DESC)')
         
         conn.commit()
         conn.close()
@@ -103,6 +113,39 @@ def init_db():
         print(f"Error initializing database: {e}")
 
 
+# ============================================
+# Keyset Pagination
+# ============================================
+
+def select_page(table_name: str, after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """
+    One page of a table, newest first by (created_at, id)
+    after: (created_at, id) of the last row of the previous page
+    """
+    if table_name not in PAGED_TABLES:
+        raise ValueError(f"Unknown table: {table_name}")
+    
+    conn = get_connection()
+    try:
+        c = conn.cursor(cursor_factory=RealDictCursor)
+        if after:
+            c.execute(f'''
+                SELECT * FROM {table_name}
+                WHERE (created_at, id) < (%s, %s)
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            ''', (after[0], after[1], limit))
+        else:
+            c.execute(f'''
+                SELECT * FROM {table_name}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            ''', (limit,))
+        return [dict(row) for row in c.fetchall()]
+    finally:
+        conn.close()
+
+
 # ============================================
 # Farmer Repository
 # ============================================
@@ -151,6 +194,15 @@ def farmer_get_all() -> List[Dict]:
         return []
 
 
+def farmer_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of farmers, newest first"""
+    try:
+        return select_page('farmers', after, limit)
+    except Exception as e:
+        print(f"Error getting farmers page: {e}")
+        return []
+
+
 def farmer_get_by_id(farmer_id: str) -> Optional[Dict]:
     """Get farmer by ID"""
     try:
@@ -275,6 +327,15 @@ def customer_get_all() -> List[Dict]:
         return []
 
 
+def customer_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of customers, newest first"""
+    try:
+        return select_page('customers', after, limit)
+    except Exception as e:
+        print(f"Error getting customers page: {e}")
+        return []
+
+
 # ============================================
 # Sale Repository
 # ============================================
@@ -334,6 +395,15 @@ def sale_get_all(limit: int = 100) -> List[Dict]:
         return []
 
 
+def sale_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of sales, newest first"""
+    try:
+        return select_page('sales', after, limit)
+    except Exception as e:
+        print(f"Error getting sales page: {e}")
+        return []
+
+
 def sale_get_by_id(sale_id: str) -> Optional[Dict]:
     """Get sale by ID"""
     try:
@@ -7,6 +7,8 @@ Stores records with sync_status for later Supabase sync
 import sqlite3
 import os
 import json
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from typing import List, Dict, Optional, Any
 from uuid6 import uuid7
@@ -15,21 +17,39 @@ from uuid6 import uuid7
 DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database')
 DB_PATH = os.path.join(DB_DIR, 'milkrecord.db')
 
+# Tables pushed to Supabase by the sync engine
+SYNC_TABLES = ('farmers', 'customers', 'sales', 'products', 'milk_collections')
+
+# Connection tuning (per connection, applied once when a thread first connects)
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))   # bytes
+CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 16 * 1024))   # page cache
+STATEMENT_CACHE_SIZE = 128
+
 # Ensure database directory exists
 os.makedirs(DB_DIR, exist_ok=True)
 
+# One persistent connection per thread
+_local = threading.local()
+_device_id = None
+
 
 def get_device_id() -> str:
     """
     Generate unique device ID based on system info
     Stored in config file for persistence
+    Cached after the first read, every save stamps it
     """
+    global _device_id
+    if _device_id:
+        return _device_id
+    
     config_path = os.path.join(DB_DIR, 'device_config.json')
     
     if os.path.exists(config_path):
         with open(config_path, 'r') as f:
             config = json.load(f)
-            return config.get('device_id')
+            _device_id = config.get('device_id')
+            return _device_id
     
     # Generate new device ID
     try:
@@ -45,17 +65,81 @@ def get_device_id() -> str:
     with open(config_path, 'w') as f:
         json.dump({'device_id': device_id, 'created_at': datetime.now().isoformat()}, f)
     
+    _device_id = device_id
     return device_id
 
 
-def get_connection():
-    """Get SQLite connection with foreign keys enabled"""
-    conn = sqlite3.connect(DB_PATH, timeout=30.0)
-    conn.execute('PRAGMA foreign_keys = ON')
+def _connect(path: str):
+    """Open and configure a SQLite connection"""
+    conn = sqlite3.connect(path, timeout=30.0, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+def get_connection():
+    """
+    Get this thread's persistent SQLite connection
+    Opened and configured on first use, reused by every later call
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_PATH:
+        if conn is not None:
+            conn.close()
+        conn = _connect(DB_PATH)
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.depth = 0
     return conn
 
 
+def close_connection():
+    """Close this thread's connection (call when a worker thread exits)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+@contextmanager
+def transaction():
+    """
+    Unit of work: statements inside share one transaction
+    Commits on success, rolls back on error
+    Nested blocks join the outermost transaction; if a nested block fails
+    (even when the repository function swallows the error) the whole unit rolls back
+    
+    Usage:
+        with transaction() as c:
+            c.execute(...)
+            c.execute(...)
+    """
+    conn = get_connection()
+    depth = _local.depth
+    _local.depth = depth + 1
+    if depth == 0:
+        _local.rollback_only = False
+    try:
+        yield conn.cursor()
+        if depth == 0:
+            if _local.rollback_only:
+                raise sqlite3.OperationalError('Unit of work rolled back: a nested operation failed')
+            conn.commit()
+    except Exception:
+        if depth == 0:
+            conn.rollback()
+        else:
+            _local.rollback_only = True
+        raise
+    finally:
+        _local.depth = depth
+
+
 def init_db():
     """Initialize database schema with sync fields"""
     conn = get_connection()
@@ -177,10 +261,52 @@ def init_db():
         )
     ''')
     
+    # Shop rate chart: FAT x SNF breakpoints per milk type (snf NULL = any SNF)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rate_chart (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            milk_type TEXT NOT NULL,
+            fat REAL NOT NULL,
+            snf REAL,
+            rate REAL NOT NULL,
+            chart_version TEXT,
+            created_at TEXT
+        )
+    ''')
+    
+    # Write-behind outbox: one row per record awaiting cloud replication,
+    # repeated edits of the same record coalesce into the same row
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            record_id TEXT NOT NULL,
+            enqueued_at TEXT,
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            UNIQUE (table_name, record_id)
+        )
+    ''')
+    
+    # Per-table sync high-water mark (last record pushed, in updated_at, id order)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            table_name TEXT PRIMARY KEY,
+            high_water_updated_at TEXT,
+            high_water_id TEXT,
+            records_synced INTEGER DEFAULT 0,
+            last_sync_at TEXT
+        )
+    ''')
+    
     # Create indexes for sync performance
     c.execute('CREATE INDEX IF NOT EXISTS idx_sync_status ON farmers(sync_status)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_sync_status_sales ON sales(sync_status)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_device_id ON farmers(device_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_collections_date ON milk_collections(collection_date)')
+    for table in SYNC_TABLES:
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_sync_delta ON {table}(sync_status, updated_at, id)')
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_keyset ON {table}(created_at, id)')
     
     # Register this device
     device_id = get_device_id()
@@ -190,7 +316,6 @@ def init_db():
     ''', (device_id, 'Desktop POS', 'desktop', datetime.now().isoformat()))
     
     conn.commit()
-    conn.close()
     print(f"✅ Database initialized with device_id: {device_id}")
 
 
@@ -208,6 +333,40 @@ def get_timestamp() -> str:
     return datetime.now().isoformat()
 
 
+def select_page(table_name: str, after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """
+    One page of a table, newest first by (created_at, id)
+    after: (created_at, id) of the last row of the previous page
+    """
+    if table_name not in SYNC_TABLES:
+        raise ValueError(f"Unknown table: {table_name}")
+    
+    c = get_connection().cursor()
+    if after:
+        c.execute(f'''
+            SELECT * FROM {table_name}
+            WHERE created_at < ? OR (created_at = ? AND id < ?)
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        ''', (after[0], after[0], after[1], limit))
+    else:
+        c.execute(f'''
+            SELECT * FROM {table_name}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        ''', (limit,))
+    return [dict(row) for row in c.fetchall()]
+
+
+def outbox_enqueue(c, table_name: str, record_id: str, enqueued_at: str):
+    """Queue a record for cloud replication (call inside the save transaction)"""
+    c.execute('''
+        INSERT INTO sync_outbox (table_name, record_id, enqueued_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(table_name, record_id) DO UPDATE SET enqueued_at = excluded.enqueued_at
+    ''', (table_name, record_id, enqueued_at))
+
+
 # ============================================
 # Farmer Repository
 # ============================================
@@ -215,38 +374,36 @@ def get_timestamp() -> str:
 def farmer_save(farmer: Dict) -> bool:
     """Save farmer with sync tracking"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        
-        # Add sync fields if not present
-        if 'id' not in farmer or not farmer['id']:
-            farmer['id'] = generate_uuid()
-        
-        farmer['device_id'] = get_device_id()
-        farmer['sync_status'] = farmer.get('sync_status', 'pending')
-        farmer['version'] = farmer.get('version', 1)
-        farmer['created_at'] = farmer.get('created_at', get_timestamp())
-        farmer['updated_at'] = get_timestamp()
-        
-        c.execute('''
-            INSERT OR REPLACE INTO farmers 
-            (id, device_id, name, phone, animal_type, balance, sync_status, version, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            farmer['id'],
-            farmer['device_id'],
-            farmer['name'],
-            farmer.get('phone'),
-            farmer.get('animal_type', 'cow'),
-            farmer.get('balance', 0.0),
-            farmer['sync_status'],
-            farmer['version'],
-            farmer['created_at'],
-            farmer['updated_at']
-        ))
-        
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            # Add sync fields if not present
+            if 'id' not in farmer or not farmer['id']:
+                farmer['id'] = generate_uuid()
+            
+            farmer['device_id'] = get_device_id()
+            farmer['sync_status'] = farmer.get('sync_status', 'pending')
+            farmer['version'] = farmer.get('version', 1)
+            farmer['created_at'] = farmer.get('created_at', get_timestamp())
+            farmer['updated_at'] = get_timestamp()
+            
+            c.execute('''
+                INSERT OR REPLACE INTO farmers 
+                (id, device_id, name, phone, animal_type, balance, sync_status, version, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                farmer['id'],
+                farmer['device_id'],
+                farmer['name'],
+                farmer.get('phone'),
+                farmer.get('animal_type', 'cow'),
+                farmer.get('balance', 0.0),
+                farmer['sync_status'],
+                farmer['version'],
+                farmer['created_at'],
+                farmer['updated_at']
+            ))
+            
+            if farmer['sync_status'] == 'pending':
+                outbox_enqueue(c, 'farmers', farmer['id'], farmer['updated_at'])
         return True
     except Exception as e:
         print(f"Error saving farmer: {e}")
@@ -256,22 +413,40 @@ def farmer_save(farmer: Dict) -> bool:
 def farmer_get_all() -> List[Dict]:
     """Get all farmers"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
+        c = get_connection().cursor()
         c.execute('SELECT * FROM farmers ORDER BY name')
         rows = c.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     except Exception as e:
         print(f"Error getting farmers: {e}")
         return []
 
 
+def farmer_get(farmer_id: str) -> Optional[Dict]:
+    """Get one farmer by id"""
+    try:
+        c = get_connection().cursor()
+        c.execute('SELECT * FROM farmers WHERE id = ?', (farmer_id,))
+        row = c.fetchone()
+        return dict(row) if row else None
+    except Exception as e:
+        print(f"Error getting farmer: {e}")
+        return None
+
+
+def farmer_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of farmers, newest first (keyset on created_at, id)"""
+    try:
+        return select_page('farmers', after, limit)
+    except Exception as e:
+        print(f"Error getting farmers page: {e}")
+        return []
+
+
 def farmer_get_pending_sync() -> List[Dict]:
     """Get farmers pending sync to Supabase"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
+        c = get_connection().cursor()
         c.execute('''
             SELECT * FROM farmers 
             WHERE sync_status = 'pending' 
@@ -279,7 +454,6 @@ def farmer_get_pending_sync() -> List[Dict]:
             LIMIT 100
         ''')
         rows = c.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     except Exception as e:
         print(f"Error getting pending farmers: {e}")
@@ -289,15 +463,12 @@ def farmer_get_pending_sync() -> List[Dict]:
 def farmer_mark_synced(farmer_id: str) -> bool:
     """Mark farmer as synced"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute('''
-            UPDATE farmers 
-            SET sync_status = 'synced', updated_at = ?
-            WHERE id = ?
-        ''', (get_timestamp(), farmer_id))
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            c.execute('''
+                UPDATE farmers 
+                SET sync_status = 'synced', updated_at = ?
+                WHERE id = ?
+            ''', (get_timestamp(), farmer_id))
         return True
     except Exception as e:
         print(f"Error marking farmer synced: {e}")
@@ -311,48 +482,46 @@ def farmer_mark_synced(farmer_id: str) -> bool:
 def sale_save(sale: Dict) -> bool:
     """Save sale with sync tracking"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        
-        # Add sync fields if not present
-        if 'id' not in sale or not sale['id']:
-            sale['id'] = generate_uuid()
-        
-        sale['device_id'] = get_device_id()
-        sale['sync_status'] = sale.get('sync_status', 'pending')
-        sale['version'] = sale.get('version', 1)
-        sale['created_at'] = sale.get('created_at', get_timestamp())
-        sale['updated_at'] = get_timestamp()
-        
-        c.execute('''
-            INSERT OR REPLACE INTO sales 
-            (id, device_id, customer_id, customer_name, items, total_amount, paid_amount, payment_mode, sync_status, version, sale_date, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            sale['id'],
-            sale['device_id'],
-            sale.get('customer_id'),
-            sale.get('customer_name', 'Walking Customer'),
-            sale.get('items', '[]'),
-            sale['total_amount'],
-            sale.get('paid_amount', 0.0),
-            sale.get('payment_mode', 'cash'),
-            sale['sync_status'],
-            sale['version'],
-            sale.get('sale_date', get_timestamp()),
-            sale['created_at'],
-            sale['updated_at']
-        ))
-        
-        # Update customer balance if credit
-        if sale.get('payment_mode') == 'credit' and sale.get('customer_id'):
-            balance_due = sale['total_amount'] - sale.get('paid_amount', 0.0)
+        with transaction() as c:
+            # Add sync fields if not present
+            if 'id' not in sale or not sale['id']:
+                sale['id'] = generate_uuid()
+            
+            sale['device_id'] = get_device_id()
+            sale['sync_status'] = sale.get('sync_status', 'pending')
+            sale['version'] = sale.get('version', 1)
+            sale['created_at'] = sale.get('created_at', get_timestamp())
+            sale['updated_at'] = get_timestamp()
+            
             c.execute('''
-                UPDATE customers SET balance = balance + ? WHERE id = ?
-            ''', (balance_due, sale['customer_id']))
-        
-        conn.commit()
-        conn.close()
+                INSERT OR REPLACE INTO sales 
+                (id, device_id, customer_id, customer_name, items, total_amount, paid_amount, payment_mode, sync_status, version, sale_date, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                sale['id'],
+                sale['device_id'],
+                sale.get('customer_id'),
+                sale.get('customer_name', 'Walking Customer'),
+                sale.get('items', '[]'),
+                sale['total_amount'],
+                sale.get('paid_amount', 0.0),
+                sale.get('payment_mode', 'cash'),
+                sale['sync_status'],
+                sale['version'],
+                sale.get('sale_date', get_timestamp()),
+                sale['created_at'],
+                sale['updated_at']
+            ))
+            
+            # Update customer balance if credit
+            if sale.get('payment_mode') == 'credit' and sale.get('customer_id'):
+                balance_due = sale['total_amount'] - sale.get('paid_amount', 0.0)
+                c.execute('''
+                    UPDATE customers SET balance = balance + ? WHERE id = ?
+                ''', (balance_due, sale['customer_id']))
+            
+            if sale['sync_status'] == 'pending':
+                outbox_enqueue(c, 'sales', sale['id'], sale['updated_at'])
         return True
     except Exception as e:
         print(f"Error saving sale: {e}")
@@ -362,26 +531,32 @@ def sale_save(sale: Dict) -> bool:
 def sale_get_all(limit: int = 100) -> List[Dict]:
     """Get all sales"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
+        c = get_connection().cursor()
         c.execute('''
             SELECT * FROM sales 
             ORDER BY sale_date DESC 
             LIMIT ?
         ''', (limit,))
         rows = c.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     except Exception as e:
         print(f"Error getting sales: {e}")
         return []
 
 
+def sale_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of sales, newest first (keyset on created_at, id)"""
+    try:
+        return select_page('sales', after, limit)
+    except Exception as e:
+        print(f"Error getting sales page: {e}")
+        return []
+
+
 def sale_get_pending_sync() -> List[Dict]:
     """Get sales pending sync to Supabase"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
+        c = get_connection().cursor()
         c.execute('''
             SELECT * FROM sales 
             WHERE sync_status = 'pending' 
@@ -389,7 +564,6 @@ def sale_get_pending_sync() -> List[Dict]:
             LIMIT 100
         ''')
         rows = c.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     except Exception as e:
         print(f"Error getting pending sales: {e}")
@@ -399,15 +573,12 @@ def sale_get_pending_sync() -> List[Dict]:
 def sale_mark_synced(sale_id: str) -> bool:
     """Mark sale as synced"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute('''
-            UPDATE sales 
-            SET sync_status = 'synced', updated_at = ?
-            WHERE id = ?
-        ''', (get_timestamp(), sale_id))
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            c.execute('''
+                UPDATE sales 
+                SET sync_status = 'synced', updated_at = ?
+                WHERE id = ?
+            ''', (get_timestamp(), sale_id))
         return True
     except Exception as e:
         print(f"Error marking sale synced: {e}")
@@ -421,37 +592,36 @@ def sale_mark_synced(sale_id: str) -> bool:
 def customer_save(customer: Dict) -> bool:
     """Save customer with sync tracking"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        
-        if 'id' not in customer or not customer['id']:
-            customer['id'] = generate_uuid()
-        
-        customer['device_id'] = get_device_id()
-        customer['sync_status'] = customer.get('sync_status', 'pending')
-        customer['version'] = customer.get('version', 1)
-        customer['created_at'] = customer.get('created_at', get_timestamp())
-        customer['updated_at'] = get_timestamp()
-        
-        c.execute('''
-            INSERT OR REPLACE INTO customers 
-            (id, device_id, name, phone, email, address, balance, sync_status, version, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            customer['id'],
-            customer['device_id'],
-            customer['name'],
-            customer.get('phone'),
-            customer.get('email'),
-            customer.get('address'),
-            customer.get('balance', 0.0),
-            customer['sync_status'],
-            customer['version'],
-            customer['created_at'],
-            customer['updated_at']
-        ))
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            if 'id' not in customer or not customer['id']:
+                customer['id'] = generate_uuid()
+            
+            customer['device_id'] = get_device_id()
+            customer['sync_status'] = customer.get('sync_status', 'pending')
+            customer['version'] = customer.get('version', 1)
+            customer['created_at'] = customer.get('created_at', get_timestamp())
+            customer['updated_at'] = get_timestamp()
+            
+            c.execute('''
+                INSERT OR REPLACE INTO customers 
+                (id, device_id, name, phone, email, address, balance, sync_status, version, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                customer['id'],
+                customer['device_id'],
+                customer['name'],
+                customer.get('phone'),
+                customer.get('email'),
+                customer.get('address'),
+                customer.get('balance', 0.0),
+                customer['sync_status'],
+                customer['version'],
+                customer['created_at'],
+                customer['updated_at']
+            ))
+            
+            if customer['sync_status'] == 'pending':
+                outbox_enqueue(c, 'customers', customer['id'], customer['updated_at'])
         return True
     except Exception as e:
         print(f"Error saving customer: {e}")
@@ -461,17 +631,24 @@ def customer_save(customer: Dict) -> bool:
 def customer_get_all() -> List[Dict]:
     """Get all customers"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
+        c = get_connection().cursor()
         c.execute('SELECT * FROM customers ORDER BY name')
         rows = c.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     except Exception as e:
         print(f"Error getting customers: {e}")
         return []
 
 
+def customer_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of customers, newest first (keyset on created_at, id)"""
+    try:
+        return select_page('customers', after, limit)
+    except Exception as e:
+        print(f"Error getting customers page: {e}")
+        return []
+
+
 # ============================================
 # Product Repository
 # ============================================
@@ -479,37 +656,36 @@ def customer_get_all() -> List[Dict]:
 def product_save(product: Dict) -> bool:
     """Save product with sync tracking"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        
-        if 'id' not in product or not product['id']:
-            product['id'] = generate_uuid()
-        
-        product['device_id'] = get_device_id()
-        product['sync_status'] = product.get('sync_status', 'pending')
-        product['version'] = product.get('version', 1)
-        product['created_at'] = product.get('created_at', get_timestamp())
-        product['updated_at'] = get_timestamp()
-        
-        c.execute('''
-            INSERT OR REPLACE INTO products 
-            (id, device_id, name, category, price, unit, emoji, sync_status, version, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            product['id'],
-            product['device_id'],
-            product['name'],
-            product.get('category', 'all'),
-            product['price'],
-            product.get('unit', 'unit'),
-            product.get('emoji', '📦'),
-            product['sync_status'],
-            product['version'],
-            product['created_at'],
-            product['updated_at']
-        ))
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            if 'id' not in product or not product['id']:
+                product['id'] = generate_uuid()
+            
+            product['device_id'] = get_device_id()
+            product['sync_status'] = product.get('sync_status', 'pending')
+            product['version'] = product.get('version', 1)
+            product['created_at'] = product.get('created_at', get_timestamp())
+            product['updated_at'] = get_timestamp()
+            
+            c.execute('''
+                INSERT OR REPLACE INTO products 
+                (id, device_id, name, category, price, unit, emoji, sync_status, version, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                product['id'],
+                product['device_id'],
+                product['name'],
+                product.get('category', 'all'),
+                product['price'],
+                product.get('unit', 'unit'),
+                product.get('emoji', '📦'),
+                product['sync_status'],
+                product['version'],
+                product['created_at'],
+                product['updated_at']
+            ))
+            
+            if product['sync_status'] == 'pending':
+                outbox_enqueue(c, 'products', product['id'], product['updated_at'])
         return True
     except Exception as e:
         print(f"Error saving product: {e}")
@@ -519,17 +695,154 @@ def product_save(product: Dict) -> bool:
 def product_get_all() -> List[Dict]:
     """Get all products"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
+        c = get_connection().cursor()
         c.execute('SELECT * FROM products ORDER BY category, name')
         rows = c.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     except Exception as e:
         print(f"Error getting products: {e}")
         return []
 
 
+def product_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of products, newest first (keyset on created_at, id)"""
+    try:
+        return select_page('products', after, limit)
+    except Exception as e:
+        print(f"Error getting products page: {e}")
+        return []
+
+
+# ============================================
+# Milk Collection Repository
+# ============================================
+
+def collection_save(collection: Dict) -> bool:
+    """Save milk collection with sync tracking"""
+    try:
+        with transaction() as c:
+            # Add sync fields if not present
+            if 'id' not in collection or not collection['id']:
+                collection['id'] = generate_uuid()
+            
+            collection['device_id'] = get_device_id()
+            collection['sync_status'] = collection.get('sync_status', 'pending')
+            collection['version'] = collection.get('version', 1)
+            collection['created_at'] = collection.get('created_at', get_timestamp())
+            collection['updated_at'] = get_timestamp()
+            collection['collection_date'] = collection.get('collection_date') or collection['created_at'][:10]
+            
+            c.execute('''
+                INSERT OR REPLACE INTO milk_collections 
+                (id, device_id, farmer_id, quantity, fat, snf, rate, amount, shift, collection_date,
+                 sync_status, version, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                collection['id'],
+                collection['device_id'],
+                collection['farmer_id'],
+                collection['quantity'],
+                collection.get('fat'),
+                collection.get('snf'),
+                collection.get('rate'),
+                collection.get('amount'),
+                collection.get('shift', 'morning'),
+                collection['collection_date'],
+                collection['sync_status'],
+                collection['version'],
+                collection['created_at'],
+                collection['updated_at']
+            ))
+            
+            if collection['sync_status'] == 'pending':
+                outbox_enqueue(c, 'milk_collections', collection['id'], collection['updated_at'])
+        return True
+    except Exception as e:
+        print(f"Error saving collection: {e}")
+        return False
+
+
+def collection_get_range(date_from: str, date_to: str) -> List[Dict]:
+    """Collections between two dates (inclusive) with the farmer's animal type, for repricing"""
+    try:
+        c = get_connection().cursor()
+        c.execute('''
+            SELECT mc.id, mc.quantity, mc.fat, mc.snf, mc.rate, mc.amount,
+                   COALESCE(f.animal_type, 'cow') AS animal_type
+            FROM milk_collections mc
+            LEFT JOIN farmers f ON f.id = mc.farmer_id
+            WHERE mc.collection_date BETWEEN ? AND ?
+            ORDER BY mc.collection_date, mc.id
+        ''', (date_from, date_to))
+        return [dict(row) for row in c.fetchall()]
+    except Exception as e:
+        print(f"Error getting collections: {e}")
+        return []
+
+
+def collection_update_rates(updates: List[tuple]) -> int:
+    """
+    Apply repriced (rate, amount, id) rows in one transaction: one executemany
+    for the rows and one queueing them for sync
+    Rows whose rate and amount already match are left as they are
+    Returns number of rows changed, -1 on error
+    """
+    if not updates:
+        return 0
+    try:
+        now = get_timestamp()
+        with transaction() as c:
+            c.executemany('''
+                UPDATE milk_collections
+                SET rate = ?, amount = ?, version = version + 1, sync_status = 'pending', updated_at = ?
+                WHERE id = ? AND (rate IS NOT ? OR amount IS NOT ?)
+            ''', [(rate, amount, now, record_id, rate, amount) for rate, amount, record_id in updates])
+            changed = c.rowcount
+            # Queue only the rows this call changed (stamped with `now` above)
+            c.executemany('''
+                INSERT INTO sync_outbox (table_name, record_id, enqueued_at)
+                SELECT 'milk_collections', id, ? FROM milk_collections WHERE id = ? AND updated_at = ?
+                ON CONFLICT(table_name, record_id) DO UPDATE SET enqueued_at = excluded.enqueued_at
+            ''', [(now, record_id, now) for _, _, record_id in updates])
+        return changed
+    except Exception as e:
+        print(f"Error updating collection rates: {e}")
+        return -1
+
+
+# ============================================
+# Rate Chart Repository
+# ============================================
+
+def rate_chart_get() -> List[Dict]:
+    """Current rate chart rows"""
+    try:
+        c = get_connection().cursor()
+        c.execute('SELECT milk_type, fat, snf, rate, chart_version FROM rate_chart ORDER BY milk_type, fat, snf')
+        return [dict(row) for row in c.fetchall()]
+    except Exception as e:
+        print(f"Error getting rate chart: {e}")
+        return []
+
+
+def rate_chart_replace(rows: List[Dict], chart_version: Optional[str] = None) -> bool:
+    """Replace the whole rate chart in one transaction"""
+    try:
+        now = get_timestamp()
+        with transaction() as c:
+            c.execute('DELETE FROM rate_chart')
+            c.executemany('''
+                INSERT INTO rate_chart (milk_type, fat, snf, rate, chart_version, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [((row.get('milk_type') or 'cow').lower(), float(row['fat']),
+                   None if row.get('snf') in (None, '') else float(row['snf']),
+                   float(row['rate']), chart_version, now) for row in rows])
+        return True
+    except Exception as e:
+        print(f"Error saving rate chart: {e}")
+        return False
+
+
 # ============================================
 # Sync Log Repository
 # ============================================
@@ -537,24 +850,181 @@ def product_get_all() -> List[Dict]:
 def log_sync(device_id: str, table_name: str, record_id: str, action: str, status: str, error_message: str = None) -> bool:
     """Log sync attempt"""
     try:
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO sync_logs (id, device_id, table_name, record_id, action, status, error_message, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            generate_uuid(),
-            device_id,
-            table_name,
-            record_id,
-            action,
-            status,
-            error_message,
-            get_timestamp()
-        ))
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            c.execute('''
+                INSERT INTO sync_logs (id, device_id, table_name, record_id, action, status, error_message, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                generate_uuid(),
+                device_id,
+                table_name,
+                record_id,
+                action,
+                status,
+                error_message,
+                get_timestamp()
+            ))
         return True
     except Exception as e:
         print(f"Error logging sync: {e}")
         return False
+
+
+# ============================================
+# Sync Batch Repository
+# ============================================
+
+def sync_get_state(table_name: str) -> Dict:
+    """Get high-water mark for a synced table"""
+    try:
+        c = get_connection().cursor()
+        c.execute('SELECT * FROM sync_state WHERE table_name = ?', (table_name,))
+        row = c.fetchone()
+        return dict(row) if row else {'table_name': table_name, 'high_water_updated_at': None,
+                                      'high_water_id': None, 'records_synced': 0, 'last_sync_at': None}
+    except Exception as e:
+        print(f"Error getting sync state: {e}")
+        return {'table_name': table_name, 'high_water_updated_at': None, 'high_water_id': None}
+
+
+def sync_get_pending_batch(table_name: str, after: Optional[tuple] = None, limit: int = 500) -> List[Dict]:
+    """
+    Get next batch of pending records in (updated_at, id) order
+    after: (updated_at, id) keyset cursor, None for the start of the table
+    """
+    if table_name not in SYNC_TABLES:
+        raise ValueError(f"Unknown sync table: {table_name}")
+    
+    try:
+        c = get_connection().cursor()
+        if after and after[0] is not None:
+            c.execute(f'''
+                SELECT * FROM {table_name}
+                WHERE sync_status = 'pending'
+                  AND (updated_at > ? OR (updated_at = ? AND id > ?))
+                ORDER BY updated_at, id
+                LIMIT ?
+            ''', (after[0], after[0], after[1] or '', limit))
+        else:
+            c.execute(f'''
+                SELECT * FROM {table_name}
+                WHERE sync_status = 'pending'
+                ORDER BY updated_at, id
+                LIMIT ?
+            ''', (limit,))
+        rows = c.fetchall()
+        return [dict(row) for row in rows]
+    except Exception as e:
+        print(f"Error getting pending {table_name}: {e}")
+        return []
+
+
+def sync_complete_batch(table_name: str, device_id: str, synced: List[Dict],
+                        conflicts: Dict[str, str], failed: Dict[str, str],
+                        high_water: Optional[tuple] = None) -> bool:
+    """
+    Record the outcome of one sync batch in a single transaction
+    - synced records are marked synced unless they were edited meanwhile
+    - conflicts are parked with sync_status = 'conflict'
+    - outbox rows are cleared, failures bump the attempt counter
+    - every outcome is written to sync_logs
+    - the high-water mark advances to the last record of the batch
+    """
+    if table_name not in SYNC_TABLES:
+        raise ValueError(f"Unknown sync table: {table_name}")
+    
+    try:
+        with transaction() as c:
+            now = get_timestamp()
+            
+            # Guard on updated_at so an edit made during the upload stays pending
+            c.executemany(f'''
+                UPDATE {table_name} SET sync_status = 'synced'
+                WHERE id = ? AND updated_at IS ?
+            ''', [(r['id'], r.get('updated_at')) for r in synced])
+            
+            c.executemany(f'''
+                UPDATE {table_name} SET sync_status = 'conflict'
+                WHERE id = ? AND sync_status = 'pending'
+            ''', [(record_id,) for record_id in conflicts])
+            
+            # Outbox rows are cleared unless the record was re-queued by a later edit
+            c.executemany('''
+                DELETE FROM sync_outbox
+                WHERE table_name = ? AND record_id = ? AND (enqueued_at IS NULL OR enqueued_at <= ?)
+            ''', [(table_name, r['id'], r.get('updated_at')) for r in synced])
+            c.executemany('''
+                DELETE FROM sync_outbox WHERE table_name = ? AND record_id = ?
+            ''', [(table_name, record_id) for record_id in conflicts])
+            c.executemany('''
+                UPDATE sync_outbox SET attempts = attempts + 1, last_error = ?
+                WHERE table_name = ? AND record_id = ?
+            ''', [(message, table_name, record_id) for record_id, message in failed.items()])
+            
+            logs = [(generate_uuid(), device_id, table_name, r['id'], 'SYNC', 'success', None, now) for r in synced]
+            logs += [(generate_uuid(), device_id, table_name, record_id, 'SYNC', 'conflict', message, now)
+                     for record_id, message in conflicts.items()]
+            logs += [(generate_uuid(), device_id, table_name, record_id, 'SYNC', 'failed', message, now)
+                     for record_id, message in failed.items()]
+            c.executemany('''
+                INSERT INTO sync_logs (id, device_id, table_name, record_id, action, status, error_message, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', logs)
+            
+            if high_water:
+                c.execute('''
+                    INSERT INTO sync_state (table_name, high_water_updated_at, high_water_id, records_synced, last_sync_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(table_name) DO UPDATE SET
+                        high_water_updated_at = excluded.high_water_updated_at,
+                        high_water_id = excluded.high_water_id,
+                        records_synced = records_synced + excluded.records_synced,
+                        last_sync_at = excluded.last_sync_at
+                ''', (table_name, high_water[0], high_water[1], len(synced), now))
+        return True
+    except Exception as e:
+        print(f"Error completing sync batch for {table_name}: {e}")
+        return False
+
+
+def outbox_get_batch(table_name: str, limit: int = 500) -> List[Dict]:
+    """
+    Get queued records for a table (current row state, so edits are coalesced)
+    Records that keep failing sink to the end of the queue
+    """
+    if table_name not in SYNC_TABLES:
+        raise ValueError(f"Unknown sync table: {table_name}")
+    
+    try:
+        with transaction() as c:
+            # Drop entries already handled elsewhere (delta sync, conflict, deleted)
+            c.execute(f'''
+                DELETE FROM sync_outbox
+                WHERE table_name = ?
+                  AND record_id NOT IN (SELECT id FROM {table_name} WHERE sync_status = 'pending')
+            ''', (table_name,))
+            
+            c.execute(f'''
+                SELECT t.* FROM sync_outbox o
+                JOIN {table_name} t ON t.id = o.record_id
+                WHERE o.table_name = ?
+                ORDER BY o.attempts, o.id
+                LIMIT ?
+            ''', (table_name, limit))
+            rows = c.fetchall()
+        return [dict(row) for row in rows]
+    except Exception as e:
+        print(f"Error getting outbox for {table_name}: {e}")
+        return []
+
+
+def outbox_count() -> Dict[str, int]:
+    """Number of records waiting for replication, per table"""
+    try:
+        c = get_connection().cursor()
+        c.execute('SELECT table_name, COUNT(*) AS pending FROM sync_outbox GROUP BY table_name')
+        rows = c.fetchall()
+        return {row['table_name']: row['pending'] for row in rows}
+    except Exception as e:
+        print(f"Error counting outbox: {e}")
+        return {}
@@ -65,6 +65,39 @@ def get_client() -> Optional[Client]:
     return supabase
 
 
+# ============================================
+# Keyset Pagination - Supabase
+# ============================================
+
+PAGED_TABLES = ('farmers', 'customers', 'sales', 'products')
+
+
+def select_page(table_name: str, after: Optional[tuple] = None, limit: int = 100,
+                client: Optional[Client] = None) -> List[Dict]:
+    """
+    One page of a table, newest first by (created_at, id)
+    after: (created_at, id) of the last row of the previous page
+    Raises on errors (exports must not silently truncate)
+    """
+    if table_name not in PAGED_TABLES:
+        raise ValueError(f"Unknown table: {table_name}")
+    
+    client = client or get_client()
+    if not client:
+        raise RuntimeError('Supabase not configured')
+    
+    query = client.table(table_name).select('*')
+    if after:
+        # Quoted values: timestamps contain ':' and '+'
+        created_at, record_id = after
+        query = query.or_(
+            f'created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.lt."{record_id}")'
+        )
+    result = query.order('created_at', desc=True).order('id', desc=True).limit(limit).execute()
+    return result.data or []
+
+
 # ============================================
 # Farmer Repository - Supabase
 # ============================================
@@ -103,6 +136,15 @@ def farmer_get_all() -> List[Dict]:
         return []
 
 
+def farmer_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of farmers from Supabase, newest first"""
+    try:
+        return select_page('farmers', after, limit)
+    except Exception as e:
+        print(f"Error getting farmers page from Supabase: {e}")
+        return []
+
+
 def farmer_get_by_id(farmer_id: str) -> Optional[Dict]:
     """Get farmer by ID from Supabase"""
     try:
@@ -155,6 +197,15 @@ def sale_get_all(limit: int = 100) -> List[Dict]:
         return []
 
 
+def sale_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of sales from Supabase, newest first"""
+    try:
+        return select_page('sales', after, limit)
+    except Exception as e:
+        print(f"Error getting sales page from Supabase: {e}")
+        return []
+
+
 def sale_get_by_id(sale_id: str) -> Optional[Dict]:
     """Get sale by ID from Supabase"""
     try:
@@ -205,6 +256,15 @@ def customer_get_all() -> List[Dict]:
         return []
 
 
+def customer_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of customers from Supabase, newest first"""
+    try:
+        return select_page('customers', after, limit)
+    except Exception as e:
+        print(f"Error getting customers page from Supabase: {e}")
+        return []
+
+
 # ============================================
 # Product Repository - Supabase
 # ============================================
@@ -241,6 +301,38 @@ def product_get_all() -> List[Dict]:
         return []
 
 
+def product_get_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of products from Supabase, newest first"""
+    try:
+        return select_page('products', after, limit)
+    except Exception as e:
+        print(f"Error getting products page from Supabase: {e}")
+        return []
+
+
+# ============================================
+# Milk Collection Operations
+# ============================================
+
+def collection_save(collection: Dict) -> bool:
+    """Save milk collection to Supabase"""
+    try:
+        client = get_client()
+        if not client:
+            return False
+        
+        # Ensure timestamps
+        collection['updated_at'] = datetime.now().isoformat()
+        
+        client.table('milk_collections').upsert(collection).execute()
+        
+        print(f"✅ Collection saved to Supabase: {collection['id']}")
+        return True
+    except Exception as e:
+        print(f"Error saving collection to Supabase: {e}")
+        return False
+
+
 # ============================================
 # Sync Log Repository - Supabase
 # ============================================
@@ -302,3 +394,56 @@ def check_conflict(table_name: str, record_id: str, version: int) -> Dict:
     except Exception as e:
         print(f"Error checking conflict: {e}")
         return {'has_conflict': False, 'remote_version': 0, 'remote_data': None}
+
+
+# ============================================
+# Batch Sync
+# ============================================
+
+# Keep id lists short enough for the PostgREST query string
+VERSION_CHECK_CHUNK = 200
+
+
+def get_versions(table_name: str, ids: List[str]) -> Optional[Dict[str, int]]:
+    """
+    Get remote versions for a batch of record ids
+    Returns: {id: version} for ids that exist remotely, None on error
+    """
+    try:
+        client = get_client()
+        if not client:
+            return None
+        
+        versions = {}
+        for i in range(0, len(ids), VERSION_CHECK_CHUNK):
+            chunk = ids[i:i + VERSION_CHECK_CHUNK]
+            result = client.table(table_name).select('id, version').in_('id', chunk).execute()
+            for row in result.data or []:
+                versions[row['id']] = row.get('version') or 0
+        return versions
+    except Exception as e:
+        print(f"Error getting versions from Supabase: {e}")
+        return None
+
+
+def bulk_upsert(table_name: str, records: List[Dict]) -> bool:
+    """Upsert a batch of records in one request"""
+    if not records:
+        return True
+    
+    try:
+        client = get_client()
+        if not client:
+            return False
+        
+        now = datetime.now().isoformat()
+        for record in records:
+            record['updated_at'] = now
+        
+        client.table(table_name).upsert(records).execute()
+        
+        print(f"✅ {len(records)} {table_name} upserted to Supabase")
+        return True
+    except Exception as e:
+        print(f"Error upserting {table_name} to Supabase: {e}")
+        return False
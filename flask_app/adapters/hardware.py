@@ -8,6 +8,11 @@ import os
 from typing import Optional, Dict, Callable, List
 from datetime import datetime
 
+from hardware.device_store import DeviceStore
+from hardware.broadcast import hub
+from hardware.stability import make_stabilizer
+from hardware.decoders import get_decoder
+
 # Check if running as frozen EXE or local Python
 IS_DESKTOP = getattr(sys, 'frozen', False) or os.getenv('RUNTIME') == 'desktop'
 
@@ -16,6 +21,8 @@ if IS_DESKTOP:
     try:
         import serial
         import serial.tools.list_ports
+        from hardware.serial_io import reactor
+        from hardware.supervisor import supervisor
         HAS_SERIAL = True
     except ImportError:
         HAS_SERIAL = False
@@ -27,7 +34,7 @@ else:
 class HardwareAdapter:
     """
     Hardware abstraction layer
-    Desktop: Real serial communication
+    Desktop: Real serial communication (unplugged devices are reopened by hardware.supervisor)
     Cloud: Returns None/simulated data
     """
     
@@ -35,25 +42,44 @@ class HardwareAdapter:
         self.devices = {}
         self.callbacks = {}
         self.running = False
+        self.store = DeviceStore()
     
-    def register_device(self, device_id: str, device_type: str, port: str, baudrate: int = 9600):
-        """Register hardware device"""
+    def register_device(self, device_id: str, device_type: str, port: str, baudrate: int = 9600,
+                        model: Optional[str] = None):
+        """Register hardware device (model picks the line decoder, see hardware/decoders.py)"""
         if not IS_DESKTOP or not HAS_SERIAL:
             print(f"Hardware registration skipped (cloud mode): {device_id}")
             return
         
+        try:
+            decoder = get_decoder(model, device_type) if device_type in ('scale', 'analyzer') else None
+        except ValueError as e:
+            print(f"Failed to register device {device_id}: {e}")
+            return
+        
+        if device_id in self.devices:
+            supervisor.unwatch(self, device_id)
+            self.release_device(device_id)
+        
         try:
             ser = serial.Serial(port=port, baudrate=baudrate, timeout=1.0)
-            self.devices[device_id] = {
-                'type': device_type,
-                'port': port,
-                'connection': ser,
-                'last_reading': None,
-                'last_seen': None
-            }
-            print(f"Registered device: {device_id} on {port}")
         except Exception as e:
-            print(f"Failed to register device {device_id}: {e}")
+            # Not plugged in yet: the supervisor opens it when it appears
+            print(f"Device {device_id} not connected on {port}: {e}")
+            ser = None
+        
+        self.devices[device_id] = {
+            'type': device_type,
+            'port': port,
+            'baudrate': baudrate,
+            'model': model,
+            'connection': ser,
+            'decoder': decoder,
+            'last_seen': None,
+            'rejected': 0,
+            'stabilizer': make_stabilizer('consecutive') if device_type == 'scale' else None
+        }
+        print(f"Registered device: {device_id} on {port}")
     
     def start_reading(self, device_id: str):
         """Start reading from device"""
@@ -64,80 +90,101 @@ class HardwareAdapter:
             print(f"Device {device_id} not registered")
             return
         
-        # Start background thread for reading
-        import threading
-        thread = threading.Thread(target=self._read_loop, args=(device_id,), daemon=True)
-        thread.start()
-        print(f"Started reading from {device_id}")
-    
-    def _read_loop(self, device_id: str):
-        """Background reading loop"""
-        if device_id not in self.devices:
+        device = self.devices[device_id]
+        if device['connection'] is not None:
+            self._attach(device_id)
+            print(f"Started reading from {device_id}")
+        supervisor.watch(self, device_id, device['port'], connected=device['connection'] is not None)
+    
+    def _attach(self, device_id: str):
+        """Shared event-driven reader, wakes only when bytes arrive"""
+        reactor.add(
+            device_id, self.devices[device_id]['connection'],
+            on_line=lambda line, device_id=device_id: self._handle_line(device_id, line),
+            on_error=self._on_port_error
+        )
+    
+    def reopen_device(self, device_id: str, port: str) -> bool:
+        """Supervisor: device is back (possibly on another port), resume reading"""
+        device = self.devices.get(device_id)
+        if not device:
+            return False
+        self.release_device(device_id)
+        try:
+            device['connection'] = serial.Serial(port=port, baudrate=device['baudrate'], timeout=1.0)
+        except Exception as e:
+            print(f"Reconnect {device_id} on {port} failed: {e}")
+            return False
+        device['port'] = port
+        if device['stabilizer'] is not None:
+            device['stabilizer'].reset()
+        self._attach(device_id)
+        print(f"Reconnected {device_id} on {port}")
+        return True
+    
+    def release_device(self, device_id: str):
+        """Stop reading a port and close it (idempotent)"""
+        reactor.remove(device_id)
+        device = self.devices.get(device_id)
+        if device and device['connection'] is not None:
+            try:
+                device['connection'].close()
+            except Exception:
+                pass
+            device['connection'] = None
+    
+    def _handle_line(self, device_id: str, line: bytes):
+        """Handle one framed line from the reader thread"""
+        device = self.devices.get(device_id)
+        if not device or not self.running:
             return
         
-        device = self.devices[device_id]
-        ser = device['connection']
+        # Decode straight from bytes; noise never becomes a reading
+        decoder = device['decoder']
+        if decoder is None:
+            parsed = {'raw': line.decode('utf-8', errors='ignore').strip()}
+        else:
+            frame = decoder.decode(line)
+            if frame is None:
+                device['rejected'] += 1
+                return
+            parsed = {'type': device['type'], **frame,
+                      'timestamp': datetime.now().isoformat(), 'raw': line.decode('ascii', errors='replace')}
         
-        while self.running and ser and ser.is_open:
-            try:
-                if ser.in_waiting > 0:
-                    raw_data = ser.readline().decode('utf-8', errors='ignore').strip()
-                    
-                    if raw_data:
-                        # Update last reading
-                        device['last_reading'] = raw_data
-                        device['last_seen'] = datetime.now()
-                        
-                        # Parse based on device type
-                        if device['type'] == 'scale':
-                            parsed = self._parse_scale(raw_data)
-                        elif device['type'] == 'analyzer':
-                            parsed = self._parse_analyzer(raw_data)
-                        else:
-                            parsed = {'raw': raw_data}
-                        
-                        # Call callbacks
-                        if device_id in self.callbacks:
-                            for callback in self.callbacks[device_id]:
-                                try:
-                                    callback(parsed)
-                                except Exception as e:
-                                    print(f"Callback error: {e}")
-                
-            except Exception as e:
-                print(f"Read error for {device_id}: {e}")
-    
-    def _parse_scale(self, raw_data: str) -> Dict:
-        """Parse weighing scale data"""
-        try:
-            # Remove units and extract number
-            clean = raw_data.replace('kg', '').replace('ST', '').replace(',', '').strip()
-            weight = float(clean)
-            return {
-                'type': 'scale',
-                'weight': weight,
-                'unit': 'kg',
-                'timestamp': datetime.now().isoformat(),
-                'raw': raw_data
-            }
-        except:
-            return {'type': 'scale', 'error': 'Parse failed', 'raw': raw_data}
-    
-    def _parse_analyzer(self, raw_data: str) -> Dict:
-        """Parse milk analyzer data"""
-        try:
-            # Expected format: FAT:4.5,SNF:8.5,TEMP:35.0
-            parts = raw_data.split(',')
-            data = {'type': 'analyzer', 'timestamp': datetime.now().isoformat()}
-            
-            for part in parts:
-                if ':' in part:
-                    key, value = part.split(':')
-                    data[key.strip().lower()] = float(value.strip())
-            
-            return data
-        except:
-            return {'type': 'analyzer', 'error': 'Parse failed', 'raw': raw_data}
+        device['last_seen'] = datetime.now()
+        
+        # Stable weights (settled cans) are what the collection screen records
+        stable_weight = None
+        if device['stabilizer'] is not None and 'weight' in parsed:
+            if parsed['motion']:
+                # The scale itself reports motion: the next settle is a new can
+                device['stabilizer'].reset()
+                parsed['stable'] = False
+            else:
+                parsed['stable'], stable_weight = device['stabilizer'].add_reading(parsed['weight'])
+        
+        # Latest value, readable by any number of pollers
+        seq = self.store.publish(device_id, parsed)
+        
+        # Push to streaming clients (SSE), coalesced per client
+        if stable_weight is not None:
+            hub.publish('weight', {**parsed, 'device_id': device_id, 'seq': seq, 'weight': round(stable_weight, 3)})
+        elif device['type'] == 'analyzer':
+            hub.publish('analyzer', {**parsed, 'device_id': device_id, 'seq': seq})
+        
+        # Call callbacks
+        if device_id in self.callbacks:
+            for callback in self.callbacks[device_id]:
+                try:
+                    callback(parsed)
+                except Exception as e:
+                    print(f"Callback error: {e}")
+    
+    def _on_port_error(self, device_id: str, error: Exception):
+        """Port failed (unplugged, driver error)"""
+        print(f"Read error for {device_id}: {error}")
+        self.release_device(device_id)
+        supervisor.lost(self, device_id, error)
     
     def register_callback(self, device_id: str, callback: Callable):
         """Register callback for device readings"""
@@ -146,27 +193,56 @@ class HardwareAdapter:
         self.callbacks[device_id].append(callback)
     
     def get_latest_reading(self, device_id: str) -> Optional[Dict]:
-        """Get latest reading from device"""
-        if not IS_DESKTOP or not HAS_SERIAL:
-            return None
-        
-        if device_id not in self.devices:
-            return None
+        """Get latest parsed reading from device (does not consume it)"""
+        return self.get_reading_state(device_id)[1]
+    
+    def get_reading_state(self, device_id: str, after_seq: int = 0, wait: float = 0) -> tuple:
+        """
+        (seq, reading) of the latest reading
+        With wait > 0, waits up to `wait` seconds for a reading newer than after_seq
+        Returns (after_seq, None) if nothing newer arrived
+        """
+        if not IS_DESKTOP or not HAS_SERIAL or device_id not in self.devices:
+            return after_seq, None
         
-        device = self.devices[device_id]
-        return device.get('last_reading')
+        seq, reading = self.store.latest(device_id)
+        if seq > after_seq:
+            return seq, reading
+        if wait > 0:
+            newer = self.store.wait_newer(device_id, after_seq, wait)
+            if newer:
+                return newer
+        return after_seq, None
+    
+    def get_reading_history(self, device_id: str, since_seq: int = 0) -> List:
+        """Recent (seq, reading) pairs, oldest first"""
+        return self.store.history(device_id, since_seq)
     
     def stop_all(self):
         """Stop all devices"""
         self.running = False
-        for device_id, device in self.devices.items():
+        for device_id in self.devices:
             try:
-                if device['connection'] and device['connection'].is_open:
-                    device['connection'].close()
+                supervisor.unwatch(self, device_id)
+                self.release_device(device_id)
             except:
                 pass
         print("All hardware devices stopped")
     
+    def get_device_health(self, device_id: str) -> Dict:
+        """Connection state, reconnect counts and downtime"""
+        device = self.devices.get(device_id)
+        if not device:
+            return {}
+        return {
+            'type': device['type'],
+            'model': device['model'],
+            'port': device['port'],
+            'last_seen': device['last_seen'].isoformat() if device['last_seen'] else None,
+            'rejected': device['rejected'],
+            **supervisor.health(self, device_id)
+        }
+    
     def list_ports(self) -> List[Dict]:
         """List available serial ports"""
         if not IS_DESKTOP or not HAS_SERIAL:
@@ -206,6 +282,26 @@ def get_latest_analyzer() -> Optional[Dict]:
     return hardware.get_latest_reading('analyzer_01')
 
 
+def get_weight_state(after_seq: int = 0, wait: float = 0) -> tuple:
+    """(seq, weight) for long-polling clients, weight None if nothing newer"""
+    seq, reading = hardware.get_reading_state('scale_01', after_seq, wait)
+    if reading and 'weight' in reading:
+        return seq, reading['weight']
+    return seq, None
+
+
+def get_analyzer_state(after_seq: int = 0, wait: float = 0) -> tuple:
+    """(seq, reading) for long-polling clients"""
+    return hardware.get_reading_state('analyzer_01', after_seq, wait)
+
+
+def get_hardware_status() -> Dict:
+    """Health of every registered device"""
+    if not IS_DESKTOP or not HAS_SERIAL:
+        return {}
+    return {device_id: hardware.get_device_health(device_id) for device_id in hardware.devices}
+
+
 def start_hardware():
     """Start hardware (desktop only)"""
     if not IS_DESKTOP:
@@ -214,9 +310,13 @@ def start_hardware():
     
     hardware.running = True
     
-    # Register default devices
-    hardware.register_device('scale_01', 'scale', os.getenv('SCALE_PORT', 'COM3'))
-    hardware.register_device('analyzer_01', 'analyzer', os.getenv('ANALYZER_PORT', 'COM4'))
+    # Register default devices (unless configured already)
+    if 'scale_01' not in hardware.devices:
+        hardware.register_device('scale_01', 'scale', os.getenv('SCALE_PORT', 'COM3'),
+                                 model=os.getenv('SCALE_MODEL'))
+    if 'analyzer_01' not in hardware.devices:
+        hardware.register_device('analyzer_01', 'analyzer', os.getenv('ANALYZER_PORT', 'COM4'),
+                                 model=os.getenv('ANALYZER_MODEL'))
     
     # Start reading
     hardware.start_reading('scale_01')
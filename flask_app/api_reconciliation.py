@@ -235,39 +235,43 @@ def get_conversion_batches():
 
 @reconciliation_bp.route('/api/analytics/daily-summary', methods=['GET'])
 def get_daily_summary():
-    """Get daily reconciliation summary"""
+    """
+    Get daily reconciliation summary
+    Reads the precomputed daily_summary rollup (DAILY_SUMMARY_SCHEMA.sql), kept
+    current by triggers on shift close, conversion batches and sales
+    """
     try:
         shop_id = request.args.get('shop_id')
         summary_date = request.args.get('date', date.today().isoformat())
         
-        # Get today's shifts
-        shifts = supabase.table('shifts').select('*').eq('shift_date', summary_date)
+        query = supabase.table('daily_summary').select('*').eq('summary_date', summary_date)
         if shop_id:
-            shifts = shifts.eq('shop_id', shop_id)
-        shifts = shifts.execute()
+            query = query.eq('shop_id', shop_id).limit(1)
+        rows = query.execute().data or []
         
-        # Aggregate data
-        total_milk_collected = sum(s.get('total_milk_collected', 0) for s in shifts.data or [])
-        total_milk_converted = sum(s.get('total_milk_converted', 0) for s in shifts.data or [])
-        total_sales = sum(s.get('total_sales_amount', 0) for s in shifts.data or [])
+        # One row for a shop, one row per shop when shop_id is omitted
+        def total(field):
+            return sum(float(row.get(field) or 0) for row in rows)
         
-        # Get conversion batches
-        batches = supabase.table('conversion_batches').select('*').eq('shift_id', 'in', [s['id'] for s in shifts.data or []])
-        batches = batches.execute()
-        
-        products_produced = sum(b.get('product_quantity', 0) for b in batches.data or [])
+        milk_collected = total('milk_collected')
+        milk_converted = total('milk_converted')
+        products_produced = total('products_produced')
+        revenue = total('revenue')
+        cost = total('milk_cost')
         
         summary = {
             'date': summary_date,
-            'milkIn': total_milk_collected,
-            'milkConverted': total_milk_converted,
-            'milkLeft': total_milk_collected - total_milk_converted,
+            'milkIn': milk_collected,
+            'milkConverted': milk_converted,
+            'milkLeft': milk_collected - milk_converted,
             'productsProduced': products_produced,
             'productsSold': 0,  # Would need to calculate from sales
             'productsLeft': products_produced,
-            'revenue': total_sales,
-            'cost': total_milk_collected * 64,  # Average milk rate
-            'margin': total_sales - (total_milk_collected * 64)
+            'revenue': revenue,
+            'cost': cost,
+            'margin': revenue - cost,
+            'salesCount': int(total('sales_count')),
+            'shiftsClosed': int(total('shifts_closed'))
         }
         
         return jsonify({'success': True, 'summary': summary})
@@ -275,63 +279,86 @@ def get_daily_summary():
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+@reconciliation_bp.route('/api/analytics/daily-summary/rebuild', methods=['POST'])
+def rebuild_daily_summary():
+    """
+    Backfill daily summary rollups in bulk
+    Body: {from: YYYY-MM-DD, to: YYYY-MM-DD (default today), shop_id (optional)}
+    """
+    try:
+        data = request.json or {}
+        date_from = data.get('from')
+        date_to = data.get('to', date.today().isoformat())
+        
+        if not date_from:
+            return jsonify({'error': 'from is required', 'success': False}), 400
+        date.fromisoformat(date_from)
+        date.fromisoformat(date_to)
+        
+        result = supabase.rpc('rebuild_daily_summary', {
+            'p_from': date_from,
+            'p_to': date_to,
+            'p_shop_id': data.get('shop_id')
+        }).execute()
+        
+        return jsonify({
+            'success': True,
+            'rows_rebuilt': result.data,
+            'message': f'Daily summaries rebuilt from {date_from} to {date_to}'
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date: {e}', 'success': False}), 400
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
 @reconciliation_bp.route('/api/analytics/farmer-rankings', methods=['GET'])
 def get_farmer_rankings():
-    """Get farmer quality rankings"""
+    """
+    Get farmer quality rankings
+    Aggregated in Postgres by get_farmer_rankings() (FARMER_RANKINGS_SCHEMA.sql),
+    only the top `limit` farmers are transferred
+    Query: shop_id, from, to (YYYY-MM-DD, inclusive), limit
+    """
     try:
         shop_id = request.args.get('shop_id')
-        limit = request.args.get('limit', 50)
-        
-        # Get milk collections grouped by farmer
-        collections = supabase.table('milk_collections').select('farmer_id, farmer_name, quantity, fat, snf')
-        if shop_id:
-            collections = collections.eq('shop_id', shop_id)
-        collections = collections.execute()
-        
-        # Calculate averages per farmer
-        farmer_data = {}
-        for collection in collections.data or []:
-            farmer_id = collection.get('farmer_id')
-            if farmer_id not in farmer_data:
-                farmer_data[farmer_id] = {
-                    'farmer_id': farmer_id,
-                    'farmer_name': collection.get('farmer_name', ''),
-                    'total_quantity': 0,
-                    'total_fat': 0,
-                    'total_snf': 0,
-                    'count': 0
-                }
-            
-            farmer_data[farmer_id]['total_quantity'] += collection.get('quantity', 0) or 0
-            farmer_data[farmer_id]['total_fat'] += collection.get('fat', 0) or 0
-            farmer_data[farmer_id]['total_snf'] += collection.get('snf', 0) or 0
-            farmer_data[farmer_id]['count'] += 1
-        
-        # Calculate quality scores
-        rankings = []
-        for farmer_id, data in farmer_data.items():
-            if data['count'] > 0:
-                avg_fat = data['total_fat'] / data['count']
-                avg_snf = data['total_snf'] / data['count']
-                
-                # Quality score: FAT 60%, SNF 40%
-                fat_score = min(100, (avg_fat / 6.0) * 60)
-                snf_score = min(100, (avg_snf / 9.0) * 40)
-                quality_score = fat_score + snf_score
-                
-                rankings.append({
-                    'farmer_id': farmer_id,
-                    'farmer_name': data['farmer_name'],
-                    'avg_fat': round(avg_fat, 2),
-                    'avg_snf': round(avg_snf, 2),
-                    'quality_score': round(quality_score, 2),
-                    'total_milk': round(data['total_quantity'], 2)
-                })
-        
-        # Sort by quality score
-        rankings.sort(key=lambda x: x['quality_score'], reverse=True)
-        
-        return jsonify({'success': True, 'rankings': rankings[:int(limit)]})
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        limit = min(int(request.args.get('limit', 50)), 500)
+        
+        for value in (date_from, date_to):
+            if value:
+                date.fromisoformat(value)
+        
+        result = supabase.rpc('get_farmer_rankings', {
+            'p_shop_id': shop_id,
+            'p_from': date_from,
+            'p_to': date_to,
+            'p_limit': limit
+        }).execute()
+        
+        rankings = [{
+            'farmer_id': row['farmer_id'],
+            'farmer_name': row['farmer_name'],
+            'avg_fat': float(row['avg_fat']),
+            'avg_snf': float(row['avg_snf']),
+            'quality_score': float(row['quality_score']),
+            'total_milk': float(row['total_milk'])
+        } for row in result.data or []]
+        
+        return jsonify({'success': True, 'rankings': rankings})
+        
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}', 'success': False}), 400
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@reconciliation_bp.route('/api/analytics/farmer-rankings/refresh', methods=['POST'])
+def refresh_farmer_rankings():
+    """Refresh the monthly rollup behind farmer rankings (for schedulers without pg_cron)"""
+    try:
+        supabase.rpc('refresh_farmer_quality_monthly', {}).execute()
+        return jsonify({'success': True, 'message': 'Farmer rankings refreshed'})
         
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
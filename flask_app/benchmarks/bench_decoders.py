@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord Desktop - Device Decoder Benchmark
+
+1. Checks every captured line in fixtures/serial_lines.jsonl against its
+   expected reading (exit code 1 on any mismatch)
+2. Per model: how many corpus lines the legacy parsing gets right, and lines/s:
+  - legacy:   the old str parsing (decode, replace('kg',''), split(',')/split(':'))
+  - decoder:  hardware.decoders, bytes in, reading dict out
+
+Corpus lines are JSON strings; each char is one byte (latin-1), so binary
+frames (STX, status bytes) survive the round trip.
+
+Usage:
+    python flask_app/benchmarks/bench_decoders.py [--lines 200000]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hardware.decoders import DECODERS  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'serial_lines.jsonl')
+
+
+def load_corpus():
+    with open(CORPUS, encoding='utf-8') as f:
+        return [json.loads(row) for row in f if row.strip()]
+
+
+def legacy_scale(line):
+    """The old adapters/hardware.py _parse_scale"""
+    raw_data = line.decode('utf-8', errors='ignore').strip()
+    try:
+        clean = raw_data.replace('kg', '').replace('ST', '').replace(',', '').strip()
+        return {'weight': float(clean)}
+    except ValueError:
+        return None
+
+
+def legacy_analyzer(line):
+    """The old adapters/hardware.py _parse_analyzer"""
+    raw_data = line.decode('utf-8', errors='ignore').strip()
+    try:
+        data = {}
+        for part in raw_data.split(','):
+            if ':' in part:
+                key, value = part.split(':')
+                data[key.strip().lower()] = float(value.strip())
+        return data
+    except ValueError:
+        return None
+
+
+def check_corpus(corpus):
+    failures = 0
+    for row in corpus:
+        got = DECODERS[row['model']].decode(row['line'].encode('latin-1'))
+        if got != row['expect']:
+            failures += 1
+            print(f"  MISMATCH {row['model']:<18} {row['line']!r}: expected {row['expect']}, got {got}")
+    print(f"corpus: {len(corpus)} lines, {failures} mismatches")
+    return failures
+
+
+def legacy_correct(legacy, rows):
+    """Corpus lines where the old parsing yields the expected weight / FAT+SNF (or rejects)"""
+    correct = 0
+    for row in rows:
+        got, expect = legacy(row['line'].encode('latin-1')), row['expect']
+        if expect is None:
+            correct += not got or ('weight' not in got and 'fat' not in got)
+        elif got:
+            correct += all(got.get(key) == expect[key] for key in ('weight', 'fat', 'snf') if key in expect)
+    return correct
+
+
+def throughput(parse, lines, total):
+    """lines/s for parse over `total` lines cycling through `lines`"""
+    batch = (lines * (total // len(lines) + 1))[:total]
+    started = time.perf_counter()
+    for line in batch:
+        parse(line)
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Device decoder benchmark')
+    parser.add_argument('--lines', type=int, default=200000)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = check_corpus(corpus)
+
+    print(f"\n{'model':<20}{'legacy correct':>16}{'legacy lines/s':>16}{'decoder lines/s':>18}")
+    for model in sorted({row['model'] for row in corpus}):
+        rows = [row for row in corpus if row['model'] == model]
+        lines = [row['line'].encode('latin-1') for row in rows]
+        decoder = DECODERS[model]
+        legacy = legacy_scale if decoder.kind == 'scale' else legacy_analyzer
+        correct = f"{legacy_correct(legacy, rows)}/{len(rows)}"
+        legacy_rate = throughput(legacy, lines, args.lines)
+        decoder_rate = throughput(decoder.decode, lines, args.lines)
+        print(f"{model:<20}{correct:>16}{legacy_rate:>16,.0f}{decoder_rate:>18,.0f}")
+
+    # The line a scale sends most: one stable weight
+    hot = b'ST,GS,+0012.34kg'
+    legacy_rate = throughput(legacy_scale, [hot], args.lines)
+    decoder_rate = throughput(DECODERS['generic_scale'].decode, [hot], args.lines)
+    print(f"{'single weight line':<20}{'':>16}{legacy_rate:>16,.0f}{decoder_rate:>18,.0f}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord Desktop - Hardware Path Benchmark
+
+Drives SerialDeviceManager with virtual devices (hardware/simulator.py)
+over pseudo-terminals, through the real reader, decoders and stabilizers:
+
+  latency:         analyzer lines at several rates with injected garbage;
+                   byte-to-callback latency (p50/p95/p99), dropped readings,
+                   rejected garbage, reader-thread and process CPU
+  time-to-stable:  cans poured onto a noisy scale, one virtual scale per
+                   stabilizer fed the identical stream; time from the first
+                   settled reading to the stable callback, missed cans,
+                   spurious stable weights and weight error
+
+Process CPU includes the simulator's writer threads; reader CPU is the
+I/O thread alone (Linux /proc). POSIX only.
+
+Usage:
+    python flask_app/benchmarks/bench_hardware_path.py [--rates 10,100,1000,0] [--seconds 3]
+        [--scale-rate 20] [--cans 10] [--noise 0,0.004,0.008] [--garbage 0.05]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hardware.serial_io import SerialReactor  # noqa: E402
+from hardware.serial_manager import SerialDeviceManager, DeviceConfig, DeviceType  # noqa: E402
+from hardware.simulator import VirtualSerialDevice, analyzer_samples, scale_session  # noqa: E402
+from hardware.stability import STABILIZERS  # noqa: E402
+
+# Stable weights within this of the can count as correct
+WEIGHT_ERROR_KG = 0.05
+
+
+def thread_cpu(native_id):
+    """CPU seconds used by one thread (None where /proc is unavailable)"""
+    try:
+        with open(f'/proc/self/task/{native_id}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Run:
+    """A manager on its own reactor plus its virtual devices"""
+
+    def __init__(self):
+        self.reactor = SerialReactor()
+        self.manager = SerialDeviceManager(io_reactor=self.reactor)
+        self.devices = []
+        self.reader_tid = None
+
+    def add(self, device_id, device_type, virtual, **config):
+        self.manager.register_device(DeviceConfig(device_id, device_type, virtual.port, **config))
+        self.devices.append((device_id, virtual))
+
+    def callback(self, device_id, callback):
+        def wrapped(reading):
+            if self.reader_tid is None:
+                self.reader_tid = threading.get_native_id()
+            callback(reading)
+        self.manager.register_callback(device_id, wrapped)
+
+    def execute(self, timeout):
+        """Start everything, wait for the streams to finish, returns (wall, process cpu, reader cpu)"""
+        for device_id, _ in self.devices:
+            self.manager.start_device(device_id)
+        time.sleep(0.2)
+
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        for _, virtual in self.devices:
+            virtual.start()
+        for _, virtual in self.devices:
+            virtual.join(timeout)
+        time.sleep(0.3)   # drain
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+        reader_cpu = thread_cpu(self.reader_tid) if self.reader_tid else None
+
+        self.manager.stop_all()
+        self.reactor.stop()
+        for _, virtual in self.devices:
+            virtual.stop()
+        return wall, cpu, reader_cpu
+
+
+def bench_latency(rate, seconds, burst, garbage):
+    count = int(rate * seconds) if rate else burst
+    sent_at = {}
+    received = []
+
+    virtual = VirtualSerialDevice(analyzer_samples(count, seed=1), rate=rate or None, garbage=garbage,
+                                  on_write=lambda line, index, t: sent_at.__setitem__(index, t), seed=2)
+    run = Run()
+    run.add('analyzer', DeviceType.MILK_ANALYZER, virtual)
+    run.callback('analyzer', lambda reading: received.append((int(reading.density), time.perf_counter())))
+    wall, cpu, reader_cpu = run.execute(timeout=seconds * 3 + 30)
+
+    latencies = [(t - sent_at[index]) * 1e6 for index, t in received if index in sent_at]
+    health = run.manager.get_device_health('analyzer')
+    reader = f"{reader_cpu / wall * 100:6.1f}" if reader_cpu is not None else f"{'n/a':>6}"
+    label = f"{rate}/s" if rate else 'unthrottled'
+    print(f"{label:<12}{virtual.sent:>8}{health['packets_received']:>10}{health['rejected']:>6}/{virtual.garbage_sent:<6}"
+          f"{virtual.sent - health['packets_received']:>8}"
+          f"{percentile(latencies, 0.5):>9.0f}{percentile(latencies, 0.95):>9.0f}{percentile(latencies, 0.99):>9.0f}"
+          f"{reader:>9}{cpu / wall * 100:>9.1f}")
+
+
+def bench_stability(rate, cans, noise, garbage):
+    weights = [round(5 + i * 1.37 % 20, 2) for i in range(cans)]
+    run = Run()
+    settles = {name: [] for name in STABILIZERS}
+    stables = {name: [] for name in STABILIZERS}
+
+    for name in STABILIZERS:
+        # Identical streams: same session seed, same garbage seed
+        virtual = VirtualSerialDevice(
+            scale_session(weights, noise=noise, motion_fmt=b'US,GS,%+08.2fkg', seed=3),
+            rate=rate, garbage=garbage, seed=4, name=name,
+            on_write=lambda line, mark, t, name=name: mark and settles[name].append((t, mark[1])))
+        run.add(name, DeviceType.WEIGHING_SCALE, virtual, stability=name)
+        run.callback(name, lambda reading, name=name: stables[name].append((time.perf_counter(), reading.value)))
+
+    lines_per_can = 5 + 4 + 20
+    run.execute(timeout=(cans + 1) * lines_per_can / rate * 2 + 30)
+
+    for name, emitted in stables.items():
+        delays, errors = [], []
+        spurious = 0
+        cans_settled = settles[name]
+        for i, (settled_at, weight) in enumerate(cans_settled):
+            window_end = cans_settled[i + 1][0] if i + 1 < len(cans_settled) else float('inf')
+            hits = [(t, value) for t, value in emitted if settled_at <= t < window_end and value >= 0.1]
+            if hits:
+                delays.append((hits[0][0] - settled_at) * 1000)
+                errors.append(abs(hits[0][1] - weight))
+            spurious += sum(1 for _, value in hits if abs(value - weight) > WEIGHT_ERROR_KG)
+        missed = len(cans_settled) - len(delays)
+        mean = sum(delays) / len(delays) if delays else float('nan')
+        print(f"{name:<13}{noise:>7.3f}{len(cans_settled):>6}{len(delays):>8}{missed:>8}{spurious:>10}"
+              f"{mean:>10.0f}{mean * rate / 1000:>9.1f}{percentile(delays, 0.95):>9.0f}"
+              f"{max(errors) if errors else float('nan'):>11.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hardware path benchmark (simulated devices)')
+    parser.add_argument('--rates', default='10,100,1000,0', help='analyzer lines/s, 0 = unthrottled')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--burst', type=int, default=20000, help='lines for the unthrottled run')
+    parser.add_argument('--garbage', type=float, default=0.05)
+    parser.add_argument('--scale-rate', type=float, default=20.0, help='scale lines/s')
+    parser.add_argument('--cans', type=int, default=10)
+    parser.add_argument('--noise', default='0,0.004,0.008', help='scale noise levels (kg std deviation)')
+    args = parser.parse_args()
+
+    print(f"Latency: analyzer lines, {args.garbage:.0%} garbage lines injected\n")
+    print(f"{'rate':<12}{'sent':>8}{'received':>10}{'rejected':>13}{'dropped':>8}"
+          f"{'p50 us':>9}{'p95 us':>9}{'p99 us':>9}{'reader%':>9}{'process%':>9}")
+    for rate in (float(r) for r in args.rates.split(',')):
+        bench_latency(int(rate), args.seconds, args.burst, args.garbage)
+
+    print(f"\nTime to stable: {args.cans} cans at {args.scale_rate:.0f} lines/s, "
+          f"motion flagged while pouring, {args.garbage:.0%} garbage\n")
+    print(f"{'stabilizer':<13}{'noise':>7}{'cans':>6}{'stable':>8}{'missed':>8}{'spurious':>10}"
+          f"{'mean ms':>10}{'samples':>9}{'p95 ms':>9}{'max err kg':>11}")
+    for noise in (float(n) for n in args.noise.split(',')):
+        bench_stability(args.scale_rate, args.cans, noise, args.garbage)
+
+
+if __name__ == '__main__':
+    main()
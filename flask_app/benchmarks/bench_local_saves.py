@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord Desktop - Local Save Microbenchmark
+
+Measures sales saved per second through adapters/db_local.py against a
+throwaway database:
+  - per-call:  a fresh connection per repository call (the old behaviour)
+  - persistent: the thread-local persistent connection
+  - unit of work: N saves sharing one transaction
+
+Usage:
+    python flask_app/benchmarks/bench_local_saves.py [--saves 2000] [--batch 100]
+"""
+
+import os
+import sys
+import time
+import json
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adapters import db_local  # noqa: E402
+
+
+def legacy_connection():
+    """Connection setup as every call used to do it"""
+    conn = sqlite3.connect(db_local.DB_PATH, timeout=30.0)
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.row_factory = sqlite3.Row
+    db_local._local.depth = 0
+    return conn
+
+
+def make_sale(i):
+    """A small counter sale"""
+    return {
+        'customer_name': 'Walking Customer',
+        'items': json.dumps([{'name': 'Milk', 'qty': 1, 'price': 64.0}]),
+        'total_amount': 64.0 + i % 7,
+        'paid_amount': 64.0 + i % 7,
+        'payment_mode': 'cash'
+    }
+
+
+def run(label, saves, save_all):
+    """Time one mode, returns saves/sec"""
+    started = time.perf_counter()
+    save_all(saves)
+    elapsed = time.perf_counter() - started
+    rate = saves / elapsed
+    print(f"{label:<14} {saves:>6} saves  {elapsed:7.3f}s  {rate:9.0f} saves/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local SQLite save microbenchmark')
+    parser.add_argument('--saves', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=100, help='saves per unit of work')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Device config and databases all go to the throwaway directory
+        db_local.DB_DIR = tmp
+
+        def save_each(n):
+            for i in range(n):
+                if not db_local.sale_save(make_sale(i)):
+                    raise RuntimeError('save failed')
+
+        def save_batched(n):
+            for start in range(0, n, args.batch):
+                with db_local.transaction():
+                    for i in range(start, min(start + args.batch, n)):
+                        if not db_local.sale_save(make_sale(i)):
+                            raise RuntimeError('save failed')
+
+        # Before: new connection per call, default rollback journal
+        db_local.DB_PATH = os.path.join(tmp, 'before.db')
+        db_local.init_db()
+        db_local.close_connection()
+        conn = legacy_connection()
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.close()
+
+        persistent = db_local.get_connection
+        db_local.get_connection = legacy_connection
+        try:
+            before = run('per-call', args.saves, save_each)
+        finally:
+            db_local.get_connection = persistent
+
+        # After: one connection per thread
+        db_local.DB_PATH = os.path.join(tmp, 'after.db')
+        db_local.init_db()
+        after = run('persistent', args.saves, save_each)
+        batched = run(f'uow x{args.batch}', args.saves, save_batched)
+
+        db_local.close_connection()
+
+    print(f"\npersistent vs per-call: {after / before:.1f}x, "
+          f"unit of work vs per-call: {batched / before:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
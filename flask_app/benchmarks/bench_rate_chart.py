@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord Desktop - Rate Chart Microbenchmark
+
+Prices synthetic collections against a FAT x SNF chart (cow 3.0-6.0 FAT,
+buffalo 5.0-10.0 FAT, SNF 7.5-9.5, breakpoints every 0.5):
+  - single:  core/rate_chart RateChart.price for one reading
+  - loop:    per-row Python bilinear lookup over the chart breakpoints
+  - vector:  RateChart.reprice for the whole batch in one call
+
+Default batch is a 10-day payment cycle for a 300-farmer centre
+(300 farmers x 2 shifts x 10 days = 6,000 rows); --rows for a month or more.
+
+Usage:
+    python flask_app/benchmarks/bench_rate_chart.py [--rows 6000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from bisect import bisect_right
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.rate_chart import RateChart  # noqa: E402
+
+
+def make_chart_rows():
+    """Breakpoint chart, rates rise with FAT and SNF"""
+    rows = []
+    for milk_type, fat_lo, fat_hi, base in (('cow', 3.0, 6.0, 30.0), ('buffalo', 5.0, 10.0, 45.0)):
+        fat = fat_lo
+        while fat <= fat_hi + 1e-9:
+            snf = 7.5
+            while snf <= 9.5 + 1e-9:
+                rows.append({'milk_type': milk_type, 'fat': round(fat, 1), 'snf': round(snf, 1),
+                             'rate': round(base + (fat - fat_lo) * 6.5 + (snf - 7.5) * 2.5, 2)})
+                snf += 0.5
+            fat += 0.5
+    return rows
+
+
+def make_collections(count):
+    rng = random.Random(42)
+    rows = []
+    for _ in range(count):
+        milk_type = 'buffalo' if rng.random() < 0.4 else 'cow'
+        fat = round(rng.uniform(5.0, 9.0) if milk_type == 'buffalo' else rng.uniform(3.0, 5.5), 1)
+        rows.append((round(rng.uniform(2, 25), 2), fat, round(rng.uniform(7.8, 9.3), 1), milk_type))
+    return rows
+
+
+def loop_pricer(chart_rows):
+    """The per-row way: bisect breakpoints and interpolate in Python"""
+    tables = {}
+    for row in chart_rows:
+        tables.setdefault(row['milk_type'], {})[(row['fat'], row['snf'])] = row['rate']
+    axes = {t: (sorted({f for f, _ in cells}), sorted({s for _, s in cells})) for t, cells in tables.items()}
+
+    def bracket(axis, value):
+        value = min(max(value, axis[0]), axis[-1])
+        i = min(max(bisect_right(axis, value) - 1, 0), len(axis) - 2)
+        return axis[i], axis[i + 1], (value - axis[i]) / (axis[i + 1] - axis[i])
+
+    def price(fat, snf, milk_type):
+        cells = tables[milk_type]
+        fats, snfs = axes[milk_type]
+        f0, f1, tf = bracket(fats, fat)
+        s0, s1, ts = bracket(snfs, snf)
+        low = cells[(f0, s0)] + (cells[(f0, s1)] - cells[(f0, s0)]) * ts
+        high = cells[(f1, s0)] + (cells[(f1, s1)] - cells[(f1, s0)]) * ts
+        return round(low + (high - low) * tf, 2)
+    return price
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rate chart microbenchmark')
+    parser.add_argument('--rows', type=int, default=6000)
+    args = parser.parse_args()
+
+    chart_rows = make_chart_rows()
+    started = time.perf_counter()
+    chart = RateChart.from_rows(chart_rows)
+    print(f"compile        {len(chart_rows)} breakpoints  {(time.perf_counter() - started) * 1000:8.2f} ms")
+
+    collections = make_collections(args.rows)
+
+    n = 20000
+    started = time.perf_counter()
+    for i in range(n):
+        chart.price(4.1, 8.6, 'cow')
+    print(f"single         {(time.perf_counter() - started) / n * 1e6:8.2f} us per reading")
+
+    price = loop_pricer(chart_rows)
+    started = time.perf_counter()
+    loop_amounts = [round(qty * price(fat, snf, t), 2) for qty, fat, snf, t in collections]
+    loop_s = time.perf_counter() - started
+    print(f"loop           {args.rows} rows  {loop_s * 1000:8.2f} ms")
+
+    started = time.perf_counter()
+    quantity, fat, snf, types = zip(*collections)
+    _, amounts = chart.reprice(quantity, fat, snf, types)
+    vector_s = time.perf_counter() - started
+    print(f"vector         {args.rows} rows  {vector_s * 1000:8.2f} ms  ({loop_s / vector_s:.1f}x)")
+
+    mismatches = sum(1 for a, b in zip(loop_amounts, amounts.tolist()) if abs(a - b) > 0.011)
+    print(f"amount mismatches vs loop: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
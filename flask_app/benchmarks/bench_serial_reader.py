@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MilkRecord Desktop - Serial Reader CPU Benchmark
+
+Simulates N serial devices on pseudo-terminals and measures process CPU
+while they are read:
+  - busy-poll: one thread per device spinning on in_waiting (the old loop)
+  - reactor:   hardware.serial_io, one selector thread for all devices
+
+Each mode runs twice: idle (no traffic) and loaded (--rate lines/s per device).
+POSIX only (uses os.openpty).
+
+Usage:
+    python flask_app/benchmarks/bench_serial_reader.py [--devices 2] [--rate 50] [--seconds 5]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hardware.serial_io import SerialReactor  # noqa: E402
+
+
+def open_devices(count):
+    """Pseudo-terminal pairs: (master fd the simulator writes, slave Serial the app reads)"""
+    pairs = []
+    for _ in range(count):
+        master, slave = os.openpty()
+        ser = serial.Serial(os.ttyname(slave), baudrate=9600, timeout=1.0)
+        pairs.append((master, slave, ser))
+    return pairs
+
+
+def close_devices(pairs):
+    for master, slave, ser in pairs:
+        ser.close()
+        os.close(master)
+        os.close(slave)
+
+
+def busy_poll_reader(pairs, counter, stop):
+    """The old per-device loop: check in_waiting forever"""
+    def loop(ser):
+        while not stop.is_set() and ser.is_open:
+            try:
+                if ser.in_waiting > 0:
+                    if ser.readline().strip():
+                        counter[0] += 1
+            except Exception:
+                time.sleep(0.1)
+
+    threads = [threading.Thread(target=loop, args=(ser,), daemon=True) for _, _, ser in pairs]
+    for thread in threads:
+        thread.start()
+
+    def shutdown():
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=2)
+    return shutdown
+
+
+def reactor_reader(pairs, counter, stop):
+    """All devices on one event-driven reader"""
+    reactor = SerialReactor()
+
+    def on_line(line):
+        counter[0] += 1
+
+    for i, (_, _, ser) in enumerate(pairs):
+        reactor.add(f'dev{i}', ser, on_line)
+
+    def shutdown():
+        stop.set()
+        reactor.stop()
+    return shutdown
+
+
+def simulate(pairs, rate, seconds):
+    """Write scale readings at `rate` lines/s per device"""
+    if rate <= 0:
+        time.sleep(seconds)
+        return 0
+
+    interval = 1.0 / rate
+    sent = 0
+    deadline = time.perf_counter() + seconds
+    next_tick = time.perf_counter()
+    while next_tick < deadline:
+        for master, _, _ in pairs:
+            os.write(master, f'ST,{12 + sent % 100 / 100:.2f},kg\r\n'.encode())
+            sent += 1
+        next_tick += interval
+        time.sleep(max(0.0, next_tick - time.perf_counter()))
+    return sent
+
+
+def run(label, make_reader, devices, rate, seconds):
+    """One measurement, returns CPU % of one core"""
+    pairs = open_devices(devices)
+    counter = [0]
+    stop = threading.Event()
+    shutdown = make_reader(pairs, counter, stop)
+    time.sleep(0.2)  # let readers settle
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    sent = simulate(pairs, rate, seconds)
+    time.sleep(0.2)  # drain
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+
+    shutdown()
+    close_devices(pairs)
+
+    percent = cpu / wall * 100
+    print(f"{label:<22} sent {sent:>6}  read {counter[0]:>6}  cpu {cpu:6.3f}s  {percent:6.1f}% of a core")
+    return percent
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serial reader CPU benchmark')
+    parser.add_argument('--devices', type=int, default=2)
+    parser.add_argument('--rate', type=int, default=50, help='lines per second per device')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.devices} devices, {args.seconds:.0f}s per run\n")
+    results = {}
+    for label, reader in (('busy-poll', busy_poll_reader), ('reactor', reactor_reader)):
+        results[(label, 'idle')] = run(f'{label} idle', reader, args.devices, 0, args.seconds)
+        results[(label, 'load')] = run(f'{label} {args.rate}/s', reader, args.devices, args.rate, args.seconds)
+
+    print()
+    for load in ('idle', 'load'):
+        before, after = results[('busy-poll', load)], results[('reactor', load)]
+        print(f"{load:<5} busy-poll {before:6.1f}%  ->  reactor {after:6.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Collection Pipeline - Weigh-and-Test at the Counter
+Pairs the next stable scale weight with the next valid analyzer reading for
+the farmer at the counter, prices it and writes the milk_collections row
+in one local transaction (replicated write-behind by the sync engine)
+
+Works with any reading source exposing register_callback(device_id, callback):
+hardware.serial_manager.SerialDeviceManager or adapters.hardware.HardwareAdapter
+"""
+
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from adapters import db_local
+from core.sync_engine import sync_engine
+
+# Formula pricing used by the POS screens: base rate at the reference FAT/SNF,
+# Rs 2 per FAT point and Rs 1.5 per SNF point around it, never below Rs 10
+DEFAULT_RATES = {
+    'cow': {'base': 40.0, 'fat_ref': 3.5, 'snf_ref': 8.5},
+    'buffalo': {'base': 60.0, 'fat_ref': 6.0, 'snf_ref': 9.0}
+}
+MIN_RATE = 10.0
+
+# Empty-scale readings below this are not a can
+MIN_WEIGHT_KG = 0.1
+
+
+def formula_rate(fat: float, snf: float, animal_type: str = 'cow') -> float:
+    """Rate per kg for a FAT/SNF reading"""
+    rates = DEFAULT_RATES.get((animal_type or 'cow').lower(), DEFAULT_RATES['cow'])
+    rate = rates['base'] + (fat - rates['fat_ref']) * 2 + (snf - rates['snf_ref']) * 1.5
+    return round(max(rate, MIN_RATE), 2)
+
+
+def current_shift(now: Optional[datetime] = None) -> str:
+    """morning before noon, evening after"""
+    return 'morning' if (now or datetime.now()).hour < 12 else 'evening'
+
+
+def price_collection(collection: Dict, animal_type: str = 'cow', rate_fn: Callable = formula_rate) -> Dict:
+    """Fill in rate and amount (kept if already present)"""
+    if collection.get('rate') is None:
+        collection['rate'] = rate_fn(float(collection.get('fat') or 0), float(collection.get('snf') or 0),
+                                     animal_type or 'cow')
+    if collection.get('amount') is None:
+        collection['amount'] = round(float(collection['quantity']) * float(collection['rate']), 2)
+    return collection
+
+
+def _stable_weight(reading) -> Optional[float]:
+    """Weight from a DeviceReading or an adapter dict, None if not stable"""
+    if isinstance(reading, dict):
+        return reading.get('weight') if reading.get('stable') else None
+    return reading.value if getattr(reading, 'is_stable', False) else None
+
+
+def _quality(reading) -> Optional[Tuple[float, float]]:
+    """(fat, snf) from an AnalyzerReading or an adapter dict, None if invalid"""
+    if isinstance(reading, dict):
+        if 'error' in reading:
+            return None
+        fat, snf = reading.get('fat', 0.0), reading.get('snf', 0.0)
+    else:
+        if not getattr(reading, 'is_valid', False):
+            return None
+        fat, snf = reading.fat, reading.snf
+    return (fat, snf) if fat > 0 and snf > 0 else None
+
+
+class CollectionPipeline:
+    """
+    Counter state machine
+    start_farmer() -> stable weight + analyzer reading (any order) -> row saved
+    Readings arriving with nobody at the counter are ignored
+    """
+
+    def __init__(self, rate_fn: Callable = formula_rate, save_fn: Callable = None):
+        self.rate_fn = rate_fn
+        self.save_fn = save_fn or db_local.collection_save
+        self.listeners: List[Callable] = []
+        self.last_collection: Optional[Dict] = None
+        self.collections_saved = 0
+        self._session: Optional[Dict] = None
+        self._sources = set()
+        self._lock = threading.Lock()
+
+    def attach(self, source, scale_id: str = 'scale_01', analyzer_id: str = 'analyzer_01'):
+        """Subscribe to a reading source's device callbacks (once per source)"""
+        if id(source) in self._sources:
+            return
+        self._sources.add(id(source))
+        source.register_callback(scale_id, self.on_weight)
+        source.register_callback(analyzer_id, self.on_analyzer)
+
+    def add_listener(self, callback: Callable):
+        """callback(collection) after each saved row"""
+        self.listeners.append(callback)
+
+    # -------------------------------------------------
+    # Counter
+    # -------------------------------------------------
+
+    def start_farmer(self, farmer_id: str, animal_type: Optional[str] = None,
+                     shift: Optional[str] = None) -> Dict:
+        """Farmer steps up to the counter; replaces any unfinished session"""
+        if animal_type is None:
+            farmer = db_local.farmer_get(farmer_id)
+            animal_type = (farmer or {}).get('animal_type') or 'cow'
+
+        with self._lock:
+            self._session = {
+                'farmer_id': farmer_id,
+                'animal_type': animal_type,
+                'shift': shift or current_shift(),
+                'quantity': None,
+                'fat': None,
+                'snf': None,
+                'started_at': datetime.now().isoformat()
+            }
+            return dict(self._session)
+
+    def cancel(self):
+        """Clear the counter without saving"""
+        with self._lock:
+            self._session = None
+
+    def status(self) -> Dict:
+        with self._lock:
+            session = dict(self._session) if self._session else None
+        return {
+            'session': session,
+            'last_collection': self.last_collection,
+            'collections_saved': self.collections_saved
+        }
+
+    # -------------------------------------------------
+    # Reading callbacks (serial thread)
+    # -------------------------------------------------
+
+    def on_weight(self, reading):
+        weight = _stable_weight(reading)
+        if weight is None or weight < MIN_WEIGHT_KG:
+            return
+        self._fill(quantity=round(weight, 3))
+
+    def on_analyzer(self, reading):
+        quality = _quality(reading)
+        if quality is None:
+            return
+        self._fill(fat=quality[0], snf=quality[1])
+
+    def _fill(self, **values):
+        """Record the first weight / first quality reading, save once both are in"""
+        with self._lock:
+            session = self._session
+            if session is None:
+                return
+            for key, value in values.items():
+                if session[key] is None:
+                    session[key] = value
+            if session['quantity'] is None or session['fat'] is None:
+                return
+            # Complete: take it off the counter before the write so it saves exactly once
+            self._session = None
+
+        self._save(session)
+
+    def _save(self, session: Dict) -> Optional[Dict]:
+        collection = price_collection({
+            'farmer_id': session['farmer_id'],
+            'quantity': session['quantity'],
+            'fat': session['fat'],
+            'snf': session['snf'],
+            'shift': session['shift']
+        }, session['animal_type'], self.rate_fn)
+
+        if not self.save_fn(collection):
+            print(f"❌ Collection for farmer {session['farmer_id']} not saved")
+            return None
+
+        self.last_collection = collection
+        self.collections_saved += 1
+        sync_engine.notify_write()
+        print(f"🥛 Collected {collection['quantity']} kg from {collection['farmer_id']}: "
+              f"FAT {collection['fat']} SNF {collection['snf']} -> Rs {collection['amount']}")
+
+        for callback in self.listeners:
+            try:
+                callback(collection)
+            except Exception as e:
+                print(f"Collection listener error: {e}")
+        return collection
+
+
+# Global pipeline instance
+pipeline = CollectionPipeline()
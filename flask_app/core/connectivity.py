@@ -0,0 +1,166 @@
+"""
+Connectivity Monitor - Cached Online/Offline State
+Probes the sync target (Supabase) in a background thread with backoff
+Saves and the sync engine read the cached state instead of blocking on the network
+"""
+
+import os
+import threading
+import requests
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+
+def default_probe_url() -> Optional[str]:
+    """Probe the Supabase REST endpoint we actually sync to"""
+    override = os.getenv('CONNECTIVITY_PROBE_URL')
+    if override:
+        return override
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    if supabase_url:
+        return supabase_url.rstrip('/') + '/rest/v1/'
+    return None
+
+
+class ConnectivityMonitor:
+    """
+    Background connectivity probe
+    Online: re-check every online_interval seconds
+    Offline: retry with exponential backoff (min_backoff .. max_backoff)
+    """
+
+    def __init__(self, probe_url: Optional[str] = None, online_interval: float = 30.0,
+                 min_backoff: float = 2.0, max_backoff: float = 60.0, timeout: float = 3.0):
+        self.probe_url = probe_url
+        self.online_interval = online_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.online = False
+        self.last_check = None
+        self.last_change = None
+        self.consecutive_failures = 0
+
+        self._listeners: List[Callable[[bool], None]] = []
+        self._online_event = threading.Event()
+        self._poke = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started = False
+        self._running = False
+
+    def start(self):
+        """Start background probing (idempotent)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+            if self.probe_url is None:
+                self.probe_url = default_probe_url()
+            if not self.probe_url:
+                print("⚠️ No SUPABASE_URL configured, connectivity monitor stays offline")
+                return
+
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+        print(f"✅ Connectivity monitor started ({self.probe_url})")
+
+    def stop(self):
+        """Stop background probing"""
+        self._running = False
+        self._poke.set()
+        if self._thread:
+            self._thread.join(timeout=self.timeout + 1)
+
+    def is_online(self) -> bool:
+        """Cached connectivity state (never blocks)"""
+        if not self._started:
+            self.start()
+        return self.online
+
+    def wait_until_online(self, timeout: Optional[float] = None) -> bool:
+        """Block until connectivity is available or timeout expires"""
+        return self._online_event.wait(timeout)
+
+    def add_listener(self, callback: Callable[[bool], None]):
+        """Register callback(online) fired on every state change"""
+        self._listeners.append(callback)
+
+    def report_failure(self):
+        """Called when a cloud request fails, re-probes now if we believed we were online"""
+        if self.online:
+            self._poke.set()
+
+    def status(self) -> Dict:
+        """Snapshot for status endpoints"""
+        return {
+            'online': self.online,
+            'probe_url': self.probe_url,
+            'last_check': self.last_check.isoformat() if self.last_check else None,
+            'last_change': self.last_change.isoformat() if self.last_change else None,
+            'consecutive_failures': self.consecutive_failures
+        }
+
+    def _probe(self) -> bool:
+        """Any non-5xx HTTP response means the sync target is reachable"""
+        headers = {}
+        api_key = os.getenv('SUPABASE_KEY')
+        if api_key:
+            headers['apikey'] = api_key
+
+        try:
+            response = requests.head(self.probe_url, headers=headers, timeout=self.timeout)
+            return response.status_code < 500
+        except requests.RequestException:
+            return False
+
+    def _set_state(self, online: bool):
+        self.last_check = datetime.now()
+        if online == self.online:
+            return
+
+        self.online = online
+        self.last_change = self.last_check
+        if online:
+            self._online_event.set()
+            print("🌐 Connectivity restored")
+        else:
+            self._online_event.clear()
+            print("⚠️ Connectivity lost")
+
+        for callback in list(self._listeners):
+            try:
+                callback(online)
+            except Exception as e:
+                print(f"Connectivity listener error: {e}")
+
+    def _run(self):
+        """Probe loop"""
+        backoff = self.min_backoff
+
+        while self._running:
+            self._poke.clear()
+            online = self._probe()
+
+            if online:
+                self.consecutive_failures = 0
+                backoff = self.min_backoff
+                interval = self.online_interval
+            else:
+                self.consecutive_failures += 1
+                interval = backoff
+                backoff = min(backoff * 2, self.max_backoff)
+
+            self._set_state(online)
+
+            # Sleep until next probe, or until someone reports a failure
+            self._poke.wait(interval)
+
+
+# Global monitor shared by services and the sync engine
+monitor = ConnectivityMonitor()
@@ -0,0 +1,105 @@
+"""
+Pagination - Keyset Cursors and NDJSON Streaming
+Uniform list contract shared by every backend (SQLite, Supabase, Postgres)
+
+Lists are ordered newest first by (created_at, id)
+    GET /api/sales?limit=100                      -> first page
+    GET /api/sales?after=<created_at>,<id>        -> next page
+Each page returns next_cursor (None on the last page)
+Exports stream every page as newline-delimited JSON
+"""
+
+import json
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import Response, jsonify, stream_with_context
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_PAGE_SIZE = 500
+
+Cursor = Tuple[str, str]
+
+
+class PageError(ValueError):
+    """Malformed after/limit parameters (maps to HTTP 400)"""
+
+
+def parse_cursor(after: Optional[str]) -> Optional[Cursor]:
+    """
+    Parse 'created_at,id' (raises PageError on malformed cursors)
+    created_at must be an ISO timestamp and id an integer or UUID: the
+    values end up inside PostgREST filters, so nothing else gets through
+    """
+    if not after:
+        return None
+    created_at, sep, record_id = after.rpartition(',')
+    try:
+        if not sep or not created_at or ',' in created_at:
+            raise ValueError
+        datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        try:
+            record_id = str(int(record_id))
+        except ValueError:
+            record_id = str(uuid.UUID(record_id))
+    except ValueError:
+        raise PageError(f"Invalid cursor '{after}', expected <created_at>,<id>")
+    return created_at, record_id
+
+
+def make_cursor(row: Dict) -> Optional[str]:
+    """Cursor pointing after this row"""
+    if not row or row.get('created_at') is None:
+        return None
+    created_at = row['created_at']
+    if hasattr(created_at, 'isoformat'):
+        created_at = created_at.isoformat()
+    return f"{created_at},{row['id']}"
+
+
+def page_args(args) -> Tuple[Optional[Cursor], int]:
+    """Read after/limit from request args"""
+    after = parse_cursor(args.get('after'))
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise PageError(f"Invalid limit '{args.get('limit')}'")
+    if limit < 1:
+        raise PageError('limit must be positive')
+    return after, min(limit, MAX_PAGE_SIZE)
+
+
+def page_response(key: str, rows: List[Dict], limit: int):
+    """JSON page with next_cursor"""
+    next_cursor = make_cursor(rows[-1]) if len(rows) >= limit else None
+    return jsonify({key: rows, 'count': len(rows), 'next_cursor': next_cursor, 'success': True})
+
+
+def iter_pages(fetch_page: Callable[[Optional[Cursor], int], List[Dict]],
+               page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Dict]:
+    """Walk every page, one page in memory at a time"""
+    after = None
+    while True:
+        rows = fetch_page(after, page_size)
+        if not rows:
+            return
+        yield from rows
+        cursor = make_cursor(rows[-1])
+        if len(rows) < page_size or cursor is None:
+            return
+        after = parse_cursor(cursor)
+
+
+def ndjson_response(fetch_page: Callable[[Optional[Cursor], int], List[Dict]],
+                    filename: Optional[str] = None) -> Response:
+    """Stream all rows as chunked NDJSON"""
+    def generate():
+        for row in iter_pages(fetch_page):
+            yield json.dumps(row, default=str) + '\n'
+
+    headers = {}
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
@@ -0,0 +1,154 @@
+"""
+Rate Chart Engine - FAT x SNF Pricing
+Compiles a shop's rate chart (cow and buffalo) into dense NumPy lookup grids
+
+- Chart breakpoints form a FAT x SNF matrix (a FAT-only chart is one SNF column)
+- Compiled once into a 0.01-step table, bilinear between breakpoints;
+  analyzers report at most two decimals, so a lookup is one table read
+- Readings outside the chart clamp to its edges
+- price() for one reading, reprice() for a whole shift/month in one call
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+GRID_STEP = 0.01
+
+
+class RateGrid:
+    """Dense rate table for one milk type"""
+
+    __slots__ = ('fat_min', 'snf_min', 'fat_count', 'snf_count', 'grid', 'rows')
+
+    def __init__(self, fats: Sequence[float], snfs: Sequence[float], rates: np.ndarray):
+        """
+        fats / snfs: ascending breakpoints, rates[i, j] is the rate at (fats[i], snfs[j])
+        """
+        fats = np.asarray(fats, dtype=float)
+        snfs = np.asarray(snfs, dtype=float)
+        rates = np.asarray(rates, dtype=float).reshape(len(fats), len(snfs))
+
+        fat_axis = _axis(fats)
+        snf_axis = _axis(snfs)
+
+        # Interpolate along FAT for every SNF breakpoint, then along SNF for every FAT cell
+        by_fat = np.column_stack([np.interp(fat_axis, fats, rates[:, j]) for j in range(len(snfs))])
+        self.grid = np.round(np.vstack([np.interp(snf_axis, snfs, row) for row in by_fat]), 2)
+        self.rows = self.grid.tolist()   # scalar lookups skip NumPy call overhead
+
+        self.fat_min = float(fat_axis[0])
+        self.snf_min = float(snf_axis[0])
+        self.fat_count = len(fat_axis)
+        self.snf_count = len(snf_axis)
+
+    def rate(self, fat: float, snf: float) -> float:
+        """Rate for one reading"""
+        i = min(max(int(round((fat - self.fat_min) / GRID_STEP)), 0), self.fat_count - 1)
+        j = min(max(int(round((snf - self.snf_min) / GRID_STEP)), 0), self.snf_count - 1)
+        return self.rows[i][j]
+
+    def lookup(self, fat: np.ndarray, snf: np.ndarray) -> np.ndarray:
+        """Rates for arrays of readings (one gather)"""
+        i = np.rint((fat - self.fat_min) / GRID_STEP).astype(np.intp)
+        j = np.rint((snf - self.snf_min) / GRID_STEP).astype(np.intp)
+        np.clip(i, 0, self.fat_count - 1, out=i)
+        np.clip(j, 0, self.snf_count - 1, out=j)
+        return self.grid[i, j]
+
+
+def _axis(breakpoints: np.ndarray) -> np.ndarray:
+    """GRID_STEP axis covering the breakpoints"""
+    count = int(round((breakpoints[-1] - breakpoints[0]) / GRID_STEP)) + 1
+    return breakpoints[0] + np.arange(count) * GRID_STEP
+
+
+class RateChart:
+    """Compiled rate chart for a shop: one RateGrid per milk type"""
+
+    def __init__(self, grids: Dict[str, RateGrid], version: Optional[str] = None):
+        self.grids = grids
+        self.version = version
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict], version: Optional[str] = None) -> 'RateChart':
+        """
+        Compile chart rows {milk_type, fat, snf, rate}
+        snf None means the rate applies to every SNF (FAT-only chart)
+        """
+        points: Dict[str, Dict[tuple, float]] = {}
+        for row in rows:
+            milk_type = (row.get('milk_type') or 'cow').lower()
+            snf = row.get('snf')
+            key = (round(float(row['fat']), 2), None if snf is None else round(float(snf), 2))
+            points.setdefault(milk_type, {})[key] = float(row['rate'])
+
+        grids = {}
+        for milk_type, cells in points.items():
+            fats = sorted({fat for fat, _ in cells})
+            snfs = sorted({snf for _, snf in cells if snf is not None}) or [0.0]
+            rates = np.full((len(fats), len(snfs)), np.nan)
+            for (fat, snf), rate in cells.items():
+                if snf is None:
+                    rates[fats.index(fat), :] = rate
+                else:
+                    rates[fats.index(fat), snfs.index(snf)] = rate
+
+            # Gaps in the matrix: interpolate along SNF, then FAT
+            for i in range(len(fats)):
+                rates[i] = _fill_gaps(snfs, rates[i])
+            for j in range(len(snfs)):
+                rates[:, j] = _fill_gaps(fats, rates[:, j])
+            if np.isnan(rates).any():
+                raise ValueError(f'Rate chart for {milk_type} has no rates')
+
+            grids[milk_type] = RateGrid(fats, snfs, rates)
+        return cls(grids, version)
+
+    def milk_types(self) -> List[str]:
+        return sorted(self.grids)
+
+    def price(self, fat: float, snf: float, animal_type: str = 'cow') -> float:
+        """Rate per kg for one reading"""
+        return self._grid(animal_type).rate(fat, snf)
+
+    def reprice(self, quantity, fat, snf, animal_type='cow'):
+        """
+        Vectorized (rates, amounts) for arrays of readings
+        animal_type: one type for all rows or an array of per-row types;
+        per-row types the chart does not cover come back as NaN rate and amount
+        """
+        quantity = np.asarray(quantity, dtype=float)
+        fat = np.asarray(fat, dtype=float)
+        snf = np.asarray(snf, dtype=float)
+
+        if isinstance(animal_type, str):
+            rates = self._grid(animal_type).lookup(fat, snf)
+        else:
+            # Milk types as small integer codes, one masked gather per type
+            names = list(self.grids)
+            index = {t: names.index((t or 'cow').lower()) if (t or 'cow').lower() in self.grids else -1
+                     for t in set(animal_type)}
+            codes = np.fromiter((index[t] for t in animal_type), np.intp, len(fat))
+            rates = np.full_like(fat, np.nan)
+            for code, name in enumerate(names):
+                mask = codes == code
+                if mask.any():
+                    rates[mask] = self.grids[name].lookup(fat[mask], snf[mask])
+
+        return rates, np.round(quantity * rates, 2)
+
+    def _grid(self, animal_type: str) -> RateGrid:
+        grid = self.grids.get((animal_type or 'cow').lower())
+        if grid is None:
+            raise ValueError(f"No rate chart for '{animal_type}'")
+        return grid
+
+
+def _fill_gaps(axis: Sequence[float], values: np.ndarray) -> np.ndarray:
+    """Linear fill of NaN cells from the known ones (edges clamp)"""
+    known = ~np.isnan(values)
+    if known.all() or not known.any():
+        return values
+    axis = np.asarray(axis, dtype=float)
+    return np.interp(axis, axis[known], values[known])
@@ -4,14 +4,19 @@ Single source of truth for all operations
 Works with both SQLite (desktop) and Supabase (cloud)
 """
 
+import math
 import os
 import sys
-import requests
 from datetime import datetime
 from typing import Dict, List, Optional
 
 # Import adapters
 from adapters import db_local, db_supabase
+from core import connectivity
+from core.sync_engine import sync_engine
+from core.collection_pipeline import current_shift, formula_rate, price_collection
+
+COLLECTION_FIELDS = ('id', 'farmer_id', 'quantity', 'fat', 'snf', 'rate', 'amount', 'shift', 'collection_date')
 
 # ============================================
 # Runtime Detection
@@ -28,12 +33,8 @@ def is_vercel() -> bool:
 
 
 def internet_available() -> bool:
-    """Check if internet connection is available"""
-    try:
-        requests.get("https://google.com", timeout=3)
-        return True
-    except:
-        return False
+    """Check if the sync target is reachable (cached, never blocks)"""
+    return connectivity.monitor.is_online()
 
 
 # Runtime flags
@@ -50,7 +51,7 @@ print(f"🔧 Runtime: Desktop={IS_DESKTOP}, Vercel={IS_VERCEL}")
 def save_farmer(data: Dict) -> Dict:
     """
     Save farmer with unified logic
-    Desktop: Save to SQLite + try sync to Supabase
+    Desktop: Save to SQLite + queue for background sync
     Vercel: Save directly to Supabase
     """
     result = {'success': False, 'farmer': None, 'message': ''}
@@ -64,28 +65,10 @@ def save_farmer(data: Dict) -> Dict:
             if success:
                 result['success'] = True
                 result['farmer'] = data
-                result['message'] = 'Saved locally'
+                result['message'] = 'Saved locally, queued for cloud sync'
                 
-                # Try to sync to Supabase if internet available
-                if internet_available():
-                    try:
-                        # Remove sync fields for Supabase
-                        supabase_data = {k: v for k, v in data.items() if k not in ['sync_status']}
-                        supabase_data['sync_status'] = 'synced'
-                        
-                        if db_supabase.farmer_save(supabase_data):
-                            db_local.farmer_mark_synced(data['id'])
-                            result['message'] = 'Saved and synced to cloud'
-                    except Exception as e:
-                        print(f"Sync failed, will retry later: {e}")
-                        db_local.log_sync(
-                            data.get('device_id', 'unknown'),
-                            'farmers',
-                            data['id'],
-                            'INSERT',
-                            'failed',
-                            str(e)
-                        )
+                # Write-behind: the sync engine replicates from the outbox
+                sync_engine.notify_write()
             else:
                 result['message'] = 'Failed to save locally'
         
@@ -111,7 +94,7 @@ def save_farmer(data: Dict) -> Dict:
 def save_sale(data: Dict) -> Dict:
     """
     Save sale with unified logic
-    Desktop: Save to SQLite + try sync to Supabase
+    Desktop: Save to SQLite + queue for background sync
     Vercel: Save directly to Supabase
     """
     result = {'success': False, 'sale_id': None, 'message': ''}
@@ -125,27 +108,10 @@ def save_sale(data: Dict) -> Dict:
             if success:
                 result['success'] = True
                 result['sale_id'] = data['id']
-                result['message'] = 'Saved locally'
+                result['message'] = 'Saved locally, queued for cloud sync'
                 
-                # Try to sync to Supabase if internet available
-                if internet_available():
-                    try:
-                        supabase_data = {k: v for k, v in data.items() if k not in ['sync_status']}
-                        supabase_data['sync_status'] = 'synced'
-                        
-                        if db_supabase.sale_save(supabase_data):
-                            db_local.sale_mark_synced(data['id'])
-                            result['message'] = 'Saved and synced to cloud'
-                    except Exception as e:
-                        print(f"Sync failed, will retry later: {e}")
-                        db_local.log_sync(
-                            data.get('device_id', 'unknown'),
-                            'sales',
-                            data['id'],
-                            'INSERT',
-                            'failed',
-                            str(e)
-                        )
+                # Write-behind: the sync engine replicates from the outbox
+                sync_engine.notify_write()
             else:
                 result['message'] = 'Failed to save locally'
         
@@ -168,6 +134,63 @@ def save_sale(data: Dict) -> Dict:
     return result
 
 
+def save_collection(data: Dict) -> Dict:
+    """
+    Save milk collection with unified logic
+    Rate and amount are computed from FAT/SNF when not supplied
+    Desktop: Save to SQLite + queue for background sync
+    Vercel: Save directly to Supabase
+    """
+    result = {'success': False, 'collection': None, 'message': ''}
+    
+    try:
+        if not data.get('farmer_id') or data.get('quantity') in (None, ''):
+            result['message'] = 'farmer_id and quantity are required'
+            return result
+        
+        animal_type = data.pop('animal_type', None)
+        collection = {key: data[key] for key in COLLECTION_FIELDS if data.get(key) not in (None, '')}
+        for key in ('quantity', 'fat', 'snf', 'rate', 'amount'):
+            if key in collection:
+                collection[key] = float(collection[key])
+        collection.setdefault('shift', current_shift())
+        price_collection(collection, animal_type, price_reading)
+        
+        if IS_DESKTOP:
+            # Save to SQLite first (offline-first)
+            collection['sync_status'] = 'pending'
+            success = db_local.collection_save(collection)
+            
+            if success:
+                result['success'] = True
+                result['collection'] = collection
+                result['message'] = 'Saved locally, queued for cloud sync'
+                
+                # Write-behind: the sync engine replicates from the outbox
+                sync_engine.notify_write()
+            else:
+                result['message'] = 'Failed to save locally'
+        
+        else:
+            # Vercel: Save directly to Supabase
+            collection.setdefault('id', db_local.generate_uuid())
+            collection['sync_status'] = 'synced'
+            success = db_supabase.collection_save(collection)
+            
+            if success:
+                result['success'] = True
+                result['collection'] = collection
+                result['message'] = 'Saved to cloud'
+            else:
+                result['message'] = 'Failed to save to cloud'
+    
+    except Exception as e:
+        result['message'] = f'Error: {str(e)}'
+        print(f"Error in save_collection: {e}")
+    
+    return result
+
+
 def save_customer(data: Dict) -> Dict:
     """
     Save customer with unified logic
@@ -182,17 +205,10 @@ def save_customer(data: Dict) -> Dict:
             if success:
                 result['success'] = True
                 result['customer'] = data
-                result['message'] = 'Saved locally'
+                result['message'] = 'Saved locally, queued for cloud sync'
                 
-                if internet_available():
-                    try:
-                        supabase_data = {k: v for k, v in data.items() if k not in ['sync_status']}
-                        supabase_data['sync_status'] = 'synced'
-                        
-                        if db_supabase.customer_save(supabase_data):
-                            result['message'] = 'Saved and synced to cloud'
-                    except Exception as e:
-                        print(f"Sync failed: {e}")
+                # Write-behind: the sync engine replicates from the outbox
+                sync_engine.notify_write()
             else:
                 result['message'] = 'Failed to save locally'
         
@@ -227,17 +243,10 @@ def save_product(data: Dict) -> Dict:
             if success:
                 result['success'] = True
                 result['product'] = data
-                result['message'] = 'Saved locally'
+                result['message'] = 'Saved locally, queued for cloud sync'
                 
-                if internet_available():
-                    try:
-                        supabase_data = {k: v for k, v in data.items() if k not in ['sync_status']}
-                        supabase_data['sync_status'] = 'synced'
-                        
-                        if db_supabase.product_save(supabase_data):
-                            result['message'] = 'Saved and synced to cloud'
-                    except Exception as e:
-                        print(f"Sync failed: {e}")
+                # Write-behind: the sync engine replicates from the outbox
+                sync_engine.notify_write()
             else:
                 result['message'] = 'Failed to save locally'
         
@@ -313,3 +322,175 @@ def get_sales(limit: int = 100) -> List[Dict]:
         return db_local.sale_get_all(limit) if IS_DESKTOP else []
     except:
         return db_local.sale_get_all(limit) if IS_DESKTOP else []
+
+
+# ============================================
+# Paged Reads (keyset cursors, see core/pagination.py)
+# ============================================
+
+def _get_page(cloud_page, local_page, after: Optional[tuple], limit: int) -> List[Dict]:
+    """Same source rules as the get functions, one page at a time"""
+    try:
+        if IS_VERCEL or (IS_DESKTOP and internet_available()):
+            rows = cloud_page(after, limit)
+            if rows or after:
+                return rows
+        
+        return local_page(after, limit) if IS_DESKTOP else []
+    except:
+        return local_page(after, limit) if IS_DESKTOP else []
+
+
+def get_farmers_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of farmers, newest first"""
+    return _get_page(db_supabase.farmer_get_page, db_local.farmer_get_page, after, limit)
+
+
+def get_customers_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of customers, newest first"""
+    return _get_page(db_supabase.customer_get_page, db_local.customer_get_page, after, limit)
+
+
+def get_products_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of products, newest first"""
+    return _get_page(db_supabase.product_get_page, db_local.product_get_page, after, limit)
+
+
+def get_sales_page(after: Optional[tuple] = None, limit: int = 100) -> List[Dict]:
+    """Get one page of sales, newest first"""
+    return _get_page(db_supabase.sale_get_page, db_local.sale_get_page, after, limit)
+
+
+def export_source(table_name: str):
+    """
+    Page fetcher for streaming exports
+    Picks one source for the whole export and raises on errors,
+    so a failed page never silently truncates the file
+    """
+    if IS_VERCEL or (IS_DESKTOP and internet_available()):
+        return lambda after, limit: db_supabase.select_page(table_name, after, limit)
+    return lambda after, limit: db_local.select_page(table_name, after, limit)
+
+
+# ============================================
+# Rate Chart (desktop, see core/rate_chart.py)
+# ============================================
+
+# Compiled chart cache: None = not loaded, False = no chart stored
+_rate_chart = None
+
+
+def get_rate_chart():
+    """Compiled local rate chart, None when the shop prices by formula"""
+    global _rate_chart
+    if not IS_DESKTOP:
+        return None
+    if _rate_chart is None:
+        rows = db_local.rate_chart_get()
+        if rows:
+            from core.rate_chart import RateChart
+            _rate_chart = RateChart.from_rows(rows, rows[0].get('chart_version'))
+        else:
+            _rate_chart = False
+    return _rate_chart or None
+
+
+def price_reading(fat: float, snf: float, animal_type: str = 'cow') -> float:
+    """Rate per kg: shop rate chart when one covers the milk type, formula otherwise"""
+    chart = get_rate_chart()
+    if chart and (animal_type or 'cow').lower() in chart.grids:
+        return chart.price(fat, snf, animal_type)
+    return formula_rate(fat, snf, animal_type)
+
+
+def set_rate_chart(rows: List[Dict], chart_version: Optional[str] = None) -> Dict:
+    """Validate, store and activate a new rate chart"""
+    global _rate_chart
+    result = {'success': False, 'message': ''}
+    
+    # Pricing only reads the chart on desktop (get_rate_chart)
+    if not IS_DESKTOP:
+        result['message'] = 'Rate charts are only available in desktop mode'
+        return result
+    
+    try:
+        from core.rate_chart import RateChart
+        chart = RateChart.from_rows(rows, chart_version)
+        
+        if db_local.rate_chart_replace(rows, chart_version):
+            _rate_chart = chart
+            result['success'] = True
+            result['milk_types'] = chart.milk_types()
+            result['message'] = f'Rate chart saved ({len(rows)} rates)'
+        else:
+            result['message'] = 'Failed to save rate chart'
+    
+    except (KeyError, TypeError, ValueError) as e:
+        result['message'] = f'Invalid rate chart: {e}'
+    
+    return result
+
+
+def reprice_collections(date_from: str, date_to: str) -> Dict:
+    """Re-rate every collection in a date range against the current chart in one vectorized pass"""
+    result = {'success': False, 'message': ''}
+    
+    chart = get_rate_chart()
+    if not chart:
+        result['message'] = 'No rate chart configured'
+        return result
+    
+    started = datetime.now()
+    rows = db_local.collection_get_range(date_from, date_to)
+    if not rows:
+        result.update(success=True, collections=0, changed=0, message='No collections in range')
+        return result
+    
+    # Rows without a FAT/SNF reading cannot be rated and keep their current rate
+    priced = [row for row in rows if row['fat'] is not None and row['snf'] is not None]
+    unread = len(rows) - len(priced)
+    total_amount = sum(row['amount'] or 0 for row in rows if row['fat'] is None or row['snf'] is None)
+    
+    try:
+        rates, amounts = chart.reprice(
+            [row['quantity'] or 0 for row in priced],
+            [row['fat'] for row in priced],
+            [row['snf'] for row in priced],
+            [row['animal_type'] for row in priced]
+        )
+    except ValueError as e:
+        result['message'] = str(e)
+        return result
+    
+    # Milk types the chart does not cover (NaN rate) keep their current rate
+    updates, uncovered = [], 0
+    for row, rate, amount in zip(priced, rates.tolist(), amounts.tolist()):
+        if math.isnan(rate):
+            uncovered += 1
+            total_amount += row['amount'] or 0
+        else:
+            # Only rows whose price moved are written and queued for sync
+            if rate != row['rate'] or amount != row['amount']:
+                updates.append((rate, amount, row['id']))
+            total_amount += amount
+    
+    changed = db_local.collection_update_rates(updates)
+    if changed < 0:
+        result['message'] = 'Failed to update collections'
+        return result
+    
+    if changed:
+        sync_engine.notify_write()
+    
+    result.update(
+        success=True,
+        collections=len(rows),
+        changed=changed,
+        skipped=uncovered + unread,
+        total_amount=round(total_amount, 2),
+        elapsed_ms=round((datetime.now() - started).total_seconds() * 1000, 1),
+        message=f'Repriced {changed} of {len(rows)} collections'
+                + (f' ({uncovered} skipped: milk type not in rate chart)' if uncovered else '')
+                + (f' ({unread} skipped: no FAT/SNF reading)' if unread else '')
+    )
+    return result
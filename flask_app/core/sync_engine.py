@@ -2,31 +2,37 @@
 Sync Engine - Background Synchronization for Desktop
 Automatically syncs pending records to Supabase when internet is available
 Runs in background thread, non-blocking
+Saves return after the local write; the engine replicates them write-behind from the outbox
 """
 
 import os
 import sys
 import time
 import threading
-import requests
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 # Import adapters
 from adapters import db_local, db_supabase
+from core import connectivity
 
 
 class SyncEngine:
     """
     Background sync engine for desktop
-    Syncs pending records to Supabase every 10 seconds
+    Replicates the outbox shortly after each save (edits within the
+    coalesce window go up together), and every 10 seconds sweeps pending
+    records in batches starting from each table's high-water mark
     """
     
     def __init__(self):
         self.running = False
         self.thread = None
         self.sync_interval = 10  # seconds
+        self.batch_size = int(os.getenv('SYNC_BATCH_SIZE', 500))
+        self.coalesce_delay = float(os.getenv('SYNC_COALESCE_DELAY', 0.5))  # seconds
         self.device_id = None
+        self._wake = threading.Event()
     
     def start(self):
         """Start background sync thread"""
@@ -37,6 +43,10 @@ class SyncEngine:
         self.running = True
         self.device_id = db_local.get_device_id()
         
+        # Sync as soon as connectivity comes back instead of waiting for the next tick
+        connectivity.monitor.add_listener(self._on_connectivity_change)
+        connectivity.monitor.start()
+        
         self.thread = threading.Thread(target=self._sync_loop, daemon=True)
         self.thread.start()
         
@@ -45,6 +55,7 @@ class SyncEngine:
     def stop(self):
         """Stop background sync thread"""
         self.running = False
+        self._wake.set()
         if self.thread:
             self.thread.join(timeout=5)
         print("🛑 Sync engine stopped")
@@ -55,19 +66,14 @@ class SyncEngine:
             try:
                 # Check internet
                 if self._internet_available():
-                    print("🌐 Internet available, syncing...")
-                    
-                    # Sync farmers
-                    self._sync_table('farmers')
-                    
-                    # Sync customers
-                    self._sync_table('customers')
+                    # Replicate recent saves first
+                    self._drain_outbox()
                     
-                    # Sync sales
-                    self._sync_table('sales')
+                    print("🌐 Internet available, syncing...")
                     
-                    # Sync products
-                    self._sync_table('products')
+                    # Sweep pending rows of every synced table
+                    for table_name in db_local.SYNC_TABLES:
+                        self._sync_table(table_name)
                     
                     print("✅ Sync complete")
                 else:
@@ -76,102 +82,137 @@ class SyncEngine:
             except Exception as e:
                 print(f"❌ Sync error: {e}")
             
-            # Wait for next sync
-            time.sleep(self.sync_interval)
+            # Wait for next sync, or until woken by a save / connectivity change
+            if self._wake.wait(self.sync_interval) and self.running:
+                # Let a burst of saves land so they go up in one batch
+                time.sleep(self.coalesce_delay)
+            self._wake.clear()
+    
+    def wake(self):
+        """Run the next sync pass immediately"""
+        self._wake.set()
+    
+    def notify_write(self):
+        """Called after a local save queued a record in the outbox"""
+        self._wake.set()
+    
+    def _on_connectivity_change(self, online: bool):
+        """Connectivity monitor listener"""
+        if online:
+            self.wake()
     
     def _internet_available(self) -> bool:
-        """Check if internet is available"""
-        try:
-            requests.get("https://google.com", timeout=3)
-            return True
-        except:
-            return False
+        """Check if the sync target is reachable (cached state)"""
+        return connectivity.monitor.is_online()
     
-    def _sync_table(self, table_name: str):
-        """Sync pending records from a table"""
-        try:
-            # Get pending records
-            if table_name == 'farmers':
-                pending = db_local.farmer_get_pending_sync()
-                save_func = db_local.farmer_mark_synced
-                supabase_save = db_supabase.farmer_save
-            elif table_name == 'customers':
-                pending = db_local.customer_get_all()  # All customers for now
-                pending = [p for p in pending if p.get('sync_status') == 'pending']
-                save_func = lambda x: True  # No mark synced for customers yet
-                supabase_save = db_supabase.customer_save
-            elif table_name == 'sales':
-                pending = db_local.sale_get_pending_sync()
-                save_func = db_local.sale_mark_synced
-                supabase_save = db_supabase.sale_save
-            elif table_name == 'products':
-                pending = db_local.product_get_all()
-                pending = [p for p in pending if p.get('sync_status') == 'pending']
-                save_func = lambda x: True
-                supabase_save = db_supabase.product_save
-            else:
-                return
+    def _drain_outbox(self):
+        """
+        Replicate queued saves, one upsert per table per batch
+        Records are read at their current state, so repeated edits go up once
+        """
+        for table_name in db_local.SYNC_TABLES:
+            total = 0
+            while self.running:
+                batch = db_local.outbox_get_batch(table_name, limit=self.batch_size)
+                if not batch:
+                    break
+                
+                # Outbox order is not updated_at order, leave the high-water mark alone
+                pushed = self._sync_batch(table_name, batch, advance_high_water=False)
+                if pushed is None:
+                    return
+                
+                total += pushed
+                if len(batch) < self.batch_size:
+                    break
             
-            if not pending:
+            if total:
+                print(f"📤 Replicated {total} {table_name}")
+    
+    def _sync_table(self, table_name: str, full: bool = False):
+        """
+        Sync pending records from a table in batches
+        Delta mode (default) starts after the table's high-water mark,
+        full mode rescans every pending record
+        """
+        try:
+            if table_name not in db_local.SYNC_TABLES:
                 return
             
-            print(f"📤 Syncing {len(pending)} {table_name}...")
+            if full:
+                cursor = None
+            else:
+                state = db_local.sync_get_state(table_name)
+                cursor = (state.get('high_water_updated_at'), state.get('high_water_id'))
             
-            for record in pending:
-                try:
-                    # Check for conflicts
-                    conflict = db_supabase.check_conflict(
-                        table_name,
-                        record['id'],
-                        record.get('version', 1)
-                    )
-                    
-                    if conflict['has_conflict']:
-                        print(f"⚠️ Conflict detected for {table_name}/{record['id']}")
-                        db_local.log_sync(
-                            self.device_id,
-                            table_name,
-                            record['id'],
-                            'SYNC',
-                            'conflict',
-                            f"Remote version {conflict['remote_version']} > local version {record.get('version', 1)}"
-                        )
-                        continue
-                    
-                    # Prepare data for Supabase (remove sync fields)
-                    supabase_data = {k: v for k, v in record.items() if k not in ['sync_status', 'device_id']}
-                    supabase_data['sync_status'] = 'synced'
-                    
-                    # Save to Supabase
-                    if supabase_save(supabase_data):
-                        # Mark as synced locally
-                        save_func(record['id'])
-                        
-                        db_local.log_sync(
-                            self.device_id,
-                            table_name,
-                            record['id'],
-                            'SYNC',
-                            'success',
-                            None
-                        )
-                        print(f"✅ Synced {table_name}/{record['id']}")
-                    else:
-                        raise Exception("Supabase save failed")
+            total = 0
+            while self.running or full:
+                batch = db_local.sync_get_pending_batch(table_name, after=cursor, limit=self.batch_size)
+                if not batch:
+                    break
                 
-                except Exception as e:
-                    print(f"❌ Failed to sync {table_name}/{record['id']}: {e}")
-                    db_local.log_sync(
-                        self.device_id,
-                        table_name,
-                        record['id'],
-                        'SYNC',
-                        'failed',
-                        str(e)
-                    )
+                pushed = self._sync_batch(table_name, batch)
+                if pushed is None:
+                    break
+                
+                total += pushed
+                cursor = (batch[-1].get('updated_at'), batch[-1]['id'])
+                
+                if len(batch) < self.batch_size:
+                    break
+            
+            if total:
+                print(f"📤 Synced {total} {table_name}")
         
         except Exception as e:
             print(f"❌ Error syncing {table_name}: {e}")
+    
+    def _sync_batch(self, table_name: str, batch: List[Dict],
+                    advance_high_water: bool = True) -> Optional[int]:
+        """
+        Push one batch: one version query, one upsert, one local transaction
+        Returns number of records pushed, None if the batch failed (retried next pass)
+        """
+        ids = [record['id'] for record in batch]
+        high_water = (batch[-1].get('updated_at'), batch[-1]['id']) if advance_high_water else None
+        
+        # Check for conflicts (one round trip for the whole batch)
+        remote_versions = db_supabase.get_versions(table_name, ids)
+        if remote_versions is None:
+            connectivity.monitor.report_failure()
+            db_local.sync_complete_batch(table_name, self.device_id, [], {},
+                                         {record_id: 'Version check failed' for record_id in ids})
+            return None
+        
+        to_push = []
+        conflicts = {}
+        for record in batch:
+            local_version = record.get('version', 1)
+            remote_version = remote_versions.get(record['id'], 0)
+            if remote_version > local_version:
+                print(f"⚠️ Conflict detected for {table_name}/{record['id']}")
+                conflicts[record['id']] = f"Remote version {remote_version} > local version {local_version}"
+            else:
+                to_push.append(record)
+        
+        # Prepare data for Supabase (remove sync fields)
+        supabase_data = []
+        for record in to_push:
+            data = {k: v for k, v in record.items() if k not in ['sync_status', 'device_id']}
+            data['sync_status'] = 'synced'
+            supabase_data.append(data)
+        
+        if not db_supabase.bulk_upsert(table_name, supabase_data):
+            connectivity.monitor.report_failure()
+            db_local.sync_complete_batch(table_name, self.device_id, [], conflicts,
+                                         {record['id']: 'Supabase upsert failed' for record in to_push})
+            return None
+        
+        if not db_local.sync_complete_batch(table_name, self.device_id, to_push, conflicts, {},
+                                            high_water=high_water):
+            return None
+        
+        return len(to_push)
 
 
 # Global sync engine instance
@@ -192,10 +233,10 @@ def force_sync():
     """Force immediate sync"""
     if sync_engine._internet_available():
         print("🔄 Force syncing...")
-        sync_engine._sync_table('farmers')
-        sync_engine._sync_table('customers')
-        sync_engine._sync_table('sales')
-        sync_engine._sync_table('products')
+        if sync_engine.device_id is None:
+            sync_engine.device_id = db_local.get_device_id()
+        for table_name in db_local.SYNC_TABLES:
+            sync_engine._sync_table(table_name, full=True)
         print("✅ Force sync complete")
     else:
         print("⚠️ No internet for force sync")
@@ -15,6 +15,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, render_template, request, jsonify, send_from_directory
 from core import services, sync_engine
+from core.pagination import PageError, page_args, page_response, ndjson_response
 from adapters import db_local
 
 # Configure logging
@@ -77,8 +78,9 @@ def register_routes(app):
     # API - Farmers
     @app.route('/api/farmers', methods=['GET'])
     def get_farmers():
-        farmers = services.get_farmers()
-        return jsonify({'farmers': farmers, 'success': True})
+        after, limit = page_args(request.args)
+        farmers = services.get_farmers_page(after, limit)
+        return page_response('farmers', farmers, limit)
     
     @app.route('/api/farmers', methods=['POST'])
     def add_farmer():
@@ -89,9 +91,9 @@ def register_routes(app):
     # API - Milk Collection
     @app.route('/api/collections', methods=['POST'])
     def add_collection():
-        # For now, return success
-        # Implement collection logic as needed
-        return jsonify({'success': True, 'message': 'Collection saved'})
+        data = request.json or {}
+        result = services.save_collection(data)
+        return jsonify(result), 200 if result['success'] else 400
     
     # API - Sales
     @app.route('/api/sales', methods=['POST'])
@@ -108,14 +110,16 @@ def register_routes(app):
     
     @app.route('/api/sales', methods=['GET'])
     def get_sales():
-        sales = services.get_sales(limit=100)
-        return jsonify({'sales': sales, 'success': True})
+        after, limit = page_args(request.args)
+        sales = services.get_sales_page(after, limit)
+        return page_response('sales', sales, limit)
     
     # API - Customers
     @app.route('/api/customers', methods=['GET'])
     def get_customers():
-        customers = services.get_customers()
-        return jsonify({'customers': customers, 'success': True})
+        after, limit = page_args(request.args)
+        customers = services.get_customers_page(after, limit)
+        return page_response('customers', customers, limit)
     
     @app.route('/api/customers', methods=['POST'])
     def add_customer():
@@ -126,10 +130,11 @@ def register_routes(app):
     # API - Products
     @app.route('/api/products', methods=['GET'])
     def get_products():
-        products = services.get_products()
+        after, limit = page_args(request.args)
+        products = services.get_products_page(after, limit)
         
         # If no products, return sample data
-        if not products:
+        if not products and not after:
             products = [
                 {'id': 'p1', 'name': 'Cow Milk', 'price': 64.0, 'category': 'milk', 'emoji': '🥛', 'unit': 'L'},
                 {'id': 'p2', 'name': 'Buffalo Milk', 'price': 72.0, 'category': 'milk', 'emoji': '🥛', 'unit': 'L'},
@@ -143,7 +148,7 @@ def register_routes(app):
                 {'id': 'p10', 'name': 'Biscuits', 'price': 30.0, 'category': 'bakery', 'emoji': '🥐', 'unit': 'pkt'},
             ]
         
-        return jsonify({'products': products, 'success': True})
+        return page_response('products', products, limit)
     
     @app.route('/api/products', methods=['POST'])
     def add_product():
@@ -175,6 +180,15 @@ def register_routes(app):
             return render_template('receipt.html', sale=sale)
         return jsonify({'error': 'Sale not found'}), 404
     
+    # API - Export (streamed NDJSON)
+    @app.route('/api/<any(sales, customers, farmers, products):table_name>/export', methods=['GET'])
+    def export_table(table_name):
+        return ndjson_response(services.export_source(table_name), filename=f'{table_name}.ndjson')
+    
+    @app.errorhandler(PageError)
+    def bad_page(e):
+        return jsonify({'error': str(e), 'success': False}), 400
+    
     # API - Sync
     @app.route('/api/sync/status', methods=['GET'])
     def sync_status():
@@ -190,6 +204,7 @@ def register_routes(app):
                 'farmers': pending_farmers,
                 'sales': pending_sales
             },
+            'outbox': db_local.outbox_count(),
             'runtime': 'desktop'
         })
     
@@ -0,0 +1,106 @@
+"""
+MilkRecord Reading Broadcast - Coalescing Fan-out
+Pushes stable weights and analyzer readings to every connected screen
+
+Each subscriber owns a mailbox holding only the newest value per topic.
+Publishing overwrites the slot and never blocks, so a slow tablet skips
+intermediate weights instead of building a backlog.
+
+backend/broadcast.py is a copy for the standalone backend: change both together.
+"""
+
+import threading
+from typing import Dict, Iterator, Optional
+
+KEEPALIVE_SECONDS = 15.0
+
+
+class Subscription:
+    """One client's mailbox: newest payload per topic"""
+
+    __slots__ = ('pending', 'lock', 'event', 'closed', 'delivered', 'coalesced')
+
+    def __init__(self):
+        self.pending: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.closed = False
+        self.delivered = 0
+        self.coalesced = 0
+
+    def offer(self, topic: str, payload: dict):
+        """Replace the pending value for topic (never blocks the publisher)"""
+        with self.lock:
+            if topic in self.pending:
+                self.coalesced += 1
+            self.pending[topic] = payload
+        self.event.set()
+
+    def take(self, timeout: Optional[float] = None) -> Dict[str, dict]:
+        """Wait for pending values, returns {topic: payload} ({} on timeout/close)"""
+        if not self.event.wait(timeout) or self.closed:
+            return {}
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            self.event.clear()
+        self.delivered += len(batch)
+        return batch
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+
+
+class TopicHub:
+    """Fan-out of device readings to all subscribers"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._latest: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, topic: str, payload: dict) -> int:
+        """Deliver payload to every subscriber's mailbox, returns how many"""
+        with self._lock:
+            self._latest[topic] = payload
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(topic, payload)
+        return len(subscribers)
+
+    def subscribe(self, replay_latest: bool = True) -> Subscription:
+        """New mailbox, seeded with the current values so screens render immediately"""
+        subscription = Subscription()
+        with self._lock:
+            if replay_latest:
+                for topic, payload in self._latest.items():
+                    subscription.offer(topic, payload)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        subscription.close()
+
+    def stream(self, subscription: Subscription, keepalive: float = KEEPALIVE_SECONDS) -> Iterator[Dict[str, dict]]:
+        """Yield batches as they arrive, {} every `keepalive` seconds when idle"""
+        try:
+            while not subscription.closed:
+                yield subscription.take(keepalive)
+        finally:
+            self.unsubscribe(subscription)
+
+    def status(self) -> dict:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'topics': sorted(self._latest),
+            'delivered': sum(s.delivered for s in subscribers),
+            'coalesced': sum(s.coalesced for s in subscribers)
+        }
+
+
+# Shared hub for the process
+hub = TopicHub()
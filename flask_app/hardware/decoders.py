@@ -0,0 +1,238 @@
+"""
+MilkRecord Device Decoders - Per-Model Line Parsers
+Turns one framed serial line (bytes) into a reading dict
+
+- Registry keyed by device model (DeviceConfig.model, SCALE_MODEL / ANALYZER_MODEL)
+- Patterns and struct layouts are compiled once at import
+- Numbers go straight from bytes to float()/int(); a line is never decoded to str
+- Checksummed formats are verified before any field is trusted
+- decode() returns None for anything that does not match (noise, partial
+  lines, overload); callers count it as a rejected packet
+
+Scale readings:    {'weight': kg, 'unit': 'kg', 'motion': bool}
+Analyzer readings: {'fat', 'snf', ...optional 'clr', 'temp', 'density', 'water', 'protein', 'lactose'}
+"""
+
+import re
+import struct
+from functools import reduce
+from operator import xor
+from typing import Callable, Dict, Optional, Sequence
+
+# Weight units to kg
+_UNIT_FACTORS = {b'kg': 1.0, b'g': 0.001, b'lb': 0.45359237}
+
+# Scale status header -> motion flag (overload maps to None and is rejected)
+_SCALE_STATUS = {b'ST': False, b'US': True, b'OL': None}
+
+# Analyzer field names as sent by different models
+_ANALYZER_KEYS = {
+    b'FAT': 'fat', b'F': 'fat',
+    b'SNF': 'snf', b'S': 'snf',
+    b'CLR': 'clr', b'LR': 'clr',
+    b'TEMP': 'temp', b'TMP': 'temp', b'T': 'temp',
+    b'DEN': 'density', b'DENSITY': 'density',
+    b'WATER': 'water', b'ADW': 'water', b'W': 'water',
+    b'PRO': 'protein', b'PROTEIN': 'protein',
+    b'LAC': 'lactose', b'LACTOSE': 'lactose'
+}
+
+
+def xor8(data: bytes) -> int:
+    """XOR of all bytes (NMEA-style checksum)"""
+    return reduce(xor, data, 0)
+
+
+class Decoder:
+    """Base decoder: decode(line) -> reading dict or None"""
+
+    __slots__ = ()
+
+    kind = 'scale'
+
+    def decode(self, line: bytes) -> Optional[Dict]:
+        raise NotImplementedError
+
+
+class ScaleTextDecoder(Decoder):
+    """
+    ASCII weight lines, optional status/gross-net headers and unit
+    "12.34", "12.34 kg", "ST,12.50,kg", "ST,GS,+0012.34kg", "US,NT,-0.20kg"
+    US = unstable (motion), OL = overload (rejected)
+    """
+
+    __slots__ = ('pattern',)
+
+    kind = 'scale'
+
+    def __init__(self, pattern: bytes = (rb'\s*(?:(ST|US|OL)\s*,\s*)?(?:(?:GS|NT)\s*,\s*)?'
+                                         rb'([+-]?)\s*(\d+(?:\.\d*)?|\.\d+)\s*,?\s*(kg|g|lb)?\s*')):
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+
+    def decode(self, line):
+        m = self.pattern.fullmatch(line)
+        if m is None:
+            return None
+        status, sign, digits, unit = m.groups()
+        motion = False
+        if status is not None:
+            motion = _SCALE_STATUS.get(status)
+            if motion is None:
+                motion = _SCALE_STATUS[status.upper()]
+                if motion is None:
+                    return None
+
+        weight = float(digits)
+        if unit is not None:
+            weight *= _UNIT_FACTORS.get(unit) or _UNIT_FACTORS[unit.lower()]
+        if sign == b'-':
+            weight = -weight
+        return {'weight': weight, 'unit': 'kg', 'motion': motion}
+
+
+class ToledoContinuousDecoder(Decoder):
+    """
+    Fixed-width Toledo continuous output:
+    STX, status A/B/C, 6-digit displayed weight, 6-digit tare (then CR)
+    Status A bits 0-2: decimal point position; status B: bit1 negative,
+    bit2 out of range, bit3 motion, bit4 kg (else lb). Bit 5 is always set
+    on both, which is how noise is told apart from a frame.
+    The optional checksum byte follows CR, so it arrives ahead of the next
+    STX and is skipped.
+    """
+
+    __slots__ = ('layout',)
+
+    kind = 'scale'
+
+    # Displayed digits / 10 ** (code - 2): code 0 = XX00 ... code 7 = .XXXXX
+    _DIVISORS = tuple(10.0 ** (code - 2) for code in range(8))
+
+    def __init__(self):
+        self.layout = struct.Struct('>xBBx6s6s')
+
+    def decode(self, line):
+        start = line.find(b'\x02')
+        if start < 0 or len(line) - start < self.layout.size:
+            return None
+        status_a, status_b, digits, tare = self.layout.unpack_from(line, start)
+        if not (status_a & status_b & 0x20) or not digits.isdigit() or not tare.isdigit():
+            return None
+        if status_b & 0x04:
+            return None
+
+        weight = int(digits) / self._DIVISORS[status_a & 0x07]
+        if not status_b & 0x10:
+            weight *= _UNIT_FACTORS[b'lb']
+        if status_b & 0x02:
+            weight = -weight
+        return {'weight': weight, 'unit': 'kg', 'motion': bool(status_b & 0x08)}
+
+
+class AnalyzerKeyValueDecoder(Decoder):
+    """
+    KEY:value pairs in any order, separated by commas, semicolons or spaces
+    "FAT:4.5,SNF:8.5,TEMP:35.0", "FAT=04.50 SNF=08.50 CLR=28.00 W=00.00"
+    FAT and SNF are required
+    """
+
+    __slots__ = ('line_pattern', 'pair_pattern')
+
+    kind = 'analyzer'
+
+    _PAIR = rb'([A-Za-z]+)\s*[:=]\s*([+-]?\d+(?:\.\d*)?|[+-]?\.\d+)'
+
+    def __init__(self):
+        self.line_pattern = re.compile(rb'\s*(?:%s\s*[,;\s]\s*)*%s\s*[,;]?\s*' % (self._PAIR, self._PAIR))
+        self.pair_pattern = re.compile(self._PAIR)
+
+    def decode(self, line):
+        if self.line_pattern.fullmatch(line) is None:
+            return None
+        reading = {}
+        for key, value in self.pair_pattern.findall(line):
+            name = _ANALYZER_KEYS.get(key) or _ANALYZER_KEYS.get(key.upper())
+            if name is not None:
+                reading[name] = float(value)
+        if 'fat' not in reading or 'snf' not in reading:
+            return None
+        return reading
+
+
+class AnalyzerFieldsDecoder(Decoder):
+    """
+    Positional fields, optionally framed and checksummed
+    "4.50,8.50,28.00,35.0" or "$04.50,08.50,28.00,35.0,00.00*5A" (XOR of the
+    bytes between $ and *, two hex digits)
+    """
+
+    __slots__ = ('fields', 'separator', 'start', 'checksum')
+
+    kind = 'analyzer'
+
+    def __init__(self, fields: Sequence[str] = ('fat', 'snf', 'clr', 'temp', 'water'),
+                 separator: bytes = b',', start: Optional[bytes] = None,
+                 checksum: Optional[Callable[[bytes], int]] = None):
+        self.fields = tuple(fields)
+        self.separator = separator
+        self.start = start
+        self.checksum = checksum
+
+    def decode(self, line):
+        payload = line.strip()
+        if self.start is not None:
+            if not payload.startswith(self.start):
+                return None
+            payload = payload[len(self.start):]
+
+        if self.checksum is not None:
+            payload, star, check = payload.rpartition(b'*')
+            if not star or len(check) != 2:
+                return None
+            try:
+                if int(check, 16) != self.checksum(payload):
+                    return None
+            except ValueError:
+                return None
+
+        values = payload.split(self.separator)
+        if len(values) < 2 or len(values) > len(self.fields):
+            return None
+        try:
+            return {name: float(value) for name, value in zip(self.fields, values)}
+        except ValueError:
+            return None
+
+
+# -------------------------------------------------
+# Registry
+# -------------------------------------------------
+
+DECODERS: Dict[str, Decoder] = {}
+
+DEFAULT_MODELS = {'scale': 'generic_scale', 'analyzer': 'generic_analyzer'}
+
+
+def register_decoder(model: str, decoder: Decoder):
+    """Add or replace the decoder for a device model"""
+    DECODERS[model.lower()] = decoder
+
+
+def get_decoder(model: Optional[str], kind: str) -> Decoder:
+    """Decoder for a model, the kind's generic decoder when model is empty"""
+    decoder = DECODERS.get((model or DEFAULT_MODELS[kind]).lower())
+    if decoder is None or decoder.kind != kind:
+        raise ValueError(f"Unknown {kind} model '{model}' (known: {', '.join(models(kind))})")
+    return decoder
+
+
+def models(kind: Optional[str] = None):
+    """Registered model names, optionally for one kind"""
+    return sorted(name for name, decoder in DECODERS.items() if kind is None or decoder.kind == kind)
+
+
+register_decoder('generic_scale', ScaleTextDecoder())
+register_decoder('toledo_continuous', ToledoContinuousDecoder())
+register_decoder('generic_analyzer', AnalyzerKeyValueDecoder())
+register_decoder('csv_analyzer', AnalyzerFieldsDecoder())
+register_decoder('csv_xor_analyzer', AnalyzerFieldsDecoder(start=b'$', checksum=xor8))
@@ -0,0 +1,96 @@
+"""
+MilkRecord Device Store - Latest-Value Readings
+Every device keeps its newest reading plus a short history, tagged with a
+monotonically increasing sequence number
+
+- The serial thread publishes and never blocks (no queue to fill up)
+- Reads are non-destructive and lock-free: any number of UI pollers see
+  the same value instead of stealing readings from each other
+- wait_newer(seq) lets a client long-poll for the next reading
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_HISTORY = 32
+
+Snapshot = Tuple[int, Any]
+
+
+class DeviceState:
+    """Newest reading of one device"""
+
+    __slots__ = ('snapshot', 'history', 'condition', 'waiters')
+
+    def __init__(self, history_size: int = DEFAULT_HISTORY):
+        self.snapshot: Snapshot = (0, None)    # replaced as a whole, never mutated
+        self.history = deque(maxlen=history_size)
+        self.condition = threading.Condition()
+        self.waiters = 0
+
+    def publish(self, reading) -> int:
+        """Store a new reading (single writer: the device's reader thread)"""
+        seq = self.snapshot[0] + 1
+        snapshot = (seq, reading)
+        self.history.append(snapshot)
+        self.snapshot = snapshot
+
+        # Only touch the lock when someone is long-polling
+        if self.waiters:
+            with self.condition:
+                self.condition.notify_all()
+        return seq
+
+    def wait_newer(self, seq: int, timeout: float) -> Optional[Snapshot]:
+        """Block until a reading newer than seq exists, None on timeout"""
+        snapshot = self.snapshot
+        if snapshot[0] > seq:
+            return snapshot
+
+        with self.condition:
+            self.waiters += 1
+            try:
+                self.condition.wait_for(lambda: self.snapshot[0] > seq, timeout)
+            finally:
+                self.waiters -= 1
+
+        snapshot = self.snapshot
+        return snapshot if snapshot[0] > seq else None
+
+
+class DeviceStore:
+    """Latest-value state for every device"""
+
+    def __init__(self, history_size: int = DEFAULT_HISTORY):
+        self.history_size = history_size
+        self._states: Dict[str, DeviceState] = {}
+        self._lock = threading.Lock()
+
+    def state(self, device_id: str) -> DeviceState:
+        """State for device_id (created on first use)"""
+        state = self._states.get(device_id)
+        if state is None:
+            with self._lock:
+                state = self._states.setdefault(device_id, DeviceState(self.history_size))
+        return state
+
+    def publish(self, device_id: str, reading) -> int:
+        """Record a reading, returns its sequence number"""
+        return self.state(device_id).publish(reading)
+
+    def latest(self, device_id: str) -> Snapshot:
+        """(seq, reading) without consuming it; (0, None) before the first reading"""
+        state = self._states.get(device_id)
+        return state.snapshot if state else (0, None)
+
+    def wait_newer(self, device_id: str, seq: int = 0, timeout: float = 5.0) -> Optional[Snapshot]:
+        """(seq, reading) newer than seq, waiting up to timeout seconds"""
+        return self.state(device_id).wait_newer(seq, timeout)
+
+    def history(self, device_id: str, since_seq: int = 0) -> List[Snapshot]:
+        """Recent (seq, reading) pairs newer than since_seq, oldest first"""
+        state = self._states.get(device_id)
+        if not state:
+            return []
+        return [item for item in list(state.history) if item[0] > since_seq]
@@ -0,0 +1,252 @@
+"""
+MilkRecord Serial I/O - Event-Driven Reader
+One I/O thread services every serial device; idle ports cost no CPU
+
+POSIX: ports are registered with a selector and read only when the kernel
+reports data. Windows COM handles cannot be selected, so each port gets a
+blocking read(timeout) thread instead (still idle-free, just one thread per port).
+"""
+
+import sys
+import socket
+import selectors
+import threading
+import logging
+from typing import Callable, Dict, Iterator, Optional
+
+try:
+    import serial
+    SerialException = serial.SerialException
+except ImportError:
+    SerialException = OSError
+
+logger = logging.getLogger(__name__)
+
+LineCallback = Callable[[bytes], None]
+ErrorCallback = Callable[[str, Exception], None]
+
+
+class LineFramer:
+    """
+    Incremental line framing over a reusable buffer
+    Accepts \\n, \\r\\n and bare \\r terminators; oversized garbage is dropped
+    """
+
+    __slots__ = ('buffer', 'max_line', 'dropped')
+
+    def __init__(self, max_line: int = 512):
+        self.buffer = bytearray()
+        self.max_line = max_line
+        self.dropped = 0
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        """Append bytes, yield each complete non-empty line (without terminator)"""
+        buf = self.buffer
+        buf += data
+        start = 0
+        end = len(buf)
+
+        while start < end:
+            nl = buf.find(b'\n', start)
+            cr = buf.find(b'\r', start)
+            if nl < 0 and cr < 0:
+                break
+            cut = nl if cr < 0 or (0 <= nl < cr) else cr
+            if cut > start:
+                yield bytes(buf[start:cut])
+            start = cut + 1
+
+        if start:
+            del buf[:start]
+
+        # A device streaming without terminators must not grow the buffer forever
+        if len(buf) > self.max_line:
+            self.dropped += 1
+            buf.clear()
+
+    def reset(self):
+        """Discard any partial line"""
+        self.buffer.clear()
+
+
+class _Channel:
+    """One registered port"""
+
+    __slots__ = ('key', 'ser', 'on_line', 'on_error', 'framer', 'thread')
+
+    def __init__(self, key, ser, on_line, on_error, max_line):
+        self.key = key
+        self.ser = ser
+        self.on_line = on_line
+        self.on_error = on_error
+        self.framer = LineFramer(max_line)
+        self.thread = None
+
+
+class SerialReactor:
+    """
+    Multiplexes serial ports onto one reader thread
+    on_line(bytes) runs on the I/O thread, keep it short
+    on_error(key, exc) fires once when a port fails (unplugged, EOF);
+    the port is unregistered before the callback runs
+    """
+
+    def __init__(self, read_size: int = 4096, poll_timeout: float = 0.5, max_line: int = 512,
+                 use_selector: Optional[bool] = None):
+        self.read_size = read_size
+        self.poll_timeout = poll_timeout
+        self.max_line = max_line
+        self.use_selector = (sys.platform != 'win32') if use_selector is None else use_selector
+
+        self._channels: Dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self._selector = None
+        self._wakeup_r = None
+        self._wakeup_w = None
+
+    # -------------------------------------------------
+    # Registration
+    # -------------------------------------------------
+
+    def add(self, key: str, ser, on_line: LineCallback, on_error: Optional[ErrorCallback] = None):
+        """Start servicing an open serial port"""
+        self.remove(key)
+        channel = _Channel(key, ser, on_line, on_error, self.max_line)
+
+        with self._lock:
+            self._channels[key] = channel
+
+        if self.use_selector:
+            ser.timeout = 0    # never block the shared thread
+            self.start()
+            self._selector.register(ser.fileno(), selectors.EVENT_READ, channel)
+            self._wakeup()
+        else:
+            ser.timeout = self.poll_timeout
+            self._running = True
+            channel.thread = threading.Thread(target=self._blocking_loop, args=(channel,),
+                                              name=f'serial-{key}', daemon=True)
+            channel.thread.start()
+
+    def remove(self, key: str):
+        """Stop servicing a port (the caller closes it)"""
+        with self._lock:
+            channel = self._channels.pop(key, None)
+        if channel is None:
+            return
+
+        if self.use_selector and self._selector is not None:
+            try:
+                self._selector.unregister(channel.ser.fileno())
+            except (KeyError, ValueError, OSError):
+                pass
+            self._wakeup()
+        elif channel.thread is not None and channel.thread is not threading.current_thread():
+            channel.thread.join(timeout=self.poll_timeout + 1)
+
+    def keys(self):
+        """Registered port keys"""
+        with self._lock:
+            return list(self._channels)
+
+    # -------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------
+
+    def start(self):
+        """Start the selector thread (idempotent)"""
+        if not self.use_selector:
+            self._running = True
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._selector is None:
+                self._selector = selectors.DefaultSelector()
+                self._wakeup_r, self._wakeup_w = socket.socketpair()
+                self._wakeup_r.setblocking(False)
+                self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+            self._running = True
+            self._thread = threading.Thread(target=self._selector_loop, name='serial-reactor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop reading (ports stay open, the caller closes them)"""
+        self._running = False
+        for key in self.keys():
+            self.remove(key)
+        self._wakeup()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_timeout + 1)
+            self._thread = None
+
+    def _wakeup(self):
+        if self._wakeup_w is not None:
+            try:
+                self._wakeup_w.send(b'\0')
+            except OSError:
+                pass
+
+    # -------------------------------------------------
+    # Reader loops
+    # -------------------------------------------------
+
+    def _selector_loop(self):
+        while self._running:
+            for key, _ in self._selector.select(self.poll_timeout):
+                channel = key.data
+                if channel is None:
+                    try:
+                        self._wakeup_r.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                self._service(channel)
+        logger.info('Serial reactor stopped')
+
+    def _service(self, channel: _Channel):
+        """Read what the kernel has buffered and dispatch complete lines"""
+        try:
+            data = channel.ser.read(max(self.read_size, channel.ser.in_waiting))
+            if not data:
+                # Readable but empty: the device went away
+                raise SerialException('device disconnected (EOF)')
+        except (SerialException, OSError) as e:
+            self._fail(channel, e)
+            return
+
+        self._dispatch(channel, data)
+
+    def _blocking_loop(self, channel: _Channel):
+        """Windows fallback: block in the driver until bytes or timeout"""
+        ser = channel.ser
+        while self._running and self._channels.get(channel.key) is channel:
+            try:
+                data = ser.read(max(1, ser.in_waiting))
+            except (SerialException, OSError) as e:
+                self._fail(channel, e)
+                return
+            if data:
+                self._dispatch(channel, data)
+
+    def _dispatch(self, channel: _Channel, data: bytes):
+        for line in channel.framer.feed(data):
+            try:
+                channel.on_line(line)
+            except Exception as e:
+                logger.error(f'Line handler error for {channel.key}: {e}')
+
+    def _fail(self, channel: _Channel, error: Exception):
+        logger.warning(f'Serial port {channel.key} failed: {error}')
+        self.remove(channel.key)
+        if channel.on_error:
+            try:
+                channel.on_error(channel.key, error)
+            except Exception as e:
+                logger.error(f'Error handler failed for {channel.key}: {e}')
+
+
+# Shared reactor for all serial devices in the process
+reactor = SerialReactor()
@@ -5,9 +5,6 @@ Handles all hardware communication with stability and safety
 
 import serial
 import serial.tools.list_ports
-import threading
-import queue
-import time
 import logging
 from datetime import datetime
 from typing import Dict, Optional, List, Callable
@@ -15,6 +12,12 @@ from dataclasses import dataclass, field
 from enum import Enum
 import json
 
+from hardware.serial_io import reactor
+from hardware.device_store import DeviceStore
+from hardware.stability import ConsecutiveStabilizer, Stabilizer, make_stabilizer
+from hardware.decoders import Decoder, get_decoder
+from hardware.supervisor import supervisor
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,6 +38,12 @@ class DeviceConfig:
     baudrate: int = 9600
     timeout: float = 1.0
     enabled: bool = True
+    stability: str = 'consecutive'        # consecutive | median | ema
+    stability_options: dict = field(default_factory=dict)
+    model: Optional[str] = None           # line decoder, see hardware/decoders.py
+    vid: Optional[int] = None             # USB identity for rebinding after a replug,
+    pid: Optional[int] = None             # learned from the port list when not set
+    serial_number: Optional[str] = None
     
 @dataclass
 class DeviceReading:
@@ -59,79 +68,43 @@ class AnalyzerReading:
     is_valid: bool = False
     raw_data: str = ""
 
-class SerialStabilityFilter:
-    """
-    Implements stability filtering for serial readings
-    Requires 3 consecutive identical readings before accepting
-    """
-    
-    def __init__(self, required_consecutive: int = 3, tolerance: float = 0.01):
-        self.required_consecutive = required_consecutive
-        self.tolerance = tolerance
-        self.reading_history: List[float] = []
-        self.last_stable_value: Optional[float] = None
-        
-    def add_reading(self, value: float) -> tuple[bool, Optional[float]]:
-        """
-        Add reading and check if stable
-        Returns: (is_stable, stable_value)
-        """
-        self.reading_history.append(value)
-        
-        # Keep only recent history
-        if len(self.reading_history) > self.required_consecutive * 2:
-            self.reading_history.pop(0)
-        
-        # Check if we have enough readings
-        if len(self.reading_history) < self.required_consecutive:
-            return False, None
-        
-        # Check last N readings for stability
-        recent = self.reading_history[-self.required_consecutive:]
-        
-        # Check if all readings are within tolerance
-        is_stable = all(abs(recent[i] - recent[i+1]) < self.tolerance 
-                       for i in range(len(recent)-1))
-        
-        if is_stable:
-            stable_value = sum(recent) / len(recent)  # Average
-            self.last_stable_value = stable_value
-            self.reading_history.clear()  # Reset for next reading
-            return True, stable_value
-        
-        return False, None
-    
-    def reset(self):
-        """Reset filter state"""
-        self.reading_history.clear()
-        self.last_stable_value = None
+# Backwards-compatible name: 3 consecutive readings within 0.01
+SerialStabilityFilter = ConsecutiveStabilizer
 
 class SerialDeviceManager:
     """
     Manages serial communication with hardware devices
     Thread-safe, non-blocking operation
+    All devices share one event-driven reader (hardware.serial_io.reactor)
+    Unplugged devices are reopened by hardware.supervisor
     """
     
-    def __init__(self):
+    def __init__(self, io_reactor=None, device_supervisor=None):
         self.devices: Dict[str, DeviceConfig] = {}
         self.serial_connections: Dict[str, serial.Serial] = {}
-        self.reading_queues: Dict[str, queue.Queue] = {}
-        self.threads: Dict[str, threading.Thread] = {}
+        self.store = DeviceStore()
+        self.reactor = io_reactor or reactor
+        self.supervisor = device_supervisor or supervisor
         self.running = False
-        self.stability_filters: Dict[str, SerialStabilityFilter] = {}
+        self.stability_filters: Dict[str, Stabilizer] = {}
+        self.decoders: Dict[str, Decoder] = {}
         self.callbacks: Dict[str, List[Callable]] = {}
         self.device_health: Dict[str, dict] = {}
         
     def register_device(self, config: DeviceConfig):
         """Register a new device"""
+        if config.device_type == DeviceType.WEIGHING_SCALE:
+            self.decoders[config.device_id] = get_decoder(config.model, 'scale')
+        elif config.device_type == DeviceType.MILK_ANALYZER:
+            self.decoders[config.device_id] = get_decoder(config.model, 'analyzer')
         self.devices[config.device_id] = config
-        self.reading_queues[config.device_id] = queue.Queue(maxsize=100)
-        self.stability_filters[config.device_id] = SerialStabilityFilter()
+        self.stability_filters[config.device_id] = make_stabilizer(config.stability, **config.stability_options)
         self.callbacks[config.device_id] = []
         self.device_health[config.device_id] = {
             'status': 'registered',
             'last_seen': None,
             'packets_received': 0,
+            'rejected': 0,
             'errors': 0
         }
         logger.info(f"Registered device: {config.device_id} ({config.device_type.value})")
@@ -153,6 +126,13 @@ class SerialDeviceManager:
             logger.warning(f"Device {device_id} is disabled")
             return
         
+        connected = self._open_port(device_id)
+        self.supervisor.watch(self, device_id, config.port, connected,
+                              config.vid, config.pid, config.serial_number)
+    
+    def _open_port(self, device_id: str) -> bool:
+        """Open the configured port and hand it to the shared reader"""
+        config = self.devices[device_id]
         try:
             # Open serial connection
             ser = serial.Serial(
@@ -162,119 +142,110 @@ class SerialDeviceManager:
             )
             self.serial_connections[device_id] = ser
             
-            # Start reading thread
+            # Hand the port to the shared reader, no thread per device
             self.running = True
-            thread = threading.Thread(
-                target=self._read_device_loop,
-                args=(device_id,),
-                daemon=True
+            self.reactor.add(
+                device_id, ser,
+                on_line=lambda line, device_id=device_id: self._handle_line(device_id, line),
+                on_error=self._on_port_error
             )
-            self.threads[device_id] = thread
-            thread.start()
             
             logger.info(f"Started device: {device_id} on {config.port}")
             self.device_health[device_id]['status'] = 'running'
+            self.device_health[device_id].pop('error', None)
+            return True
             
         except serial.SerialException as e:
             logger.error(f"Failed to start device {device_id}: {e}")
             self.device_health[device_id]['status'] = 'error'
             self.device_health[device_id]['error'] = str(e)
+            return False
+    
+    def reopen_device(self, device_id: str, port: str) -> bool:
+        """Supervisor: device is back (possibly on another port), resume reading"""
+        if device_id not in self.devices:
+            return False
+        self.release_device(device_id)
+        self.devices[device_id].port = port
+        # Half-settled weights from before the unplug are stale
+        self.stability_filters[device_id].reset()
+        return self._open_port(device_id)
+    
+    def release_device(self, device_id: str):
+        """Stop reading a port and close it (idempotent)"""
+        self.reactor.remove(device_id)
+        ser = self.serial_connections.pop(device_id, None)
+        if ser and ser.is_open:
+            try:
+                ser.close()
+            except Exception:
+                pass
     
-    def _read_device_loop(self, device_id: str):
+    def _handle_line(self, device_id: str, line: bytes):
         """
-        Background thread for reading from device
+        Handle one framed line from the reader thread
         Implements stability filtering and error handling
         """
         config = self.devices[device_id]
-        ser = self.serial_connections.get(device_id)
-        filter = self.stability_filters[device_id]
+        health = self.device_health[device_id]
         
-        while self.running and ser and ser.is_open:
-            try:
-                if ser.in_waiting > 0:
-                    # Read raw data
-                    raw_data = ser.readline().decode('utf-8', errors='ignore').strip()
-                    
-                    if raw_data:
-                        # Update health
-                        self.device_health[device_id]['last_seen'] = datetime.now()
-                        self.device_health[device_id]['packets_received'] += 1
-                        
-                        # Parse based on device type
-                        if config.device_type == DeviceType.WEIGHING_SCALE:
-                            self._process_scale_reading(device_id, raw_data, filter)
-                        elif config.device_type == DeviceType.MILK_ANALYZER:
-                            self._process_analyzer_reading(device_id, raw_data)
-                        
-            except Exception as e:
-                logger.error(f"Error reading {device_id}: {e}")
-                self.device_health[device_id]['errors'] += 1
-                time.sleep(0.1)  # Brief pause on error
+        decoder = self.decoders.get(device_id)
+        if decoder is None:
+            return
         
-        logger.info(f"Stopped reading from {device_id}")
-    
-    def _process_scale_reading(self, device_id: str, raw_data: str, filter: SerialStabilityFilter):
-        """Process weighing scale reading with stability filter"""
         try:
-            # Parse weight value (adjust parsing based on your scale format)
-            # Example formats: "12.34 kg", "12.34", "ST,12.34,kg"
-            weight_str = raw_data.replace('kg', '').replace('ST', '').strip()
-            weight = float(weight_str)
+            frame = decoder.decode(line)
+            if frame is None:
+                health['rejected'] += 1
+                logger.debug(f"Rejected line from {device_id}: {line!r}")
+                return
             
-            # Apply stability filter
-            is_stable, stable_value = filter.add_reading(weight)
+            # Update health
+            health['last_seen'] = datetime.now()
+            health['packets_received'] += 1
             
-            if is_stable and stable_value is not None:
-                reading = DeviceReading(
-                    device_id=device_id,
-                    timestamp=datetime.now(),
-                    value=stable_value,
-                    unit='kg',
-                    is_stable=True,
-                    raw_data=raw_data,
-                    quality_score=1.0
-                )
-                
-                # Put in queue
-                self.reading_queues[device_id].put(reading)
-                
-                # Call callbacks
-                for callback in self.callbacks[device_id]:
-                    try:
-                        callback(reading)
-                    except Exception as e:
-                        logger.error(f"Callback error: {e}")
-                
-                logger.debug(f"Stable weight: {stable_value} kg")
-                
-        except (ValueError, IndexError) as e:
-            logger.warning(f"Failed to parse scale reading '{raw_data}': {e}")
+            if config.device_type == DeviceType.WEIGHING_SCALE:
+                self._process_scale_reading(device_id, frame, line, self.stability_filters[device_id])
+            else:
+                self._process_analyzer_reading(device_id, frame, line)
+                    
+        except Exception as e:
+            logger.error(f"Error reading {device_id}: {e}")
+            health['errors'] += 1
     
-    def _process_analyzer_reading(self, device_id: str, raw_data: str):
-        """Process milk analyzer reading"""
-        try:
-            # Parse analyzer data (adjust based on your analyzer format)
-            # Example: "FAT:4.5,SNF:8.5,TEMP:35.0"
-            parts = raw_data.split(',')
-            data = {}
-            for part in parts:
-                if ':' in part:
-                    key, value = part.split(':')
-                    data[key.strip().lower()] = float(value.strip())
-            
-            reading = AnalyzerReading(
+    def _on_port_error(self, device_id: str, error: Exception):
+        """Port failed on the reader thread (unplugged, driver error)"""
+        logger.error(f"Device {device_id} disconnected: {error}")
+        health = self.device_health.get(device_id)
+        if health is not None:
+            health['status'] = 'disconnected'
+            health['error'] = str(error)
+            health['errors'] += 1
+        self.release_device(device_id)
+        self.supervisor.lost(self, device_id, error)
+    
+    def _process_scale_reading(self, device_id: str, frame: dict, line: bytes, filter: Stabilizer):
+        """Process a decoded scale frame with stability filter"""
+        if frame['motion']:
+            # The scale itself reports motion: the next settle is a new can
+            filter.reset()
+            return
+        
+        is_stable, stable_value = filter.add_reading(frame['weight'])
+        
+        if is_stable and stable_value is not None:
+            reading = DeviceReading(
                 device_id=device_id,
                 timestamp=datetime.now(),
-                fat=data.get('fat', 0.0),
-                snf=data.get('snf', 0.0),
-                temperature=data.get('temp', 0.0),
-                density=data.get('density', 0.0),
-                is_valid=True,
-                raw_data=raw_data
+                value=stable_value,
+                unit='kg',
+                is_stable=True,
+                raw_data=line.decode('ascii', errors='replace'),
+                quality_score=1.0
             )
             
-            # Put in queue
-            self.reading_queues[device_id].put(reading)
+            # Publish as the device's latest value
+            self.store.publish(device_id, reading)
             
             # Call callbacks
             for callback in self.callbacks[device_id]:
@@ -283,32 +254,55 @@ class SerialDeviceManager:
                 except Exception as e:
                     logger.error(f"Callback error: {e}")
             
-            logger.debug(f"Analyzer: FAT={reading.fat}, SNF={reading.snf}")
-            
-        except Exception as e:
-            logger.warning(f"Failed to parse analyzer reading '{raw_data}': {e}")
+            logger.debug(f"Stable weight: {stable_value} kg")
     
-    def get_latest_reading(self, device_id: str, timeout: float = 0.1) -> Optional:
-        """Get latest reading from device (non-blocking)"""
-        if device_id not in self.reading_queues:
-            return None
+    def _process_analyzer_reading(self, device_id: str, frame: dict, line: bytes):
+        """Process a decoded analyzer frame"""
+        reading = AnalyzerReading(
+            device_id=device_id,
+            timestamp=datetime.now(),
+            fat=frame['fat'],
+            snf=frame['snf'],
+            temperature=frame.get('temp', 0.0),
+            density=frame.get('density', 0.0),
+            is_valid=True,
+            raw_data=line.decode('ascii', errors='replace')
+        )
         
-        try:
-            reading = self.reading_queues[device_id].get_nowait()
-            return reading
-        except queue.Empty:
+        # Publish as the device's latest value
+        self.store.publish(device_id, reading)
+        
+        # Call callbacks
+        for callback in self.callbacks[device_id]:
+            try:
+                callback(reading)
+            except Exception as e:
+                logger.error(f"Callback error: {e}")
+        
+        logger.debug(f"Analyzer: FAT={reading.fat}, SNF={reading.snf}")
+    
+    def get_latest_reading(self, device_id: str) -> Optional:
+        """Get latest reading from device (non-blocking, does not consume it)"""
+        return self.store.latest(device_id)[1]
+    
+    def get_reading_state(self, device_id: str) -> tuple:
+        """(seq, reading) of the latest reading, (0, None) before the first one"""
+        return self.store.latest(device_id)
+    
+    def wait_for_reading(self, device_id: str, after_seq: int = 0, timeout: float = 5.0) -> Optional[tuple]:
+        """Wait for a reading newer than after_seq, returns (seq, reading) or None on timeout"""
+        if device_id not in self.devices:
             return None
+        return self.store.wait_newer(device_id, after_seq, timeout)
+    
+    def get_reading_history(self, device_id: str, since_seq: int = 0) -> list:
+        """Recent (seq, reading) pairs, oldest first"""
+        return self.store.history(device_id, since_seq)
     
     def stop_device(self, device_id: str):
         """Stop reading from device"""
-        if device_id in self.threads:
-            self.running = False
-            self.threads[device_id].join(timeout=2.0)
-        
-        if device_id in self.serial_connections:
-            ser = self.serial_connections[device_id]
-            if ser and ser.is_open:
-                ser.close()
+        self.supervisor.unwatch(self, device_id)
+        self.release_device(device_id)
         
         if device_id in self.device_health:
             self.device_health[device_id]['status'] = 'stopped'
@@ -323,8 +317,11 @@ class SerialDeviceManager:
         logger.info("All devices stopped")
     
     def get_device_health(self, device_id: str) -> dict:
-        """Get device health status"""
-        return self.device_health.get(device_id, {})
+        """Get device health status, with reconnect counts and downtime"""
+        health = self.device_health.get(device_id)
+        if health is None:
+            return {}
+        return {**health, **self.supervisor.health(self, device_id)}
     
     def list_available_ports(self) -> List[dict]:
         """List available serial ports"""
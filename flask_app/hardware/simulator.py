@@ -0,0 +1,221 @@
+"""
+MilkRecord Serial Simulator - Virtual Devices on Pseudo-Terminals
+Exercise SerialDeviceManager / HardwareAdapter without a physical scale
+
+Each VirtualSerialDevice owns a pty pair: the app opens `device.port` like
+a real COM port while a writer thread replays a stream into the other end
+at a configurable rate, with timing jitter and injected garbage lines.
+
+Streams are iterables of lines (bytes) or (line, mark) pairs; marks are
+handed to on_write(line, mark, t), t taken just before the write, so a
+harness can time what happens next.
+- scale_session():   empty pan, pour, settle, lift for each can
+- analyzer_samples(): one FAT/SNF result per line
+- load_recording():  a capture from a real device (one line per reading)
+
+POSIX only. Run standalone for manual testing:
+    python -m hardware.simulator --rate 10
+    SCALE_PORT=<printed path> ANALYZER_PORT=<printed path> RUNTIME=desktop python pos_server.py
+"""
+
+import os
+import tty
+import time
+import random
+import threading
+from itertools import cycle
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+Line = Union[bytes, Tuple[bytes, object]]
+
+
+def garbage_line(rng: random.Random) -> bytes:
+    """Noise as seen after power-up or on a baud mismatch (no line terminators)"""
+    return bytes(rng.randrange(0x80, 0x100) for _ in range(rng.randint(3, 24)))
+
+
+class VirtualSerialDevice:
+    """
+    One simulated device on a pty
+    rate: lines per second (None = as fast as the reader drains them)
+    jitter: +/- fraction of the line interval, garbage: probability of a
+    noise line before each real one, loop: replay the stream forever
+    """
+
+    def __init__(self, lines: Iterable[Line], rate: Optional[float] = 10.0, jitter: float = 0.0,
+                 garbage: float = 0.0, line_ending: bytes = b'\r\n', loop: bool = False,
+                 on_write: Optional[Callable[[bytes, object, float], None]] = None,
+                 seed: Optional[int] = None, name: str = 'device'):
+        self.lines = lines
+        self.rate = rate
+        self.jitter = jitter
+        self.garbage = garbage
+        self.line_ending = line_ending
+        self.loop = loop
+        self.on_write = on_write
+        self.name = name
+        self.rng = random.Random(seed)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)   # no echo before the app configures the port
+        self.port = os.ttyname(self.slave)
+
+        self.sent = 0
+        self.garbage_sent = 0
+        self.bytes_sent = 0
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'VirtualSerialDevice':
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f'sim-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a finite stream to be written out, True when done"""
+        if self._thread:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def stop(self):
+        """Stop writing and close the pty (the reader sees the port go away)"""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(2.0)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _run(self):
+        interval = 1.0 / self.rate if self.rate else 0.0
+        lines = cycle(self.lines) if self.loop else self.lines
+        next_at = time.perf_counter()
+
+        try:
+            for item in lines:
+                if self._stop.is_set():
+                    break
+                line, mark = item if isinstance(item, tuple) else (item, None)
+
+                if self.garbage and self.rng.random() < self.garbage:
+                    self._write(garbage_line(self.rng) + self.line_ending)
+                    self.garbage_sent += 1
+
+                if interval:
+                    next_at += interval * (1 + self.rng.uniform(-self.jitter, self.jitter))
+                    delay = next_at - time.perf_counter()
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+
+                # Timestamp before the write: the reader may handle the line before we return
+                written_at = time.perf_counter()
+                self._write(line + self.line_ending)
+                self.sent += 1
+                if self.on_write:
+                    self.on_write(line, mark, written_at)
+        except OSError:
+            pass   # pty closed under us
+        self.finished_at = time.perf_counter()
+
+    def _write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = os.write(self.master, view)
+            view = view[written:]
+        self.bytes_sent += len(data)
+
+
+# -------------------------------------------------
+# Streams
+# -------------------------------------------------
+
+def scale_session(weights: Sequence[float], fmt: bytes = b'ST,GS,%+08.2fkg', noise: float = 0.0,
+                  empty: int = 5, pour: int = 4, settle: int = 20,
+                  motion_fmt: Optional[bytes] = None, seed: Optional[int] = None) -> Iterator[Line]:
+    """
+    Readings for weighing each can in turn
+    noise: std deviation in kg (readings are rounded to the display's 0.01)
+    The first settled reading of a can is marked ('settle', weight)
+    motion_fmt: format used while pouring (e.g. b'US,GS,%+08.2fkg'), default fmt
+    """
+    rng = random.Random(seed)
+
+    def reading(value, line_fmt=fmt):
+        if noise:
+            value += rng.gauss(0.0, noise)
+        return line_fmt % round(value, 2)
+
+    for weight in weights:
+        for _ in range(empty):
+            yield reading(0.0)
+        for step in range(1, pour + 1):
+            yield reading(weight * step / (pour + 1), motion_fmt or fmt)
+        yield reading(weight), ('settle', weight)
+        for _ in range(settle - 1):
+            yield reading(weight)
+    for _ in range(empty):
+        yield reading(0.0)
+
+
+def analyzer_samples(count: int, fmt: bytes = b'FAT:%.2f,SNF:%.2f,TEMP:%.1f,DEN:%d',
+                     seed: Optional[int] = None) -> Iterator[Line]:
+    """
+    One analyzer result per line, marked with its index
+    The index rides in the DEN field so each reading can be matched to its line
+    """
+    rng = random.Random(seed)
+    for index in range(count):
+        fat = round(rng.uniform(3.0, 7.5), 2)
+        snf = round(rng.uniform(7.8, 9.5), 2)
+        yield fmt % (fat, snf, round(rng.uniform(28.0, 36.0), 1), index), index
+
+
+def load_recording(path: str) -> List[bytes]:
+    """Lines of a raw device capture (e.g. `cat /dev/ttyUSB0 > scale.txt`)"""
+    with open(path, 'rb') as f:
+        return [line for line in f.read().splitlines() if line]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Virtual scale and analyzer on pseudo-terminals')
+    parser.add_argument('--rate', type=float, default=10.0, help='scale lines per second')
+    parser.add_argument('--noise', type=float, default=0.003, help='scale noise (kg std deviation)')
+    parser.add_argument('--garbage', type=float, default=0.0, help='probability of a noise line')
+    parser.add_argument('--scale-recording', help='replay this capture instead of synthetic cans')
+    parser.add_argument('--analyzer-recording', help='replay this capture instead of synthetic samples')
+    args = parser.parse_args()
+
+    rng = random.Random()
+    weights = [round(rng.uniform(3, 25), 2) for _ in range(50)]
+    scale_lines = (load_recording(args.scale_recording) if args.scale_recording
+                   else list(scale_session(weights, noise=args.noise)))
+    analyzer_lines = (load_recording(args.analyzer_recording) if args.analyzer_recording
+                      else list(analyzer_samples(50)))
+
+    scale = VirtualSerialDevice(scale_lines, rate=args.rate, jitter=0.1, garbage=args.garbage,
+                                loop=True, name='scale').start()
+    analyzer = VirtualSerialDevice(analyzer_lines, rate=0.2, garbage=args.garbage,
+                                   loop=True, name='analyzer').start()
+    print(f"⚖️  Scale:    {scale.port}")
+    print(f"🧪 Analyzer: {analyzer.port}")
+    print("Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scale.stop()
+        analyzer.stop()
+
+
+if __name__ == '__main__':
+    main()
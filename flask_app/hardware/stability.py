@@ -0,0 +1,248 @@
+"""
+MilkRecord Stability Filters - Ring Buffer Stabilizers
+Decides when a streaming scale weight has settled
+
+Every stabilizer shares one interface:
+    is_stable, value = stabilizer.add_reading(weight)
+
+Continuous mode (default) never clears history after a stable reading:
+the settled weight is emitted once, and again as soon as it changes and
+settles at a new value, so cans can be weighed back-to-back.
+"""
+
+from array import array
+from math import fsum
+from bisect import bisect_left, insort
+from typing import Dict, Optional, Tuple, Type
+
+
+class RingBuffer:
+    """
+    Fixed-size float ring with a running sum (O(1) push and mean)
+    The sum is re-added exactly on every wrap so float drift never accumulates
+    """
+
+    __slots__ = ('capacity', 'values', 'head', 'count', 'total')
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError('capacity must be positive')
+        self.capacity = capacity
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, value: float) -> Optional[float]:
+        """Append value, returns the evicted value once full"""
+        evicted = None
+        if self.count == self.capacity:
+            evicted = self.values[self.head]
+            self.total -= evicted
+        else:
+            self.count += 1
+        self.values[self.head] = value
+        self.total += value
+        self.head = (self.head + 1) % self.capacity
+        if self.head == 0:
+            self.total = fsum(self.values)
+        return evicted
+
+    def full(self) -> bool:
+        return self.count == self.capacity
+
+    def mean(self) -> float:
+        return self.total / self.count + 0.0 if self.count else 0.0
+
+    def last(self) -> Optional[float]:
+        if not self.count:
+            return None
+        return self.values[(self.head - 1) % self.capacity]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.total = 0.0
+
+
+class Stabilizer:
+    """
+    Base class: subclasses implement _settle(value) -> settled value or None
+    Handles emission rules (one-shot vs continuous)
+    """
+
+    __slots__ = ('tolerance', 'continuous', 'last_stable_value', '_emitted')
+
+    name = 'base'
+
+    def __init__(self, tolerance: float = 0.01, continuous: bool = True):
+        self.tolerance = tolerance
+        self.continuous = continuous
+        self.last_stable_value: Optional[float] = None
+        self._emitted = False
+
+    def add_reading(self, value: float) -> Tuple[bool, Optional[float]]:
+        """
+        Add reading and check if stable
+        Returns: (is_stable, stable_value)
+        """
+        settled = self._settle(float(value))
+
+        if settled is None:
+            # Moving again: the next settle is a new weight
+            self._emitted = False
+            return False, None
+
+        if self.continuous and self._emitted and abs(settled - self.last_stable_value) < self.tolerance:
+            return False, None
+
+        self.last_stable_value = settled
+        self._emitted = True
+        if not self.continuous:
+            self._clear()
+        return True, settled
+
+    def reset(self):
+        """Reset filter state"""
+        self._clear()
+        self.last_stable_value = None
+        self._emitted = False
+
+    def _settle(self, value: float) -> Optional[float]:
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class ConsecutiveStabilizer(Stabilizer):
+    """N consecutive readings each within tolerance of the previous; emits their mean"""
+
+    __slots__ = ('required_consecutive', 'ring', 'run')
+
+    name = 'consecutive'
+
+    def __init__(self, required_consecutive: int = 3, tolerance: float = 0.01, continuous: bool = True):
+        super().__init__(tolerance, continuous)
+        self.required_consecutive = required_consecutive
+        self.ring = RingBuffer(required_consecutive)
+        self.run = 0
+
+    def _settle(self, value):
+        previous = self.ring.last()
+        if previous is not None and abs(value - previous) < self.tolerance:
+            self.run += 1
+        else:
+            self.run = 1
+        self.ring.push(value)
+
+        if self.run >= self.required_consecutive:
+            return self.ring.mean()
+        return None
+
+    def _clear(self):
+        self.ring.clear()
+        self.run = 0
+
+
+class MedianStabilizer(Stabilizer):
+    """
+    Moving median over a small window, rejects single-sample spikes
+    Settled when the median holds within tolerance for `required_consecutive` samples
+    Per sample: O(log w) search plus a w-element shift, w is fixed and small
+    """
+
+    __slots__ = ('window', 'required_consecutive', 'ring', 'ordered', 'run', 'median')
+
+    name = 'median'
+
+    def __init__(self, window: int = 5, required_consecutive: int = 3, tolerance: float = 0.01,
+                 continuous: bool = True):
+        super().__init__(tolerance, continuous)
+        self.window = window
+        self.required_consecutive = required_consecutive
+        self.ring = RingBuffer(window)
+        self.ordered = []
+        self.run = 0
+        self.median: Optional[float] = None
+
+    def _settle(self, value):
+        evicted = self.ring.push(value)
+        if evicted is not None:
+            del self.ordered[bisect_left(self.ordered, evicted)]
+        insort(self.ordered, value)
+
+        if not self.ring.full():
+            return None
+
+        n = len(self.ordered)
+        median = self.ordered[n // 2] if n % 2 else (self.ordered[n // 2 - 1] + self.ordered[n // 2]) / 2
+        if self.median is not None and abs(median - self.median) < self.tolerance:
+            self.run += 1
+        else:
+            self.run = 1
+        self.median = median
+
+        if self.run >= self.required_consecutive:
+            return median
+        return None
+
+    def _clear(self):
+        self.ring.clear()
+        self.ordered.clear()
+        self.run = 0
+        self.median = None
+
+
+class EMAStabilizer(Stabilizer):
+    """
+    Exponential smoothing, settled when raw readings stay within
+    tolerance of the smoothed value for `required_consecutive` samples
+    A jump larger than `step` (a can placed or lifted) reseeds the average
+    instead of waiting for it to decay towards the new weight
+    """
+
+    __slots__ = ('alpha', 'required_consecutive', 'step', 'ema', 'run')
+
+    name = 'ema'
+
+    def __init__(self, alpha: float = 0.3, required_consecutive: int = 3, tolerance: float = 0.01,
+                 step: Optional[float] = None, continuous: bool = True):
+        super().__init__(tolerance, continuous)
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1]')
+        self.alpha = alpha
+        self.required_consecutive = required_consecutive
+        self.step = step if step is not None else tolerance * 10
+        self.ema: Optional[float] = None
+        self.run = 0
+
+    def _settle(self, value):
+        if self.ema is None or abs(value - self.ema) > self.step:
+            self.ema = value
+            self.run = 1
+        else:
+            self.ema += self.alpha * (value - self.ema)
+            self.run = self.run + 1 if abs(value - self.ema) < self.tolerance else 1
+
+        if self.run >= self.required_consecutive:
+            return self.ema
+        return None
+
+    def _clear(self):
+        self.ema = None
+        self.run = 0
+
+
+STABILIZERS: Dict[str, Type[Stabilizer]] = {
+    cls.name: cls for cls in (ConsecutiveStabilizer, MedianStabilizer, EMAStabilizer)
+}
+
+
+def make_stabilizer(algorithm: str = 'consecutive', **options) -> Stabilizer:
+    """Build a stabilizer by name ('consecutive', 'median', 'ema')"""
+    try:
+        cls = STABILIZERS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown stability algorithm '{algorithm}', expected one of {sorted(STABILIZERS)}")
+    return cls(**options)
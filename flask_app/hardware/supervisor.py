@@ -0,0 +1,259 @@
+"""
+MilkRecord Device Supervisor - Reconnect and Hot-Plug
+Brings serial devices back after an unplug without restarting the POS
+
+- Port failures reported by the reader (EOF, driver error) and ports that
+  vanish from the port list mark a device disconnected
+- Devices are rebound by USB identity (VID/PID/serial number) learned while
+  connected, so a scale that comes back as COM5 or /dev/ttyUSB1 is found
+- A port that (re)appears is tried at once; a port that is present but
+  fails to open is retried with exponential backoff
+- Filters and callbacks live on the owner (SerialDeviceManager /
+  HardwareAdapter), which only swaps the port: nothing is re-registered
+
+Owners implement:
+    reopen_device(device_id, port) -> bool   open the port and resume reading
+    release_device(device_id)                stop reading and close the port
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import serial.tools.list_ports
+    _comports = serial.tools.list_ports.comports
+except ImportError:
+    _comports = lambda: []
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceWatch:
+    """Connection state of one supervised device"""
+
+    __slots__ = ('owner', 'device_id', 'port', 'vid', 'pid', 'serial_number', 'status', 'last_error',
+                 'disconnected_at', 'downtime', 'reconnects', 'attempts', 'backoff', 'next_attempt')
+
+    def __init__(self, owner, device_id: str, port: str, vid: Optional[int], pid: Optional[int],
+                 serial_number: Optional[str]):
+        self.owner = owner
+        self.device_id = device_id
+        self.port = port
+        self.vid = vid
+        self.pid = pid
+        self.serial_number = serial_number
+        self.status = 'running'
+        self.last_error: Optional[str] = None
+        self.disconnected_at: Optional[float] = None
+        self.downtime = 0.0
+        self.reconnects = 0
+        self.attempts = 0
+        self.backoff = 0.0
+        self.next_attempt = 0.0
+
+
+class DeviceSupervisor:
+    """
+    Watches the port list and reopens disconnected devices
+    One background thread, started by the first watch()
+    """
+
+    def __init__(self, poll_interval: float = 0.5, backoff_initial: float = 0.5, backoff_max: float = 30.0,
+                 list_ports: Callable[[], List] = None):
+        self.poll_interval = poll_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.list_ports = list_ports or _comports
+
+        self._watches: Dict[Tuple[int, str], DeviceWatch] = {}
+        self._present = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    # -------------------------------------------------
+    # Owner API
+    # -------------------------------------------------
+
+    def watch(self, owner, device_id: str, port: str, connected: bool = True, vid: Optional[int] = None,
+              pid: Optional[int] = None, serial_number: Optional[str] = None):
+        """Supervise a device; identity not given is learned from the port list"""
+        watch = DeviceWatch(owner, device_id, port, vid, pid, serial_number)
+        if vid is None:
+            self._learn_identity(watch, self._snapshot())
+        with self._lock:
+            self._watches[(id(owner), device_id)] = watch
+        if not connected:
+            self.lost(owner, device_id, 'not connected at start')
+        self.start()
+
+    def unwatch(self, owner, device_id: str):
+        """Stop supervising (device stopped on purpose)"""
+        with self._lock:
+            self._watches.pop((id(owner), device_id), None)
+
+    def lost(self, owner, device_id: str, error):
+        """Port failed: mark disconnected and start reconnecting"""
+        with self._lock:
+            watch = self._watches.get((id(owner), device_id))
+            if watch is None:
+                return
+            if watch.status != 'disconnected':
+                watch.status = 'disconnected'
+                watch.disconnected_at = time.monotonic()
+                watch.backoff = 0.0
+                watch.next_attempt = 0.0
+            watch.last_error = str(error)
+        logger.warning(f"Device {device_id} disconnected ({error}), reconnecting")
+        self._wake.set()
+
+    def health(self, owner, device_id: str) -> dict:
+        """Reconnect counters for get_device_health()"""
+        with self._lock:
+            watch = self._watches.get((id(owner), device_id))
+            if watch is None:
+                return {}
+            downtime = watch.downtime
+            since = None
+            if watch.disconnected_at is not None:
+                downtime += time.monotonic() - watch.disconnected_at
+                since = datetime.fromtimestamp(time.time() - (time.monotonic() - watch.disconnected_at)).isoformat()
+            return {
+                'connection': watch.status,
+                'port': watch.port,
+                'reconnects': watch.reconnects,
+                'reconnect_attempts': watch.attempts,
+                'downtime_seconds': round(downtime, 3),
+                'disconnected_since': since,
+                'last_error': watch.last_error,
+                'usb_id': f"{watch.vid:04X}:{watch.pid:04X}" if watch.vid is not None else None,
+                'serial_number': watch.serial_number
+            }
+
+    # -------------------------------------------------
+    # Lifecycle
+    # -------------------------------------------------
+
+    def start(self):
+        """Start the watcher thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, name='serial-supervisor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.poll_interval + 1)
+        self._thread = None
+
+    # -------------------------------------------------
+    # Watcher
+    # -------------------------------------------------
+
+    def _loop(self):
+        while self._running:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Supervisor error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def check(self):
+        """One pass: detect vanished ports, reopen what can be reopened"""
+        ports = self._snapshot()
+        appeared = set(ports) - self._present
+        self._present = set(ports)
+        now = time.monotonic()
+
+        with self._lock:
+            watches = list(self._watches.values())
+        bound = {w.port for w in watches if w.status == 'running'}
+
+        for watch in watches:
+            if watch.status == 'running':
+                if not self._is_present(watch.port, ports):
+                    watch.owner.release_device(watch.device_id)
+                    self.lost(watch.owner, watch.device_id, 'port removed')
+                continue
+
+            port = self._find_port(watch, ports, bound)
+            if port is None:
+                continue
+            # Hot-plugged ports are tried at once, failing ones wait out the backoff
+            if port not in appeared and now < watch.next_attempt:
+                continue
+            if self._reopen(watch, port, ports):
+                bound.add(port)
+
+    def _reopen(self, watch: DeviceWatch, port: str, ports: Dict) -> bool:
+        watch.attempts += 1
+        try:
+            ok = watch.owner.reopen_device(watch.device_id, port)
+        except Exception as e:
+            ok = False
+            watch.last_error = str(e)
+
+        now = time.monotonic()
+        with self._lock:
+            if not ok:
+                watch.backoff = min(max(watch.backoff * 2, self.backoff_initial), self.backoff_max)
+                watch.next_attempt = now + watch.backoff
+                return False
+            watch.downtime += now - (watch.disconnected_at or now)
+            watch.disconnected_at = None
+            watch.status = 'running'
+            watch.port = port
+            watch.reconnects += 1
+            watch.backoff = 0.0
+        if watch.vid is None:
+            self._learn_identity(watch, ports)
+        logger.info(f"Device {watch.device_id} reconnected on {port} (reconnect #{watch.reconnects})")
+        return True
+
+    def _snapshot(self) -> Dict[str, object]:
+        """Current ports by device path"""
+        try:
+            return {info.device: info for info in self.list_ports()}
+        except Exception as e:
+            logger.warning(f"Port scan failed: {e}")
+            return {}
+
+    @staticmethod
+    def _is_present(port: str, ports: Dict) -> bool:
+        # Paths the port list does not enumerate (/dev/serial/by-id links, ptys) exist as files
+        return port in ports or (os.name != 'nt' and os.path.exists(port))
+
+    def _find_port(self, watch: DeviceWatch, ports: Dict, bound) -> Optional[str]:
+        """Where the device is now: same USB identity, else its configured path"""
+        if watch.vid is not None:
+            matches = [path for path, info in ports.items()
+                       if info.vid == watch.vid and info.pid == watch.pid
+                       and (watch.serial_number is None or info.serial_number == watch.serial_number)
+                       and path not in bound]
+            if watch.port in matches:
+                return watch.port
+            if matches:
+                return sorted(matches)[0]
+        if watch.port not in bound and self._is_present(watch.port, ports):
+            return watch.port
+        return None
+
+    @staticmethod
+    def _learn_identity(watch: DeviceWatch, ports: Dict):
+        info = ports.get(watch.port)
+        if info is not None and getattr(info, 'vid', None) is not None:
+            watch.vid, watch.pid, watch.serial_number = info.vid, info.pid, info.serial_number
+
+
+# Shared supervisor for the process
+supervisor = DeviceSupervisor()
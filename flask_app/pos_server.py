@@ -9,13 +9,16 @@ import sys
 import json
 import uuid
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import core services
 from core import services, sync_engine
+from core.pagination import page_args, page_response, ndjson_response
+from core.collection_pipeline import pipeline
+from hardware.broadcast import hub
 from adapters import db_local
 
 # Initialize Flask app
@@ -53,12 +56,13 @@ def collection():
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all products"""
+    """Get products (keyset paged: ?after=<created_at>,<id>&limit=)"""
     try:
-        products = services.get_products()
+        after, limit = page_args(request.args)
+        products = services.get_products_page(after, limit)
         
         # If no products in database, return sample data
-        if not products:
+        if not products and not after:
             products = [
                 {'id': str(uuid.uuid4()), 'name': 'Cow Milk', 'price': 64.0, 'category': 'milk', 'emoji': '🥛', 'unit': 'L'},
                 {'id': str(uuid.uuid4()), 'name': 'Buffalo Milk', 'price': 72.0, 'category': 'milk', 'emoji': '🥛', 'unit': 'L'},
@@ -72,7 +76,9 @@ def get_products():
                 {'id': str(uuid.uuid4()), 'name': 'Biscuits', 'price': 30.0, 'category': 'bakery', 'emoji': '🥐', 'unit': 'pkt'},
             ]
         
-        return jsonify({'products': products, 'success': True})
+        return page_response('products', products, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -92,10 +98,13 @@ def add_product():
 
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
-    """Get all customers"""
+    """Get customers (keyset paged: ?after=<created_at>,<id>&limit=)"""
     try:
-        customers = services.get_customers()
-        return jsonify({'customers': customers, 'success': True})
+        after, limit = page_args(request.args)
+        customers = services.get_customers_page(after, limit)
+        return page_response('customers', customers, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -136,11 +145,13 @@ def save_sale():
 
 @app.route('/api/sales', methods=['GET'])
 def get_sales():
-    """Get recent sales"""
+    """Get sales, newest first (keyset paged: ?after=<created_at>,<id>&limit=)"""
     try:
-        limit = request.args.get('limit', 100)
-        sales = services.get_sales(limit=int(limit))
-        return jsonify({'sales': sales, 'success': True})
+        after, limit = page_args(request.args)
+        sales = services.get_sales_page(after, limit)
+        return page_response('sales', sales, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -150,10 +161,13 @@ def get_sales():
 
 @app.route('/api/farmers', methods=['GET'])
 def get_farmers():
-    """Get all farmers"""
+    """Get farmers (keyset paged: ?after=<created_at>,<id>&limit=)"""
     try:
-        farmers = services.get_farmers()
-        return jsonify({'farmers': farmers, 'success': True})
+        after, limit = page_args(request.args)
+        farmers = services.get_farmers_page(after, limit)
+        return page_response('farmers', farmers, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -173,55 +187,177 @@ def add_farmer():
 
 @app.route('/api/collections', methods=['POST'])
 def add_collection():
-    """Add milk collection"""
+    """Add milk collection (rate/amount computed from FAT/SNF if not given)"""
     try:
-        data = request.json
-        # For now, return success
-        # Implement full collection logic as needed
-        return jsonify({'success': True, 'message': 'Collection saved'})
+        data = request.json or {}
+        result = services.save_collection(data)
+        return jsonify(result), 200 if result['success'] else 400
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+# Counter collections are priced like manual ones (rate chart, formula fallback)
+pipeline.rate_fn = services.price_reading
+
+# Saved counter collections show up on every collection screen
+pipeline.add_listener(lambda collection: hub.publish('collection', collection))
+
+@app.route('/api/collections/counter', methods=['GET'])
+def get_collection_counter():
+    """Farmer at the counter and the last automatic collection"""
+    return jsonify({'success': True, **pipeline.status()})
+
+@app.route('/api/collections/counter', methods=['POST'])
+def start_collection_counter():
+    """
+    Farmer steps up: the next stable weight and analyzer reading
+    are paired into a milk_collections row automatically
+    """
+    try:
+        data = request.json or {}
+        if not data.get('farmer_id'):
+            return jsonify({'error': 'farmer_id required', 'success': False}), 400
+        
+        session = pipeline.start_farmer(data['farmer_id'], data.get('animal_type'), data.get('shift'))
+        return jsonify({'success': True, 'session': session})
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+@app.route('/api/collections/counter', methods=['DELETE'])
+def cancel_collection_counter():
+    """Clear the counter without saving"""
+    pipeline.cancel()
+    return jsonify({'success': True})
+
+@app.route('/api/collections/reprice', methods=['POST'])
+def reprice_collections():
+    """Re-rate collections in a date range against the current rate chart"""
+    data = request.json or {}
+    if not data.get('from') or not data.get('to'):
+        return jsonify({'error': 'from and to dates required', 'success': False}), 400
+    
+    result = services.reprice_collections(data['from'], data['to'])
+    return jsonify(result), 200 if result['success'] else 400
+
+# ============================================
+# Rate Chart API
+# ============================================
+
+@app.route('/api/rate-chart', methods=['GET'])
+def get_rate_chart():
+    """Current FAT x SNF rate chart rows"""
+    rates = db_local.rate_chart_get()
+    return jsonify({'success': True, 'rates': rates, 'count': len(rates)})
+
+@app.route('/api/rate-chart', methods=['PUT'])
+def set_rate_chart():
+    """
+    Replace the rate chart: {rates: [{milk_type, fat, snf, rate}], version}
+    Optional reprice_from / reprice_to re-rate existing collections right away
+    """
+    data = request.json or {}
+    rates = data.get('rates') or []
+    if not isinstance(rates, list) or not all(isinstance(row, dict) for row in rates):
+        return jsonify({'error': 'rates must be a list of {milk_type, fat, snf, rate}', 'success': False}), 400
+    
+    result = services.set_rate_chart(rates, data.get('version'))
+    if not result['success']:
+        return jsonify(result), 400
+    
+    if data.get('reprice_from') and data.get('reprice_to'):
+        result['reprice'] = services.reprice_collections(data['reprice_from'], data['reprice_to'])
+    return jsonify(result)
+
 # ============================================
 # Hardware API
 # ============================================
 
+HARDWARE_MAX_WAIT = 30.0
+
+
+def _reading_args():
+    """?after=<seq>&wait=<seconds> for long-polling the latest reading"""
+    after = int(request.args.get('after', 0))
+    wait = min(max(float(request.args.get('wait', 0)), 0.0), HARDWARE_MAX_WAIT)
+    return after, wait
+
+
 @app.route('/api/hardware/weight', methods=['GET'])
 def get_hardware_weight():
-    """Get weight from hardware scale"""
+    """Get weight from hardware scale (?after=<seq>&wait=<s> waits for a newer reading)"""
+    try:
+        after, wait = _reading_args()
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     try:
         # Hardware integration - returns None if not configured
         from adapters import hardware
-        weight = hardware.get_latest_weight()
+        seq, weight = hardware.get_weight_state(after, wait)
         
-        if weight:
-            return jsonify({'success': True, 'weight': weight, 'unit': 'kg'})
+        if weight is not None:
+            return jsonify({'success': True, 'weight': weight, 'unit': 'kg', 'seq': seq})
         else:
-            return jsonify({'success': False, 'message': 'Hardware not configured or no reading'})
+            return jsonify({'success': False, 'seq': seq, 'message': 'Hardware not configured or no reading'})
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
 @app.route('/api/hardware/analyzer', methods=['GET'])
 def get_hardware_analyzer():
-    """Get reading from milk analyzer"""
+    """Get reading from milk analyzer (?after=<seq>&wait=<s> waits for a newer reading)"""
+    try:
+        after, wait = _reading_args()
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     try:
         from adapters import hardware
-        reading = hardware.get_latest_analyzer()
+        seq, reading = hardware.get_analyzer_state(after, wait)
         
         if reading:
-            return jsonify({'success': True, 'reading': reading})
+            return jsonify({'success': True, 'reading': reading, 'seq': seq})
         else:
-            return jsonify({'success': False, 'message': 'Hardware not configured or no reading'})
+            return jsonify({'success': False, 'seq': seq, 'message': 'Hardware not configured or no reading'})
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+@app.route('/api/hardware/stream', methods=['GET'])
+def stream_hardware():
+    """
+    Server-Sent Events: stable weights (event: weight), analyzer
+    readings (event: analyzer) and automatically saved collections
+    (event: collection) as they arrive. Slow clients only get the newest
+    value per event type.
+    """
+    subscription = hub.subscribe()
+    
+    def generate():
+        yield 'retry: 2000\n\n'
+        for batch in hub.stream(subscription):
+            if not batch:
+                yield ': keepalive\n\n'
+                continue
+            for topic, payload in batch.items():
+                yield f"event: {topic}\nid: {payload.get('seq', '')}\ndata: {json.dumps(payload, default=str)}\n\n"
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
 @app.route('/api/hardware/ports', methods=['GET'])
 def list_hardware_ports():
-    """List available serial ports"""
+    """List available serial ports and the device models that can be configured"""
     try:
         from adapters import hardware
-        ports = hardware.list_ports()
-        return jsonify({'ports': ports, 'success': True})
+        from hardware.decoders import models
+        ports = hardware.hardware.list_ports()
+        return jsonify({'ports': ports, 'models': {'scale': models('scale'), 'analyzer': models('analyzer')},
+                        'success': True})
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/hardware/status', methods=['GET'])
+def hardware_status():
+    """Per-device connection state, reconnect counts and downtime"""
+    try:
+        from adapters import hardware
+        return jsonify({'devices': hardware.get_hardware_status(), 'success': True})
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -231,15 +367,25 @@ def configure_hardware():
     try:
         data = request.json
         from adapters import hardware
+        from hardware.decoders import get_decoder
+        
+        # Unknown device models are a configuration error, not a server error
+        try:
+            get_decoder(data.get('scale_model'), 'scale')
+            get_decoder(data.get('analyzer_model'), 'analyzer')
+        except ValueError as e:
+            return jsonify({'error': str(e), 'success': False}), 400
         
         # Register devices
         if 'scale' in data:
-            hardware.register_device('scale_01', 'scale', data['scale'])
+            hardware.hardware.register_device('scale_01', 'scale', data['scale'], model=data.get('scale_model'))
         if 'analyzer' in data:
-            hardware.register_device('analyzer_01', 'analyzer', data['analyzer'])
+            hardware.hardware.register_device('analyzer_01', 'analyzer', data['analyzer'],
+                                              model=data.get('analyzer_model'))
         
         # Start reading
         hardware.start_hardware()
+        pipeline.attach(hardware.hardware)
         
         return jsonify({'success': True, 'message': 'Hardware configured'})
     except Exception as e:
@@ -264,6 +410,7 @@ def sync_status():
                 'farmers': pending_farmers,
                 'sales': pending_sales
             },
+            'outbox': db_local.outbox_count(),
             'runtime': 'desktop' if services.IS_DESKTOP else 'cloud'
         })
     except Exception as e:
@@ -278,6 +425,18 @@ def force_sync():
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+# ============================================
+# Export API (streamed NDJSON)
+# ============================================
+
+@app.route('/api/<any(sales, customers, farmers, products):table_name>/export', methods=['GET'])
+def export_table(table_name):
+    """Stream every record as newline-delimited JSON"""
+    try:
+        return ndjson_response(services.export_source(table_name), filename=f'{table_name}.ndjson')
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
 # ============================================
 # Utility API
 # ============================================
@@ -33,6 +33,9 @@ except Exception as e:
     supabase = None
     print(f"⚠️ Supabase error: {e}")
 
+from adapters import db_supabase
+from core.pagination import page_args, page_response, ndjson_response
+
 # Initialize Flask app
 app = Flask(__name__,
             template_folder='../apps',
@@ -183,13 +186,16 @@ def save_shop_settings():
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all products"""
+    """Get products (keyset paged: ?after=<created_at>,<id>&limit=)"""
     if not supabase:
         return jsonify({'products': [], 'success': True})
     
     try:
-        result = supabase.table('products').select('*').order('name').execute()
-        return jsonify({'products': result.data or [], 'success': True})
+        after, limit = page_args(request.args)
+        rows = db_supabase.select_page('products', after, limit, client=supabase)
+        return page_response('products', rows, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -218,13 +224,16 @@ def save_product():
 
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
-    """Get all customers"""
+    """Get customers (keyset paged: ?after=<created_at>,<id>&limit=)"""
     if not supabase:
         return jsonify({'customers': [], 'success': True})
     
     try:
-        result = supabase.table('customers').select('*').order('name').execute()
-        return jsonify({'customers': result.data or [], 'success': True})
+        after, limit = page_args(request.args)
+        rows = db_supabase.select_page('customers', after, limit, client=supabase)
+        return page_response('customers', rows, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -277,13 +286,16 @@ def save_customer():
 
 @app.route('/api/sales', methods=['GET'])
 def get_sales():
-    """Get recent sales"""
+    """Get sales, newest first (keyset paged: ?after=<created_at>,<id>&limit=)"""
     if not supabase:
         return jsonify({'sales': [], 'success': True})
     
     try:
-        result = supabase.table('sales').select('*').order('sale_date', desc=True).limit(100).execute()
-        return jsonify({'sales': result.data or [], 'success': True})
+        after, limit = page_args(request.args)
+        rows = db_supabase.select_page('sales', after, limit, client=supabase)
+        return page_response('sales', rows, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
@@ -460,6 +472,21 @@ def register_device():
     else:
         return jsonify(result), 500
 
+# ============================================
+# EXPORT API (streamed NDJSON)
+# ============================================
+
+@app.route('/api/<any(sales, customers, products):table_name>/export', methods=['GET'])
+def export_table(table_name):
+    """Stream every record as newline-delimited JSON"""
+    if not supabase:
+        return jsonify({'error': 'Supabase not configured', 'success': False}), 503
+    
+    return ndjson_response(
+        lambda after, limit: db_supabase.select_page(table_name, after, limit, client=supabase),
+        filename=f'{table_name}.ndjson'
+    )
+
 # ============================================
 # HEALTH CHECK
 # ============================================